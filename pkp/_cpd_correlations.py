@@ -24,6 +24,11 @@ yy = np.array([.9997, .9993, .9987, .9974, .9953, .9918, .9861, .9772,
 xx = xx[::-1]
 yy = yy[::-1]
 
+# vapor pressure of the tar (atm), VAP_A * exp(-VAP_B * mw ** VAP_G / T)
+VAP_A = 87058.0
+VAP_B = 299.0
+VAP_G = 0.5903
+
 n_ref_coals = 12
 n_gas_species = 4
 x_gas = np.array([[0., .04, .11, .14, .21, .27, .34, .675, .9, 1.],
@@ -6,18 +6,18 @@ import numpy as np
 import math
 
 from .interpolate import interp
-from ._cpd_correlations import xx, yy
+from ._cpd_correlations import xx, yy, VAP_A, VAP_B, VAP_G
 
 Rgas = 1.987  # cal/mol-K
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def x_n_calc_i(x, z_n, k_n_1):
     """Calc xn_i from binomial distribution with numba."""
     return z_n / (1 + k_n_1 * x)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def x_n_calc(x, z_n, k_n_1):
     """Calc xn from binomial distribution with numba."""
     x_n = np.empty_like(z_n)
@@ -27,7 +27,7 @@ def x_n_calc(x, z_n, k_n_1):
     return x_n
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def sum_x_n_calc(x, z_n, k_n_1):
     """Calc sum of x_n."""
     _sum = 0
@@ -38,19 +38,19 @@ def sum_x_n_calc(x, z_n, k_n_1):
     return _sum
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def fp(x, sigma):
     """Fp for flash distillation."""
     return x * (1 - x)**(sigma - 1)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def pstar_f(x, sigma, fpp):
     """P star from percolation theory."""
     return fp(x, sigma) - fpp
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def combinln(n, k):
     """
     Return the combined ln function.
@@ -65,7 +65,7 @@ def combinln(n, k):
                                  math.lgamma(n - k + 1))
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def binomial(k, n, p):
     """
     Binomial function logarithmic.
@@ -88,7 +88,7 @@ def binomial(k, n, p):
 
 # FUNCTIONS
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def invernorm(y):
     """
     Calculate the inverse normal distribution function.
@@ -111,3 +111,314 @@ def invernorm(y):
         return interp(y, yy, xx)
     else:
         return - interp(1.0 - y, yy, xx)
+
+
+# PERCOLATION
+
+@numba.jit(nopython=True, cache=True)
+def pstar_solve(p, sigma, x0, tol=1e-12, max_iter=50):
+    """
+    Solve the percolation threshold equation for pstar.
+
+    pstar is the root of `fp(x) = fp(p)` between 0 and `1 / sigma`,
+    where `fp` is monotonically increasing. The root is calculated with
+    the Halley method starting from `x0`, usually the value of the
+    previous time step. If the Halley step exits the bracket of the
+    root, it is replaced by a bisection.
+
+    Parameters
+    ----------
+    p: float
+        Fraction of intact bridges, larger than `1 / sigma`
+    sigma: float
+        Coordination number minus one
+    x0: float
+        Initial guess. If it is outside (0, 1 / sigma), the middle of
+        the interval is used
+    tol: float
+        Tolerance on pstar
+    max_iter: int
+        Maximum number of iterations
+
+    Return
+    ------
+    float: pstar
+
+    """
+    x_max = 1.0 / sigma
+    fpp = fp(p, sigma)
+    x_low, x_high = 0.0, x_max
+    x = x0 if 0 < x0 < x_max else 0.5 * x_max
+    for _ in range(max_iter):
+        f = fp(x, sigma) - fpp
+        if f < 0:
+            x_low = x
+        else:
+            x_high = x
+        # first and second derivatives of fp
+        d1 = (1 - x) ** (sigma - 2) * (1 - sigma * x)
+        d2 = (sigma - 1) * (1 - x) ** (sigma - 3) * (sigma * x - 2)
+        den = 2 * d1 * d1 - f * d2
+        x_new = x - 2 * f * d1 / den if den != 0 else x_low - 1
+        if not x_low < x_new < x_high:
+            x_new = 0.5 * (x_low + x_high)
+        if abs(x_new - x) <= tol:
+            return x_new
+        x = x_new
+    return x
+
+
+@numba.jit(nopython=True, cache=True)
+def pstar_solve_array(p, sigma):
+    """
+    Solve pstar for an array of p, warm-starting each solution.
+
+    Parameters
+    ----------
+    p: array
+        Fractions of intact bridges, larger than `1 / sigma`
+    sigma: float
+        Coordination number minus one
+
+    Return
+    ------
+    array: pstar
+
+    """
+    pstar = np.empty_like(p)
+    x = 0.5 / sigma
+    for i in range(len(p)):
+        x = pstar_solve(p[i], sigma, x)
+        pstar[i] = x
+    return pstar
+
+
+# CPD TIME STEP
+
+@numba.jit(nopython=True, cache=True)
+def rachford_rice(z_n, k_n_1, x0=-1.0, x_max=0.9999, tol=1e-12,
+                  max_iter=100):
+    """
+    Solve the Rachford-Rice equation with the Newton method.
+
+    The function :func:`sum_x_n_calc` is monotonically decreasing,
+    therefore the root is bracketed between 0 and `x_max`. The Newton
+    iterations start from `x0`, usually the vapor fraction of the
+    previous time step, and a bisection of the bracket replaces the
+    Newton steps falling outside it.
+
+    Parameters
+    ----------
+    z_n: array
+        Mole fractions of the feed
+    k_n_1: array
+        Equilibrium constants minus one
+    x0: float
+        Initial guess. If it is outside (0, x_max), the middle of the
+        interval is used
+    x_max: float
+        Maximum vapor fraction
+    tol: float
+        Tolerance on the vapor fraction
+    max_iter: int
+        Maximum number of iterations
+
+    Return
+    ------
+    float: vapor fraction V/F
+
+    """
+    x_low, x_high = 0.0, x_max
+    x = x0 if x_low < x0 < x_high else 0.5 * x_max
+    for _ in range(max_iter):
+        f = 0.0
+        df = 0.0
+        for i in range(len(z_n)):
+            d = 1 + k_n_1[i] * x
+            f_i = z_n[i] * k_n_1[i] / d
+            f += f_i
+            df -= f_i * k_n_1[i] / d
+        if f > 0:
+            x_low = x
+        else:
+            x_high = x
+        x_new = x - f / df if df != 0 else x_high
+        if not x_low < x_new < x_high:
+            x_new = 0.5 * (x_low + x_high)
+        if abs(x_new - x) <= tol:
+            return x_new
+        x = x_new
+    return x
+
+
+@numba.jit(nopython=True, cache=True)
+def cpd_step(l, delta, c, T, dt, f, f_frag_n, meta_n, work, fragments, c0,
+             sigma, sig, rba, ma, mb, gasmw, Acr, Ecr, pressure):
+    """
+    Calculate a full time step of the CPD post processing.
+
+    The percolation statistic is calculated for the bridges state at
+    the end of the time step, then the fractions are updated by
+    :func:`cpd_update`. The arrays `f`, `f_frag_n` and `meta_n` are
+    updated in place.
+
+    Parameters
+    ----------
+    l, delta, c: float
+        Labile bridges, side chains and char bridges
+    T: float
+        Temperature of the particle
+    dt: float
+        Time step
+    f: array
+        Fractions (solid, gas, tar, metaplast, cross) of the previous
+        step, updated to the actual step
+    f_frag_n: array
+        Fraction of finite fragments of the previous step
+    meta_n: array
+        Fraction of metaplast of the previous step
+    work: array
+        Working array with shape (5, n_frag + 1), see :func:`cpd_update`
+    fragments: array
+        Invariants of the fragments (n, tau, s, ln_comb, coefficient)
+        with shape (5, n_frag), see :meth:`pkp.cpd.CPD._set_fragments`
+    c0, sigma, sig, rba, ma, mb, gasmw: float
+        CPD parameters
+    Acr, Ecr: float
+        Cross-linking kinetic parameters
+    pressure: float
+        Pressure
+
+    """
+    n_frag = len(f_frag_n)
+
+    # percolation
+    p = l + c
+    g = 2 * (1 - p) - delta + 2 * (c - c0)
+    delta_fac = delta / (1 - p) if p < 0.9999 else 1.0
+    mtot = ma + mb * sig * 0.5 * (1 - c0)
+    f_gas = mb * g * sig * 0.25 / mtot
+    logp = math.log(p)
+    one_logp = math.log(1 - p)
+    mw_n = work[0, :n_frag]
+    f_frag_new = work[2, :n_frag]
+    for i in range(n_frag):
+        n = fragments[0, i]
+        tau = fragments[1, i]
+        s = fragments[2, i]
+        mw_n[i] = n * ma + s * mb * l / p + tau * mb * delta_fac * 0.25
+        Qn = fragments[4, i] * math.exp(
+            fragments[3, i] + s * logp + tau * one_logp)
+        f_frag_new[i] = mw_n[i] * Qn / mtot
+
+    cpd_update(T, dt, f_gas, f_frag_new, mw_n, f, f_frag_n, meta_n, work,
+               gasmw, Acr, Ecr, pressure)
+
+
+@numba.jit(nopython=True, cache=True)
+def cpd_update(T, dt, f_gas, f_frag_new, mw_n, f, f_frag_n, meta_n, work,
+               gasmw, Acr, Ecr, pressure):
+    """
+    Update the CPD fractions with cross-linking and flash distillation.
+
+    It is the compiled version of :meth:`pkp.cpd.CPD._update_fractions`.
+    The cross-linking is integrated exactly over the time step. The
+    arrays `f`, `f_frag_n` and `meta_n` are updated in place.
+
+    Parameters
+    ----------
+    T: float
+        Temperature of the particle
+    dt: float
+        Time step
+    f_gas: float
+        Fraction of gas from the percolation statistic, not corrected
+        with the fraction of tar already released
+    f_frag_new: array
+        Fraction of finite fragments at the end of the time step
+    mw_n: array
+        Mass weight of the fragments
+    f: array
+        Fractions (solid, gas, tar, metaplast, cross) of the previous
+        step, updated to the actual step
+    f_frag_n: array
+        Fraction of finite fragments of the previous step
+    meta_n: array
+        Fraction of metaplast of the previous step
+    work: array
+        Working array with shape (5, n_frag + 1). `work[4, 0]` stores
+        the vapor fraction of the flash distillation, used as initial
+        guess in the next step
+    gasmw: float
+        Mass weight of the light gas
+    Acr, Ecr: float
+        Cross-linking kinetic parameters
+    pressure: float
+        Pressure
+
+    """
+    n_frag = len(f_frag_n)
+    gas, tar, meta, cross = f[1], f[2], f[3], f[4]
+
+    # cross linking
+    if meta > 1e-4:
+        fract = math.exp(-Acr * math.exp(-Ecr / Rgas / T) * dt)
+        cross += meta * (1 - fract)
+    else:
+        fract = 1.0
+
+    # gas corrected with the fraction of tar already released
+    f_gas = f_gas * (1 - tar)
+
+    # flash distillation
+    F_n = work[1]
+    k_n_1 = work[3]
+    F_n[n_frag] = max(f_gas - gas, 0) / gasmw
+    zero = abs(F_n[n_frag]) <= 1e-8
+    for i in range(n_frag):
+        F_n[i] = (f_frag_new[i] - f_frag_n[i] + meta_n[i] * fract) / mw_n[i]
+        zero = zero and abs(F_n[i]) <= 1e-8
+    tar_new = 0.0
+    meta_new = 0.0
+    if zero:
+        for i in range(n_frag):
+            meta_n[i] = F_n[i]
+            tar_new += F_n[i]
+            meta_new += F_n[i]
+    else:
+        F = 0.0
+        for i in range(n_frag + 1):
+            if F_n[i] < 0:
+                F_n[i] = 0
+            F += F_n[i]
+        for i in range(n_frag + 1):
+            mw = mw_n[i] if i < n_frag else gasmw
+            p_vap = VAP_A * math.exp(-VAP_B * mw ** VAP_G / T)
+            k_n_1[i] = p_vap * 101325 / pressure - 1
+            # z_n
+            F_n[i] = F_n[i] / F
+        z_n = F_n
+        if (sum_x_n_calc(0, z_n, k_n_1) *
+                sum_x_n_calc(0.9999, z_n, k_n_1) > 0):
+            fract_v = 0.0
+        else:
+            fract_v = rachford_rice(z_n, k_n_1, work[4, 0])
+            work[4, 0] = fract_v
+        V = fract_v * F
+        L = F - V
+        for i in range(n_frag):
+            x_n = z_n[i] / (1 + k_n_1[i] * fract_v)
+            meta_n[i] = x_n * L * mw_n[i]
+            meta_new += meta_n[i]
+            if V > 0:
+                tar_new += (k_n_1[i] + 1) * x_n * V * mw_n[i]
+
+    # store results
+    for i in range(n_frag):
+        f_frag_n[i] = f_frag_new[i]
+    tar += tar_new
+    f[0] = 1 - tar - f_gas
+    f[1] = f_gas
+    f[2] = tar
+    f[3] = meta_new
+    f[4] = cross
@@ -73,3 +73,105 @@ def invernorm(y):
     yp, fac = (y, 1) if y > 0.5 else (1 - y, -1)
     # return fac * np.interp(yp, yy, xx, right=3.4)
     return fac * interp(yp, yy, xx)
+
+
+def pstar_solve(p, sigma, x0, tol=1e-12, max_iter=50):
+    """
+    Solve the percolation threshold equation for pstar.
+
+    pstar is the root of `fp(x) = fp(p)` between 0 and `1 / sigma`,
+    where `fp` is monotonically increasing. The root is calculated with
+    the Halley method starting from `x0`, usually the value of the
+    previous time step. If the Halley step exits the bracket of the
+    root, it is replaced by a bisection.
+
+    Parameters
+    ----------
+    p: float
+        Fraction of intact bridges, larger than `1 / sigma`
+    sigma: float
+        Coordination number minus one
+    x0: float
+        Initial guess. If it is outside (0, 1 / sigma), the middle of
+        the interval is used
+    tol: float
+        Tolerance on pstar
+    max_iter: int
+        Maximum number of iterations
+
+    Return
+    ------
+    float: pstar
+
+    """
+    x_max = 1.0 / sigma
+    fpp = fp(p, sigma)
+    x_low, x_high = 0.0, x_max
+    x = x0 if 0 < x0 < x_max else 0.5 * x_max
+    for _ in range(max_iter):
+        f = fp(x, sigma) - fpp
+        if f < 0:
+            x_low = x
+        else:
+            x_high = x
+        # first and second derivatives of fp
+        d1 = (1 - x) ** (sigma - 2) * (1 - sigma * x)
+        d2 = (sigma - 1) * (1 - x) ** (sigma - 3) * (sigma * x - 2)
+        den = 2 * d1 * d1 - f * d2
+        x_new = x - 2 * f * d1 / den if den != 0 else x_low - 1
+        if not x_low < x_new < x_high:
+            x_new = 0.5 * (x_low + x_high)
+        if abs(x_new - x) <= tol:
+            return x_new
+        x = x_new
+    return x
+
+
+def pstar_solve_array(p, sigma):
+    """
+    Solve pstar for an array of p, warm-starting each solution.
+
+    Parameters
+    ----------
+    p: array
+        Fractions of intact bridges, larger than `1 / sigma`
+    sigma: float
+        Coordination number minus one
+
+    Return
+    ------
+    array: pstar
+
+    """
+    pstar = np.empty_like(p)
+    x = 0.5 / sigma
+    for i in range(len(p)):
+        x = pstar_solve(p[i], sigma, x)
+        pstar[i] = x
+    return pstar
+
+
+def rachford_rice(z_n, k_n_1, x0=-1.0, x_max=0.9999, tol=1e-12,
+                  max_iter=100):
+    """
+    Solve the Rachford-Rice equation with the Newton method.
+
+    See :func:`pkp._nb_functions.rachford_rice`.
+    """
+    x_low, x_high = 0.0, x_max
+    x = x0 if x_low < x0 < x_high else 0.5 * x_max
+    for _ in range(max_iter):
+        f_i = z_n * k_n_1 / (1 + k_n_1 * x)
+        f = f_i.sum()
+        df = -(f_i * k_n_1 / (1 + k_n_1 * x)).sum()
+        if f > 0:
+            x_low = x
+        else:
+            x_high = x
+        x_new = x - f / df if df != 0 else x_high
+        if not x_low < x_new < x_high:
+            x_new = 0.5 * (x_low + x_high)
+        if abs(x_new - x) <= tol:
+            return x_new
+        x = x_new
+    return x
@@ -1,6 +1,7 @@
 """
 *eaMuPlusLambda* algorithm rewritten to introduce user stop of the
-evolution using CTRL-C with. See `deap.algorithms.eaMuCommaLambda` for
+evolution using CTRL-C with and convergence-based stopping rules
+(:class:`StopCriteria`). See `deap.algorithms.eaMuCommaLambda` for
 more details.
 
 Modified by Michele Vascellari
@@ -16,11 +17,313 @@ from deap import tools
 
 from autologging import logged
 import logging
+import collections
+import os
+import pickle
+import random
+import time
+import numpy as np
+
+
+class StopCriteria(object):
+    """
+    Stopping rules for the evolution.
+
+    The evolution is stopped before `ngen` generations if one of the
+    rules is satisfied. The rules not defined (None) are not checked.
+    After the evolution, `reason` reports the rule which stopped the
+    evolution and `generations` the number of generations performed.
+    """
+
+    def __init__(self, ftol=None, stall=None, stall_rtol=0.0,
+                 max_time=None, max_evals=None):
+        """
+        Init the stopping rules.
+
+        Parameters
+        ----------
+        ftol: float, default=None
+            Stop when the best fitness is lower or equal to `ftol`
+        stall: int, default=None
+            Stop when the best fitness does not improve for `stall`
+            generations
+        stall_rtol: float, default=0.0
+            Minimum relative improvement of the best fitness for
+            resetting the `stall` counter
+        max_time: float, default=None
+            Maximum wall-clock time of the evolution in seconds
+        max_evals: int, default=None
+            Maximum number of fitness evaluations
+
+        """
+        self.ftol = ftol
+        self.stall = stall
+        self.stall_rtol = stall_rtol
+        self.max_time = max_time
+        self.max_evals = max_evals
+        self.start()
+
+    def start(self):
+        """Reset the counters at the beginning of the evolution."""
+        self.reason = None
+        self.generations = 0
+        self.nevals = 0
+        self._best = None
+        self._stalled = 0
+        self._time0 = time.time()
+
+    def __call__(self, gen, best, nevals):
+        """
+        Check the stopping rules after a generation.
+
+        Parameters
+        ----------
+        gen: int
+            Generation number
+        best: float
+            Best fitness
+        nevals: int
+            Number of evaluations performed in the generation
+
+        Returns
+        -------
+        bool
+            True if the evolution has to be stopped
+
+        """
+        self.generations = gen
+        self.nevals += nevals
+        if self._best is None or best < self._best * (1 - self.stall_rtol):
+            self._best = best
+            self._stalled = 0
+        else:
+            self._stalled += 1
+
+        if self.ftol is not None and best <= self.ftol:
+            self.reason = 'ftol'
+        elif self.stall is not None and self._stalled >= self.stall:
+            self.reason = 'stall'
+        elif (self.max_time is not None and
+              time.time() - self._time0 >= self.max_time):
+            self.reason = 'max_time'
+        elif self.max_evals is not None and self.nevals >= self.max_evals:
+            self.reason = 'max_evals'
+        return self.reason is not None
+
+    def get_state(self):
+        """Return the counters of the rules for checkpointing."""
+        return {'reason': self.reason,
+                'generations': self.generations,
+                'nevals': self.nevals,
+                'best': self._best,
+                'stalled': self._stalled,
+                'elapsed': time.time() - self._time0}
+
+    def set_state(self, state):
+        """Restore the counters of the rules from a checkpoint."""
+        self.reason = state['reason']
+        self.generations = state['generations']
+        self.nevals = state['nevals']
+        self._best = state['best']
+        self._stalled = state['stalled']
+        self._time0 = time.time() - state['elapsed']
+
+
+@logged
+class Checkpoint(object):
+    """
+    Periodic checkpoint of the evolution.
+
+    The population with the fitness values, the hall of fame, the
+    logbook and the state of the random number generators are pickled
+    to `path` every `freq` generations. The file is first written to a
+    temporary file and then renamed, so that a previous checkpoint is
+    not corrupted if the process is killed while saving.
+    """
+
+    def __init__(self, path, freq=1, fingerprint=None):
+        """
+        Init the checkpoint.
+
+        Parameters
+        ----------
+        path: str
+            Path of the checkpoint file
+        freq: int, default=1
+            Number of generations between two checkpoints
+        fingerprint: str, default=None
+            Fingerprint of the target set stored in the checkpoint
+
+        """
+        self.path = path
+        self.freq = freq
+        self.fingerprint = fingerprint
+
+    def save(self, gen, population, halloffame, logbook, stop=None):
+        """Save the state of the evolution at generation `gen`."""
+        state = {
+            'gen': gen,
+            'population': population,
+            'halloffame': halloffame,
+            'logbook': logbook,
+            'stop': stop.get_state() if stop is not None else None,
+            'random_state': random.getstate(),
+            'np_random_state': np.random.get_state(),
+            'fingerprint': self.fingerprint
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        getattr(os, 'replace', os.rename)(tmp, self.path)
+
+    def load(self):
+        """
+        Load the state of the evolution.
+
+        Returns
+        -------
+        dict
+            State of the evolution. None if the checkpoint does not
+            exist or it was saved for a different target set.
+
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            state = pickle.load(f)
+        if (self.fingerprint is not None and
+                state['fingerprint'] != self.fingerprint):
+            self.__log.warning(
+                'Checkpoint %s saved for different targets, ignore it',
+                self.path)
+            return None
+        return state
+
+
+class FitnessCache(object):
+    """
+    Bounded LRU cache of the fitness of the individuals.
+
+    The keys are built from the fingerprint of the target set and the
+    genes of the individual, rounded to `decimals` digits. When the
+    cache is full the least recently used entry is removed.
+    The number of `hits` and `misses` is counted.
+    """
+
+    def __init__(self, maxsize=10000, decimals=12):
+        """
+        Init the cache.
+
+        Parameters
+        ----------
+        maxsize: int, default=10000
+            Maximum number of stored fitness values
+        decimals: int, default=12
+            Number of decimals used for quantizing the genes
+
+        """
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self._cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Return the number of stored fitness values."""
+        return len(self._cache)
+
+    def key(self, fingerprint, genes):
+        """Return the key of the genes for the given fingerprint."""
+        return (fingerprint,
+                tuple(np.round(np.asarray(genes, dtype=float),
+                               self.decimals).tolist()))
+
+    def get(self, key):
+        """Return the fitness for the key or None if not stored."""
+        try:
+            value = self._cache.pop(key)
+        except KeyError:
+            return None
+        self._cache[key] = value
+        return value
+
+    def set(self, key, value):
+        """Store the fitness for the key."""
+        self._cache.pop(key, None)
+        self._cache[key] = tuple(value)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def evaluate(self, fingerprint, individuals, function):
+        """
+        Evaluate the individuals using the cache.
+
+        Only the individuals not stored in the cache are evaluated, and
+        individuals with the same genes are evaluated only once.
+
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of the target set
+        individuals: list
+            List of individuals
+        function: callable
+            Function evaluating a list of individuals and returning the
+            list of the fitness values
+
+        Returns
+        -------
+        list
+            List of fitness tuples
+
+        """
+        fitnesses = [None] * len(individuals)
+        pending = collections.OrderedDict()
+        for i, individual in enumerate(individuals):
+            key = self.key(fingerprint, individual)
+            value = self.get(key)
+            if value is not None:
+                fitnesses[i] = value
+                self.hits += 1
+            elif key in pending:
+                pending[key].append(i)
+                self.hits += 1
+            else:
+                pending[key] = [i]
+                self.misses += 1
+        if pending:
+            values = function([individuals[index[0]]
+                               for index in pending.values()])
+            for (key, index), value in zip(pending.items(), values):
+                self.set(key, value)
+                for i in index:
+                    fitnesses[i] = tuple(value)
+        return fitnesses
+
+
+def evaluate(toolbox, individuals, cache=None, fingerprint=None):
+    """
+    Evaluate the fitness of the individuals.
+
+    If the toolbox registers `evaluate_population` the individuals are
+    evaluated all together, otherwise `evaluate` is mapped over them.
+    If a :class:`FitnessCache` is given, only the individuals not
+    stored in the cache are evaluated.
+    """
+    def function(individuals):
+        if hasattr(toolbox, 'evaluate_population'):
+            return toolbox.evaluate_population(individuals)
+        return list(toolbox.map(toolbox.evaluate, individuals))
+    if cache is None:
+        return function(individuals)
+    return cache.evaluate(fingerprint, individuals, function)
 
 
 @logged
 def eaMuPlusLambda(population, toolbox, mu, lambda_, cxpb, mutpb, ngen,
-                   stats=None, halloffame=None, verbose=__debug__):
+                   stats=None, halloffame=None, verbose=__debug__,
+                   cache=None, fingerprint=None, stop=None,
+                   checkpoint=None, state=None):
     """This is the :math:`(\mu + \lambda)` evolutionary algorithm.
 
     :param population: A list of individuals.
@@ -36,6 +339,17 @@ def eaMuPlusLambda(population, toolbox, mu, lambda_, cxpb, mutpb, ngen,
     :param halloffame: A :class:`~deap.tools.HallOfFame` object that will
                        contain the best individuals, optional.
     :param verbose: Whether or not to log the statistics.
+    :param cache: A :class:`FitnessCache` used for the evaluation,
+                  optional.
+    :param fingerprint: Fingerprint of the target set used for the keys
+                        of the cache.
+    :param stop: A :class:`StopCriteria` object used for stopping the
+                 evolution before *ngen* generations, optional.
+    :param checkpoint: A :class:`Checkpoint` object used for saving the
+                       state of the evolution, optional.
+    :param state: State of the evolution loaded from a
+                  :class:`Checkpoint`. The evolution is resumed from
+                  the next generation, optional.
     :returns: The final population
     :returns: A class:`~deap.tools.Logbook` with the statistics of the
               evolution.
@@ -65,22 +379,81 @@ def eaMuPlusLambda(population, toolbox, mu, lambda_, cxpb, mutpb, ngen,
     This function expects :meth:`toolbox.mate`, :meth:`toolbox.mutate`,
     :meth:`toolbox.select` and :meth:`toolbox.evaluate` aliases to be
     registered in the toolbox. This algorithm uses the :func:`varOr`
-    variation.
+    variation. If :meth:`toolbox.evaluate_population` is registered, it
+    is used in place of mapping :meth:`toolbox.evaluate`.
+    If a *cache* is given, the logbook reports the cache `hits` and
+    `misses` of each generation and *nevals* counts only the evaluated
+    individuals. If *stop* is given, its rules are checked after each
+    generation and the reason of the stop is stored in *stop.reason*.
+    If *state* is given, the population, the hall of fame, the logbook
+    and the random generators are restored and the evolution continues
+    up to *ngen* generations. If the evolution is interrupted by the
+    user, the *checkpoint* of the last recorded generation is saved.
     """
     logbook = tools.Logbook()
-    logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
+    logbook.header = (['gen', 'nevals'] +
+                      (['hits', 'misses'] if cache is not None else []) +
+                      (stats.fields if stats else []))
+
+    def evaluate_invalid(individuals):
+        """Evaluate the individuals and return the counters."""
+        invalid_ind = [ind for ind in individuals if not ind.fitness.valid]
+        if cache is None:
+            counters = {'nevals': len(invalid_ind)}
+        else:
+            hits, misses = cache.hits, cache.misses
+        fitnesses = evaluate(toolbox, invalid_ind, cache, fingerprint)
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
+        if cache is not None:
+            counters = {'nevals': cache.misses - misses,
+                        'hits': cache.hits - hits,
+                        'misses': cache.misses - misses}
+        return counters
+
+    def check_stop(gen, nevals):
+        """Check the stopping rules."""
+        if stop is None:
+            return False
+        if halloffame is not None and len(halloffame):
+            best = halloffame[0].fitness.values[0]
+        else:
+            best = min(ind.fitness.values[0] for ind in population)
+        return stop(gen, best, nevals)
 
-    # Evaluate the individuals with an invalid fitness
-    invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-    for ind, fit in zip(invalid_ind, fitnesses):
-        ind.fitness.values = fit
+    def save_checkpoint(gen, last=False):
+        """Save the checkpoint every `freq` generations."""
+        if checkpoint is not None and (last or gen % checkpoint.freq == 0):
+            checkpoint.save(gen, population, halloffame, logbook, stop)
 
-    if halloffame is not None:
-        halloffame.update(population)
+    if stop is not None:
+        stop.start()
 
-    record = stats.compile(population) if stats is not None else {}
-    logbook.record(gen=0, nevals=len(invalid_ind), **record)
+    if state is None:
+        start_gen = 1
+        # Evaluate the individuals with an invalid fitness
+        counters = evaluate_invalid(population)
+
+        if halloffame is not None:
+            halloffame.update(population)
+
+        record = stats.compile(population) if stats is not None else {}
+        logbook.record(gen=0, **dict(counters, **record))
+        save_checkpoint(0)
+    else:
+        start_gen = state['gen'] + 1
+        population[:] = state['population']
+        if halloffame is not None:
+            halloffame.clear()
+            halloffame.update(state['halloffame'])
+        logbook = state['logbook']
+        if stop is not None and state['stop'] is not None:
+            stop.set_state(state['stop'])
+        random.setstate(state['random_state'])
+        np.random.set_state(state['np_random_state'])
+        counters = {'nevals': 0}
+        eaMuPlusLambda._log.info('Resume evolution from generation %s',
+                                 state['gen'])
 
     handler = logging.StreamHandler()
     handler.setLevel(logging.INFO)
@@ -94,22 +467,26 @@ def eaMuPlusLambda(population, toolbox, mu, lambda_, cxpb, mutpb, ngen,
     logger.setLevel(logging.INFO)
     logger.addHandler(handler)
 
-    if verbose:
+    if verbose and state is None:
         # print(logbook.stream)
         # eaMuPlusLambda._log.info(logbook.stream)
         logger.info(logbook.stream)
 
+    if state is None:
+        if check_stop(0, counters['nevals']):
+            ngen = 0
+    elif stop is not None and stop.reason is not None:
+        # the evolution was already stopped by the rules
+        ngen = 0
+
     # Begin the generational process
-    for gen in range(1, ngen + 1):
+    for gen in range(start_gen, ngen + 1):
         try:
             # Vary the population
             offspring = varOr(population, toolbox, lambda_, cxpb, mutpb)
 
             # Evaluate the individuals with an invalid fitness
-            invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-            fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-            for ind, fit in zip(invalid_ind, fitnesses):
-                ind.fitness.values = fit
+            counters = evaluate_invalid(offspring)
 
             # Update the hall of fame with the generated individuals
             if halloffame is not None:
@@ -120,15 +497,26 @@ def eaMuPlusLambda(population, toolbox, mu, lambda_, cxpb, mutpb, ngen,
 
             # Update the statistics with the new population
             record = stats.compile(population) if stats is not None else {}
-            logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+            logbook.record(gen=gen, **dict(counters, **record))
             if verbose:
                 # print(logbook.stream)
                 # eaMuPlusLambda._log.info(logbook.stream)
                 logger.info(logbook.stream)
+            stopped = check_stop(gen, counters['nevals'])
+            save_checkpoint(gen, last=stopped or gen == ngen)
+            if stopped:
+                eaMuPlusLambda._log.info(
+                    'Stop evolution at generation %s: %s', gen, stop.reason)
+                break
         except KeyboardInterrupt:
             # print('Interrupt evolution from the user... continue PKP!')
             eaMuPlusLambda._log.warning(
                 'Interrupt evolution from the user... continue PKP!')
+            # save the last recorded generation, before setting the
+            # reason of the stop, so that the evolution can be resumed
+            save_checkpoint(logbook[-1]['gen'], last=True)
+            if stop is not None:
+                stop.reason = 'interrupted'
             break
 
     return population, logbook
@@ -27,14 +27,14 @@ try:
     import numba
     import math
 
-    @numba.jit(nopython=True)
+    @numba.jit(nopython=True, cache=True)
     def combinln(n, k):
         """Return combinln function with numba."""
         return math.lgamma(n + 1) - (math.lgamma(k + 1) +
                                      math.lgamma(n - k + 1))
 
 
-    @numba.jit(nopython=True)
+    @numba.jit(nopython=True, cache=True)
     def bpmfln(k, n, p):
         """Return bpmfln function with numba."""
         bnm = np.empty_like(n, dtype=np.float64)
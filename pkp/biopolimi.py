@@ -70,8 +70,17 @@ def set_reference_coal_mass(name, c, h, o):
                             'Moist': 0})
 
 
+def get_biomass():
+    """Return the Biomass mechanism, which is read when first used."""
+    global biomass
+    if biomass is None:
+        biomass = cantera.Solution(biomass_xml)
+    return biomass
+
+
 def set_reference_biomass(name, comp):
     """Set the reference biomass."""
+    biomass = get_biomass()
     biomass.TPY = 300, 101325, comp
     return polimi.set_reference_coal(
         name,
@@ -81,7 +90,7 @@ def set_reference_biomass(name, comp):
 
 biomass_xml = os.path.join(os.path.dirname(bins.__file__),
                            'Biomass.xml')
-biomass = cantera.Solution(biomass_xml)
+biomass = None
 
 bio1 = set_reference_coal('CELL', c=6, h=10, o=5)
 bio2 = set_reference_coal('HCE', c=5, h=8, o=4)
@@ -17,7 +17,6 @@ import tabulate
 from . import bins
 import json
 from autologging import logged
-from distutils.dir_util import mkpath
 
 from ._exceptions import PKPCompositionError, PKPConvertNumber
 
@@ -681,7 +680,7 @@ class Coal(object):
         if not os.path.isdir(self._path):
             self.__log.debug('Create path %s', self._path)
             # os.mkdir(self._path)
-            mkpath(self._path)
+            os.makedirs(self._path)
         # if you uodate the path update also the files
         self._set_basename(self._basename)
 
@@ -54,7 +54,7 @@ from __future__ import print_function, unicode_literals
 
 import numpy as np
 from autologging import logged
-from scipy.optimize import brentq, newton
+from scipy.special import gammaln
 import pandas as pd
 import os
 
@@ -65,16 +65,20 @@ from ._exceptions import ImportError
 
 # Import Numba
 try:
-    from ._nb_functions import sum_x_n_calc, x_n_calc, fp, pstar_f
-    from ._nb_functions import binomial, invernorm
+    from ._nb_functions import sum_x_n_calc, x_n_calc, rachford_rice
+    from ._nb_functions import pstar_solve, pstar_solve_array
+    from ._nb_functions import invernorm
+    from ._nb_functions import cpd_step, cpd_update
     _use_numba = True
 except ImportError:
-    from ._np_functions import sum_x_n_calc, x_n_calc, fp, pstar_f
-    from ._np_functions import binomial, invernorm
+    from ._np_functions import sum_x_n_calc, x_n_calc, rachford_rice
+    from ._np_functions import pstar_solve, pstar_solve_array
+    from ._np_functions import invernorm
     _use_numba = False
 
 # CPD constants
-from ._cpd_correlations import CPD_CORRELATION, x_gas, y_gas
+from ._cpd_correlations import (CPD_CORRELATION, x_gas, y_gas, VAP_A, VAP_B,
+                                VAP_G)
 
 # define the binomial function
 # binomial = bpmfln
@@ -108,6 +112,7 @@ class CPD(coal.Coal, empirical_model.Model):
     kin_parameters = ['ab', 'eb', 'ebsig', 'ac', 'ec', 'ag', 'eg', 'egsig',
                       'Acr', 'Ecr', 'arad', 'erad', 'fstable', 'an', 'en',
                       'ensig', 'n_frag']
+    num_parameters = ['dt_output', 'dt_substep', 'pstar_table']
 
     # kinetic parameters
     ab = 2.602e15
@@ -128,6 +133,12 @@ class CPD(coal.Coal, empirical_model.Model):
     ensig = 0
     # n_frag = 20  # number of fragments
 
+    # numerical parameters
+    dt_output = None
+    dt_substep = 1e-5
+    _pstar_table = None
+    _pstar_grid = None
+
     def __init__(self, ultimate_analysis=None, proximate_analysis=None,
                  pressure=101325, name='CPD coal', **kwargs):
         """
@@ -160,6 +171,7 @@ class CPD(coal.Coal, empirical_model.Model):
         self.fnit = self.ultimate_analysis['N']
         self.foxy = self.ultimate_analysis['O']
         self.vm_daf = self.proximate_analysis_daf['VM']
+        self.n_frag = 20
         self._set_NMR_parameters_from_correlation()
 
         # set parameters -> this can be changed using
@@ -170,8 +182,12 @@ class CPD(coal.Coal, empirical_model.Model):
 
         # initialize fractions
         self.f = [[1, 0, 0, 0, 0]]
-        self.n_frag = 20
+        self._discard = False
         self.t_old = 0
+        # pstar and vapor fraction of the last step, initial guess for
+        # the next one
+        self._pstar = 0.0
+        self._fract_v = 0.0
 
     @property
     def n_frag(self):
@@ -184,6 +200,11 @@ class CPD(coal.Coal, empirical_model.Model):
         try:
             self.meta_n = np.zeros(self._n_frag)
             self.f_frag_n = np.zeros(self._n_frag)
+            # working array of the numba time step
+            self._work = np.zeros((5, self._n_frag + 1))
+            # working arrays of the flash distillation
+            self._flash_work = np.zeros((5, self._n_frag + 1))
+            self._set_fragments()
         except TypeError as e:
             raise CPDError("Define n_frag as int")
         except ValueError as e:
@@ -191,6 +212,17 @@ class CPD(coal.Coal, empirical_model.Model):
         if self.n_frag <= 0:
             raise ValueError("Define n_frag > 1")
 
+    @property
+    def pstar_table(self):
+        """Define the number of points of the pstar table."""
+        return self._pstar_table
+
+    @pstar_table.setter
+    def pstar_table(self, value):
+        self._pstar_table = value
+        # the table is calculated again with the new number of points
+        self._pstar_grid = None
+
     def set_parameters(self, **kwargs):
         """Set parameters for CPD.
 
@@ -205,6 +237,20 @@ class CPD(coal.Coal, empirical_model.Model):
             If None values are calculated using Genetti correlation
         basename: str
             Basename for CPD output files
+        dt_output: float
+            Time step of the output. If defined, the percolation and
+            flash distillation are calculated on the output times after
+            the solution of the bridges ODE, instead of at each step of
+            the solver.
+        dt_substep: float
+            Maximum time step of the post processing with `dt_output`.
+            The output intervals are divided in equal substeps, which
+            are post processed but not stored. If None, the post
+            processing steps are the output intervals.
+        pstar_table: int
+            Number of points of the table of pstar as function of p.
+            If defined, pstar is interpolated in the table, calculated
+            once for the coal, instead of being solved at each step.
 
         """
         # TODO move to base class!
@@ -213,13 +259,14 @@ class CPD(coal.Coal, empirical_model.Model):
             self._set_NMR_parameters(**nmr_parameters)
 
         for key, value in kwargs.items():
-            if key in self.kin_parameters:
+            if key in self.kin_parameters + self.num_parameters:
                 setattr(self, key, value)
 
     def get_parameters(self):
         """Get the parameters of CPD model."""
         return {p: getattr(self, p)
-                for p in self.nmr_parameters + self.kin_parameters}
+                for p in (self.nmr_parameters + self.kin_parameters +
+                          self.num_parameters)}
 
     @property
     def parameters_dict(self):
@@ -281,6 +328,35 @@ class CPD(coal.Coal, empirical_model.Model):
         self.mb = 2 * mdel_corr
         self.rba = self.mb / self.ma
         self.gasmw = self.rba * self.ma * 0.5
+        self._set_fragments()
+        self._pstar_grid = None
+
+    def _set_fragments(self):
+        """
+        Calculate the invariants of the finite fragments.
+
+        The number of clusters `n`, of broken bridges `tau` and of
+        intact bridges `s` of the fragments of size n, the logarithm of
+        the binomial coefficient of the fragment distribution and the
+        coefficient of Eq. (1-4) depend only on `sig` and `n_frag`,
+        therefore they are calculated when one of them changes. The
+        invariants are stored in the rows of `_fragments`, used by
+        :func:`pkp._nb_functions.cpd_step`.
+        """
+        if getattr(self, '_n_frag', None) is None or not hasattr(
+                self, 'sigma'):
+            return
+        n = np.arange(1, self._n_frag + 1, dtype=float)
+        # broken bridges per cluster of size n
+        tau = n * (self.sigma - 1) + 2
+        s = n - 1  # intact bridges per cluster of size n
+        n_bridges = tau + s
+        ln_comb = (gammaln(n_bridges + 1) - gammaln(s + 1) -
+                   gammaln(tau + 1))
+        self._fragments = np.array([n, tau, s, ln_comb,
+                                    self.sig / n_bridges / n])
+        (self._frag_n, self._frag_tau, self._frag_s, self._frag_ln_comb,
+         self._frag_coeff) = self._fragments
 
     def rate(self, t, y):
         """
@@ -387,14 +463,8 @@ class CPD(coal.Coal, empirical_model.Model):
             if p > 0.999:
                 pstar = 1
             elif p > p_threasold:
-                # def fp(x): return x * (1 - x)**(self.sigma - 1)
-                fpp = fp(p, self.sigma)
-
-                # def pstar_f(x): return fp(x) - fpp
-                # pstar = brentq(pstar_f, 0, p_threasold)
-                pstar = newton(pstar_f, p_threasold * 0.5,
-                               args=(self.sigma, fpp))
-                self.__log.debug('Calc pstar with newton %s', pstar)
+                pstar = self._calc_pstar(p)
+                self.__log.debug('Calc pstar %s', pstar)
             else:
                 pstar = p
             self.__log.debug('p %s, pstar %s', p, pstar)
@@ -426,17 +496,15 @@ class CPD(coal.Coal, empirical_model.Model):
             ('fraction of remaining solid (includes finite'
              ' and inf. fragments) %s'), f_solid)
 
-        n = np.arange(1, self.n_frag + 1)  # number of clusters in a fragment
-        # broken bridges per cluster of size n
-        tau = n * (self.sigma - 1) + 2
-        s = n - 1  # intact bridges per cluster of size n
-        n_bridges = tau + s
+        # number of clusters, broken and intact bridges of the fragments
+        n, tau, s = self._frag_n, self._frag_tau, self._frag_s
         # Eq. 32 mass of a finite fragment of size n
-        mw_frag_n = (n * self.ma + (n - 1) * self.mb * l / p +
+        mw_frag_n = (n * self.ma + s * self.mb * l / p +
                      tau * self.mb * delta_fac * 0.25)
 
         # Eqs (1-4)
-        Qn = self.sig / n_bridges / n * binomial(s, n_bridges, p)
+        Qn = self._frag_coeff * np.exp(
+            self._frag_ln_comb + s * np.log(p) + tau * np.log(1 - p))
         # Eq. (33) total mass of fragments of size
         m_frag_n = mw_frag_n * Qn
         self.__log.debug(
@@ -463,6 +531,79 @@ class CPD(coal.Coal, empirical_model.Model):
                 'mw_frag_n': mw_frag_n,
                 'pstar': pstar}
 
+    def _calc_pstar(self, p):
+        """
+        Calculate pstar for p larger than the percolation threshold.
+
+        If `pstar_table` is defined, pstar is interpolated in the table
+        of the coal, otherwise it is solved by
+        :func:`pkp._nb_functions.pstar_solve` starting from the value of
+        the previous step.
+        """
+        if self.pstar_table:
+            return np.interp(p, *self._get_pstar_table())
+        self._pstar = pstar_solve(p, self.sigma, self._pstar)
+        return self._pstar
+
+    def _get_pstar_table(self):
+        """
+        Return the table (p, pstar) between the threshold 1 / sigma and
+        0.999.
+
+        The table is calculated when it is used the first time after
+        the NMR parameters are set. The points are refined close to the
+        threshold, where pstar changes faster.
+        """
+        if self._pstar_grid is None:
+            p_threasold = 1. / self.sigma
+            u = np.linspace(0, 1, self.pstar_table)
+            p = p_threasold + (0.999 - p_threasold) * u ** 2
+            pstar = pstar_solve_array(p, self.sigma)
+            pstar[0] = p_threasold
+            self._pstar_grid = (p, pstar)
+        return self._pstar_grid
+
+    def _percolation_grid(self, y):
+        """
+        Percolation statistic calculation for a set of solutions.
+
+        Vectorized version of :meth:`_percolation` over the solutions
+        `y` at different times. The fraction of gas is not corrected
+        with the fraction of tar already released, which depends on the
+        previous time steps.
+
+        Parameters
+        ----------
+        y: np.ndarray
+            Array of bridges parameters (l, delta, c, T) for each time
+
+        Returns
+        -------
+        percolation, dict:
+            Percolation dictionary {'f_gas', 'f_frag_n', 'mw_frag_n'}
+            with arrays for each time
+
+        """
+        l, delta, c = y[:, 0], y[:, 1], y[:, 2]
+        p = l + c
+        g1, g2 = self.gas(y.T)
+        g = g1 + g2
+
+        delta_fac = np.where(p < 0.9999, delta / (1 - np.minimum(p, 0.9999)),
+                             1)
+        mtot = self.ma + self.mb * self.sig * 0.5 * (1 - self.c0)
+        f_gas = self.mb * g * self.sig * 0.25 / mtot
+
+        n, tau, s = self._frag_n, self._frag_tau, self._frag_s
+        mw_frag_n = (n * self.ma + s * self.mb * (l / p)[:, np.newaxis] +
+                     tau * self.mb * delta_fac[:, np.newaxis] * 0.25)
+        Qn = self._frag_coeff * np.exp(
+            self._frag_ln_comb + s * np.log(p)[:, np.newaxis] +
+            tau * np.log(1 - p)[:, np.newaxis])
+        return {'f_gas': f_gas,
+                'f_frag_n': mw_frag_n * Qn / mtot,
+                'mw_frag_n': mw_frag_n}
+
     def _tar_distribution(self):
         pass
 
@@ -551,7 +692,10 @@ class CPD(coal.Coal, empirical_model.Model):
         ratecr: float
 
         """
-        return self.Acr * np.exp(-self.Ecr / Rgas / T) * f_meta * dt
+        # exact integral of the first order reaction, which is never
+        # larger than the metaplast also for large time steps
+        return f_meta * (1 - np.exp(-self.Acr * np.exp(-self.Ecr / Rgas / T) *
+                                    dt))
 
     def _flash_distillation(self, df_gas, df_n, meta_n, mw_n, fracr, T):
         """
@@ -568,7 +712,8 @@ class CPD(coal.Coal, empirical_model.Model):
             Incremental fraction of fragments produced in the last time
             step
         meta_n: array
-            Fraction of metaplast from the previous time step
+            Fraction of metaplast from the previous time step, updated
+            in place
         mw_n: array
             Mass weight of the fragments
         fracr: float
@@ -581,39 +726,46 @@ class CPD(coal.Coal, empirical_model.Model):
         ------
         tar_n_new: array
             Fraction of tar produced from flash distillation. This
-            fraction is releases in the gas phase.
+            fraction is releases in the gas phase. The array is
+            overwritten at the next call.
         meta_n_new: array
-            Fraction of metaplast remaining in the particle.
+            Fraction of metaplast remaining in the particle (`meta_n`).
 
         """
         self.__log.debug('\n\nStart flash_distillation\n')
 
-        a = 87058.0
-        b = 299.0
-        g = 0.5903
+        # the working arrays are preallocated in the n_frag setter
+        F_n, mw, k_n_1, x_n, y_n = self._flash_work
         # mole fraction of n-mers contained in the metaplast
         self.__log.debug('Increment of fragments %s', df_n)
         self.__log.debug('Previous metaplast %s', meta_n)
         self.__log.debug('Cross-linking correction %s', fracr)
-        F_n = np.append((df_n + meta_n * fracr) / mw_n, df_gas /
-                        self.gasmw)
-        if np.allclose(F_n, 0):
+        np.multiply(meta_n, fracr, out=F_n[:-1])
+        F_n[:-1] += df_n
+        F_n[:-1] /= mw_n
+        F_n[-1] = df_gas / self.gasmw
+        if F_n.max() <= 1e-8 and F_n.min() >= -1e-8:
             self.__log.debug('F_n = 0 return tar, meta = 0')
-            return F_n[:-1], F_n[:-1]
-        F_n[F_n < 0] = 0
+            meta_n[:] = F_n[:-1]
+            return F_n[:-1], meta_n
+        np.maximum(F_n, 0, out=F_n)
         self.__log.debug('F_n (mole) %s', F_n)
 
         F = F_n.sum()
-        mw = np.append(mw_n, self.gasmw)
+        mw[:-1] = mw_n
+        mw[-1] = self.gasmw
         # self.__log.debug('MW %s', mw)
-        p_vap = a * np.exp(-b * mw ** g / T)
-        self.__log.debug('p_vap %s', p_vap)
-        k_n = p_vap * 101325 / self.pressure
+        # k_n - 1, with the vapor pressure p_vap = a exp(-b mw^g / T)
+        np.power(mw, VAP_G, out=k_n_1)
+        k_n_1 *= -VAP_B / T
+        np.exp(k_n_1, out=k_n_1)
+        k_n_1 *= VAP_A * 101325 / self.pressure
+        k_n_1 -= 1
         # self.__log.debug('kn %s', k_n)
-        z_n = F_n / F
+        z_n = F_n
+        z_n /= F
         # self.__log.debug('zn %s', z_n)
         # Eq. 52
-        k_n_1 = k_n - 1
 
         # def x_n_calc(x): return z_n / (1 + k_n_1 * x)
         # Eq. 54
@@ -625,23 +777,32 @@ class CPD(coal.Coal, empirical_model.Model):
             fract_v = 0
             V = 0
             L = F
-            x_n = F_n / F
-            y_n = np.zeros_like(x_n)
+            x_n[:] = z_n
+            y_n[:] = 0
         else:
-            # fract_v = brentq(funct, 0, 0.999)
-            fract_v = brentq(sum_x_n_calc, 0, 0.9999, args=(z_n, k_n_1))
-            # np.testing.assert_almost_equal(fract_v, fract_v_n)
-            # fract_v = newton(funct, 0.5)
+            fract_v = rachford_rice(z_n, k_n_1, self._fract_v)
+            self._fract_v = fract_v
             self.__log.debug('V/F = %s', fract_v)
             V = fract_v * F  # moles of tar
             L = F - V
             # mole fraction of n-mers in the metaplast
-            x_n = x_n_calc(fract_v, z_n, k_n_1)
+            np.multiply(k_n_1, fract_v, out=x_n)
+            x_n += 1
+            np.divide(z_n, x_n, out=x_n)
             # mole fraction of n-mers released as tar
-            y_n = k_n * x_n if V > 0 else np.zeros_like(x_n)
-
-        meta_n_new = x_n[:-1] * L * mw_n
-        tar_n_new = y_n[:-1] * V * mw_n
+            if V > 0:
+                np.add(k_n_1, 1, out=y_n)
+                y_n *= x_n
+            else:
+                y_n[:] = 0
+
+        # the metaplast is updated in place
+        np.multiply(x_n[:-1], mw_n, out=meta_n)
+        meta_n *= L
+        meta_n_new = meta_n
+        tar_n_new = y_n[:-1]
+        tar_n_new *= mw_n
+        tar_n_new *= V
         # assert np.allclose(
         #    meta_n_new + tar_n_new, F_n[:-1] * mw_n), \
         #    'Sum of xn+yn should be equal to Fn'
@@ -765,9 +926,77 @@ class CPD(coal.Coal, empirical_model.Model):
         return np.dot(y_refs.T, self.triangle_weights)
 
     def postprocess_step(self, t, y):
-        """Post process the results after the time step."""
+        """
+        Post process the results after the time step.
+
+        If numba is available the time step is calculated by the
+        compiled function :func:`pkp._nb_functions.cpd_step`.
+        """
+        if _use_numba:
+            f = np.array(self.f[-1], dtype=float)
+            cpd_step(y[0], y[1], y[2], y[-1], t - self.t_old, f,
+                     self.f_frag_n, self.meta_n, self._work,
+                     self._fragments, self.c0,
+                     self.sigma, self.sig, self.rba, self.ma, self.mb,
+                     self.gasmw, self.Acr, self.Ecr, self.pressure)
+            self._append_fractions(f)
+            self.t_old = t
+            return
+        percolation = self._percolation(y, self.f[-1][2], in_tar=True)
+        self._update_fractions(t, y[-1], percolation['f_gas'],
+                               percolation['f_frag_n'],
+                               percolation['mw_frag_n'])
+
+    def postprocess_steps(self, t, y, store=None):
+        """
+        Post process the results on the output times.
+
+        The percolation statistic is calculated for all the times
+        together by :meth:`_percolation_grid`, while cross-linking and
+        flash distillation are integrated in sequence, by
+        :func:`pkp._nb_functions.cpd_update` if numba is available.
+        The fractions of the times not stored are discarded.
+        """
+        percolation = self._percolation_grid(y)
+        for i, ti in enumerate(t):
+            if _use_numba:
+                f = np.array(self.f[-1], dtype=float)
+                cpd_update(y[i, -1], ti - self.t_old,
+                           percolation['f_gas'][i],
+                           percolation['f_frag_n'][i],
+                           percolation['mw_frag_n'][i], f, self.f_frag_n,
+                           self.meta_n, self._work, self.gasmw, self.Acr,
+                           self.Ecr, self.pressure)
+                self._append_fractions(f)
+                self.t_old = ti
+            else:
+                # correct gas with the fraction of tar already released
+                f_gas = percolation['f_gas'][i] * (1 - self.f[-1][2])
+                self._update_fractions(ti, y[i, -1], f_gas,
+                                       percolation['f_frag_n'][i],
+                                       percolation['mw_frag_n'][i])
+            if store is not None and not store[i]:
+                self.discard_step()
+
+    def _update_fractions(self, t, T, f_gas, f_frag_n, mw_n):
+        """
+        Update the fractions of the products at the time t.
+
+        Parameters
+        ----------
+        t: float
+            Time
+        T: float
+            Temperature of the particle
+        f_gas: float
+            Fraction of gas from the percolation statistic
+        f_frag_n: np.ndarray
+            Fraction of finite fragments
+        mw_n: np.ndarray
+            Mass weight of the fragments
+
+        """
         solid, gas, tar, meta, cross = self.f[-1]
-        T = y[-1]  # temperature
         dt = t - self.t_old
 
         if meta > 1e-4:
@@ -781,14 +1010,12 @@ class CPD(coal.Coal, empirical_model.Model):
             fract = 1
         self.__log.debug(
             'Crosslinking rate: %s / %s', rate_cross, fract)
-        percolation = self._percolation(y, tar, in_tar=True)
 
         # gas formed in the last step
-        df_gas = max(percolation['f_gas'] - gas, 0)
+        df_gas = max(f_gas - gas, 0)
         self.__log.debug('gas=%s, df_gas=%s', gas, df_gas)
-        mw_n = percolation['mw_frag_n']
         # fragments formed in the last step
-        df_n = percolation['f_frag_n'] - self.f_frag_n
+        df_n = f_frag_n - self.f_frag_n
         self.__log.debug('df_n=%s', df_n)
 
         tar_n, self.meta_n = self._flash_distillation(
@@ -796,19 +1023,36 @@ class CPD(coal.Coal, empirical_model.Model):
             mw_n=mw_n, fracr=fract, T=T)
 
         # store results
-        self.f_frag_n = percolation['f_frag_n']
-        gas = percolation['f_gas']
+        self.f_frag_n = f_frag_n
+        gas = f_gas
         tar += tar_n.sum()
         meta = self.meta_n.sum()
         solid = 1 - tar - gas
-        self.f.append([solid, gas, tar, meta, cross])
+        self._append_fractions([solid, gas, tar, meta, cross])
         self.__log.debug('F=%s', self.f[-1])
         self.t_old = t
 
+    def discard_step(self):
+        """
+        Discard the fractions of the last step from the results.
+
+        They are replaced by the fractions of the next step.
+        """
+        self._discard = True
+
+    def _append_fractions(self, f):
+        """Append the fractions of the step, replacing a discarded one."""
+        if self._discard:
+            self.f[-1] = f
+            self._discard = False
+        else:
+            self.f.append(f)
+
     def postprocess(self, t, y):
         """Postprocess results."""
-        # stack y with f
-        data = np.hstack([t[:, np.newaxis], y, self.f])
+        # stack y with f. The fractions of a last step not stored in
+        # the output (see discard_step) are not included
+        data = np.hstack([t[:, np.newaxis], y, self.f[:len(t)]])
         columns = ['t', 'l', 'delta', 'c', 'T',
                    'char', 'light_gas', 'tar', 'metaplast', 'cross']
 
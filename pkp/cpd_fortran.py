@@ -1,12 +1,17 @@
 '''
 Module for running CPD simulations using the Fortran CPD solver.
 
+Each run is executed in its own scratch directory, therefore several
+runs can be executed concurrently with :func:`run_many`.
 '''
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
 import os
+import shutil
 import subprocess
+import tempfile
+from multiprocessing.pool import ThreadPool
 
 import pandas as pd
 from autologging import logged
@@ -19,6 +24,20 @@ from . import bins
 
 np.seterr(all='ignore')
 
+# names of the columns of the CPD results
+_columns = {'time(ms)': 't',
+            'ftar': 'tar',
+            'fgas': 'light_gas',
+            'ftot': 'volatiles',
+            'met': 'metaplast',
+            'temp': 'T',
+            'fh20': 'H2O',
+            'fco2': 'CO2',
+            'fch4': 'CH4',
+            'fco': 'CO',
+            'fsolid': 'char',
+            'fother': 'others'}
+
 
 @logged
 class CPD(cpd.CPD):
@@ -80,10 +99,23 @@ class CPD(cpd.CPD):
         self._solver = os.path.abspath(value)
         self.__log.debug('Set CPD solver %s', self._solver)
 
-    def _write_input_files(self):
+    def _write_input_files(self, directory=None):
         '''
         Write the input files required for the CPD calculation
+
+        Parameters
+        ----------
+        directory: str, default=None
+            Directory of the input files. The files are referred in the
+            input/output file with their names, therefore the solver
+            has to be executed in the same directory. If None, the
+            files are written in :attr:`path` with absolute names.
         '''
+        if directory is None:
+            directory, names = self.path, self.path
+        else:
+            names = ''
+
         def writeline(key):
             f.write('{}           !{}\n'.format(
                 getattr(self, key), key))
@@ -91,7 +123,8 @@ class CPD(cpd.CPD):
         def empty_lines(n=1):
             [f.write('\n') for _ in range(n)]
 
-        with open(self.input_file, 'w') as f:
+        input_file = os.path.basename(self.input_file)
+        with open(os.path.join(directory, input_file), 'w') as f:
             [writeline(key)
              for key in ['p0', 'c0', 'sig', 'mw', 'mdel']]
             empty_lines(1)
@@ -132,99 +165,154 @@ class CPD(cpd.CPD):
                     self.operating_conditions[-1, 0]))
             writeline('nmax')
 
-        with open(self.io_file, 'w') as f:
-            f.write('{}\n'.format(self.input_file))
+        with open(os.path.join(directory, os.path.basename(self.io_file)),
+                  'w') as f:
+            f.write('{}\n'.format(os.path.join(names, input_file)))
             [f.write(
-                os.path.join(self.path, self.basename +
-                             '_{}.out\n'.format(n)))
+                os.path.join(names, self.basename + '_{}.out\n'.format(n)))
              for n in range(1, 5)]
 
-    def run(self, **kwargs):
+    def run(self, save=False, **kwargs):
         '''
         Run CPD code.
 
+        The solver is executed in a temporary scratch directory, so
+        that concurrent runs do not overwrite their files. The input,
+        output and log files are then copied in :attr:`path`.
+
+        Parameters
+        ----------
+        save: bool, default=False
+            Export the results in a csv file
+
         Returns
         -------
         results: pandas.Dataframe
             Dataframe containg the results of CPD as a function of the
             residence time.
         '''
-        self._write_input_files()
-        with open(self.io_file, 'r') as f_in:
-            with open('test.out', 'w') as f_out:
-                with open('test.err', 'w') as f_err:
+        scratch = tempfile.mkdtemp(prefix='cpd_{}_'.format(self.basename))
+        try:
+            self._write_input_files(scratch)
+            log = os.path.join(scratch, self.basename + '.log')
+            with open(os.path.join(scratch, os.path.basename(self.io_file)),
+                      'r') as f_in:
+                with open(log, 'w') as f_out:
                     code_run = subprocess.call(
                         [self.solver, ],
+                        cwd=scratch,
                         stdin=f_in,
                         stdout=f_out,
-                        stderr=f_err)
-        if code_run:
-            raise RuntimeError(
-                'Error running CPD with {}'.format(self.io_file))
-        return self._read_results()
+                        stderr=subprocess.STDOUT)
+            self._collect(scratch)
+            if code_run:
+                raise RuntimeError(
+                    'Error running CPD with {}, see {}'.format(
+                        self.io_file,
+                        os.path.join(self.path, os.path.basename(log))))
+            df = self._read_results()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if save:
+            df.to_csv(self._out_csv)
+        return df
+
+    def _collect(self, scratch):
+        '''
+        Copy the files of the run from the scratch directory to
+        :attr:`path`.
+        '''
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for fname in os.listdir(scratch):
+            shutil.copy(os.path.join(scratch, fname), self.path)
+        self.__log.debug('Collect %s to %s', scratch, self.path)
 
     def _read_results(self):
+        '''
+        Read the results from the four output files of CPD.
+
+        The numeric blocks of the files are copied in a single array,
+        with the time of the first file, and the DataFrame is built
+        once.
+        '''
         try:
-            df = pd.concat([self._read_cpd_results(n)
-                            for n in range(1, 5)], axis=1)
-        except:
+            blocks = [self._read_cpd_results(n) for n in range(1, 5)]
+            n_rows = len(blocks[0][1])
+            if any(len(values) != n_rows for _, values in blocks):
+                raise ValueError('Different number of rows')
+            columns = blocks[0][0][:1]
+            data = np.empty((n_rows, 1 + sum(len(header) - 1
+                                             for header, _ in blocks)))
+            data[:, 0] = blocks[0][1][:, 0]
+            j = 1
+            for header, values in blocks:
+                data[:, j:j + len(header) - 1] = values[:, 1:]
+                columns += header[1:]
+                j += len(header) - 1
+        except Exception:
             raise IOError('Problems reading CPD results')
-        df.reset_index(inplace=True)
-        # df.index.rename('t', inplace=True)
-        # df.index = df.index * 1e-3
-        # self.__log.debug('CPD index max %s', df.index.max())
-        df.rename(columns={'time(ms)': 't',
-                           'ftar': 'tar',
-                           'fgas': 'light_gas',
-                           'ftot': 'volatiles',
-                           'met': 'metaplast',
-                           'temp': 'T',
-                           'fh20': 'H2O',
-                           'fco2': 'CO2',
-                           'fch4': 'CH4',
-                           'fco': 'CO',
-                           'fsolid': 'char',
-                           'fother': 'others'}, inplace=True)
-        df['t'] = df['t'] * 1e-3
-        # self.__log.debug('Columns %s', df.columns)
-        # self.__log.debug('Last row %s', df.iloc[-1])
-
-        # out_csv = os.path.join(self.path, self.basename + '.csv')
-        df.to_csv(self._out_csv)
-        return df
-        # results.plot(y='ftot', kind='line', use_index=True)
-        # reset index
-        # r_res = r.reset_index()
-        # rename column
-        # r_res = r_res.rename(columns={' time(ms)': 'time(ms)'})
-        # r.index.rename('Time(ms)', inplace=True)
+        columns = [_columns.get(c, c) for c in columns]
+        data[:, 0] *= 1e-3
+        # fgas is written in the first and in the last file
+        df = pd.DataFrame(data, columns=columns)
+        return df.loc[:, ~df.columns.duplicated()]
 
     def _read_cpd_results(self, n):
+        '''
+        Read the output file n of CPD.
+
+        Returns
+        -------
+        header: list
+            Names of the columns
+        values: np.ndarray
+            Array of the values, without the last row of the first
+            file, which repeats the last time
+        '''
         fname = os.path.join(self.path, self.basename +
                              '_{}.out'.format(n))
         with open(fname, 'r') as f:
             header = f.readline()[2:].split()
-        # self.__log.debug('file=%s header %s', fname, header)
-        df = pd.read_csv(
-            fname,
-            index_col=0,
-            delimiter=r'\s+',
-            names=header,
-            comment='c')
+            values = np.array(f.read().split(), dtype=float)
+        values = values.reshape(-1, len(header))
         if n == 1:
-            return df.iloc[:-1]
+            return header, values[:-1]
         else:
-            return df
+            return header, values
 
-    def _set_NMR_parameters(self, nmr_parameters=None):
-        '''
-        Calc parameters using Genetti correlation
 
-        Parameters
-        ----------
-        parameters: dict, default=None
-            Manually set parameters using a dictionary
-            {'mdel': 0, 'mw': 0, 'p0': 0, 'sig': 0}
-        '''
-        self._set_NMR_parameters_from_correlation(
-            nmr_parameters=nmr_parameters)
+def run_many(models, n_p=None, save=False):
+    '''
+    Run several CPD models concurrently.
+
+    Each run uses its own scratch directory, therefore the models can
+    share :attr:`CPD.path`, if their basenames are different. The
+    solvers are external processes, therefore they are executed by a
+    pool of threads.
+
+    Parameters
+    ----------
+    models: list
+        List of :class:`CPD` models, for example with different
+        operating conditions
+    n_p: int, default=None
+        Maximum number of concurrent runs. If None, the number of CPUs
+        is used.
+    save: bool, default=False
+        Export the results in csv files
+
+    Returns
+    -------
+    results: list
+        List of the results of each model
+    '''
+    basenames = [os.path.join(m.path, m.basename) for m in models]
+    if len(set(basenames)) < len(basenames):
+        raise ValueError('Define different basename or path for each model')
+    pool = ThreadPool(n_p)
+    try:
+        return pool.map(lambda m: m.run(save=save), models)
+    finally:
+        pool.close()
+        pool.join()
@@ -21,6 +21,7 @@ import abc
 from autologging import logged
 
 from scipy.misc import factorial
+from scipy.special import exp1
 import collections
 import six
 
@@ -69,6 +70,98 @@ def namedtuple_with_defaults(typename,
     return T
 
 
+def temperature_integral(E_R, T):
+    r"""
+    Calculate the temperature integral of the Arrhenius exponential.
+
+    .. math::
+        I(T) = \int_0^T e^{-E_R/T'} dT' = T e^{-x} - E_R E_1(x)
+
+    where :math:`x=E_R/T` and :math:`E_1` is the exponential integral.
+
+    Parameters
+    ----------
+    E_R: float
+        Activation temperature :math:`E/R_g`
+    T: float, array
+        Temperature
+
+    Returns
+    -------
+    I: float, array
+        Temperature integral
+
+    """
+    x = E_R / T
+    return T * np.exp(-x) - E_R * exp1(x)
+
+
+def arrhenius_integral(A, E, t, operating_conditions, T_threshold=None,
+                       derivative=False):
+    r"""
+    Integrate the Arrhenius constant along the operating conditions.
+
+    The temperature history is piecewise linear, therefore the integral
+    :math:`K(t)=\int_{t_0}^t A e^{-E/R_g T} dt` is exact on every
+    segment. Along isothermal segments it is :math:`k(T) \Delta t`,
+    along linear ramps with heating rate :math:`\beta` it is given by
+    the temperature integral :math:`A/\beta (I(T_b)-I(T_a))`.
+    The temperature is kept constant after the last point.
+
+    Parameters
+    ----------
+    A: float
+        Pre-exponential factor
+    E: float
+        Activation energy
+    t: array
+        Times where the integral is returned
+    operating_conditions: array, list
+        Time, temperature points [[t0, T0], ..., [tn, Tn]]
+    T_threshold: float, optional
+        The reaction is active only for temperatures higher than the
+        threshold
+    derivative: bool, default=False
+        Return the derivative :math:`dK/dE` of the integral with respect
+        to the activation energy. Along the ramps the integral of
+        :math:`e^{-E_R/T}/T` is the exponential integral
+        :math:`E_1(E_R/T)`.
+
+    Returns
+    -------
+    K: array
+        Integral of the reaction constant at `t`, or its derivative
+
+    """
+    t = np.asarray(t, dtype=float)
+    operating_conditions = np.asarray(operating_conditions, dtype=float)
+    t_oc, T_oc = operating_conditions[:, 0], operating_conditions[:, 1]
+    E_R = E / Rgas
+    T_min = 0 if T_threshold is None else T_threshold
+
+    def segments(ta, Ta, tb, Tb):
+        dT = Tb - Ta
+        ramp = np.abs(dT) > 1e-6
+        k_iso = np.where(Ta >= T_min, A * np.exp(-E_R / Ta), 0) * (tb - ta)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if derivative:
+                k_iso = -k_iso / Rgas / Ta
+                k_ramp = -A / Rgas * (tb - ta) / dT * (
+                    exp1(E_R / np.maximum(Tb, T_min)) -
+                    exp1(E_R / np.maximum(Ta, T_min)))
+            else:
+                k_ramp = A * (tb - ta) / dT * (
+                    temperature_integral(E_R, np.maximum(Tb, T_min)) -
+                    temperature_integral(E_R, np.maximum(Ta, T_min)))
+        return np.where(ramp, k_ramp, k_iso)
+
+    K_oc = np.concatenate(
+        ([0], np.cumsum(segments(t_oc[:-1], T_oc[:-1], t_oc[1:], T_oc[1:]))))
+    i = np.maximum(np.searchsorted(t_oc, t, side='right') - 1, 0)
+    K = K_oc[i] + segments(t_oc[i], T_oc[i], t, np.interp(t, t_oc, T_oc))
+    return np.where(t >= t_oc[0], K, 0)
+
+
 @logged
 @six.add_metaclass(abc.ABCMeta)
 class Model():
@@ -77,7 +170,19 @@ class Model():
     # __metaclass__ = abc.ABCMeta
     # initial volatile yield
     y0 = [0]
+    # Jacobian of the rates `jacob(t, y)`, with shape (len(y) - 1, len(y)),
+    # as the last element of `y` is the temperature. None if not available.
     jacob = None
+    # sparsity pattern of the Jacobian, used when `jacob` is None
+    jacob_sparsity = None
+    # derivatives of the rates with respect to the model parameters
+    # `jacob_parameters(t, y)`, with shape (len(y) - 1, n_parameters),
+    # used for the forward sensitivities. None if not available.
+    jacob_parameters = None
+    # time step of the output for the post processing. If defined, the
+    # reactor solves the ODE without calling `postprocess_step` at each
+    # step and post processes the solution on the output times.
+    dt_output = None
 
     @abc.abstractmethod
     def rate(self, t, y):
@@ -99,6 +204,39 @@ class Model():
         """Post process data at the end of the time step."""
         return
 
+    def postprocess_steps(self, t, y, store=None):
+        """
+        Post process data on the output times after the ODE solution.
+
+        Parameters
+        ----------
+        t: np.ndarray
+            Output times
+        y: np.ndarray
+            Solution at the output times
+        store: np.ndarray, default=None
+            Boolean array of the times stored in the results. The steps
+            not stored are discarded (see :meth:`discard_step`). If
+            None, all the steps are stored
+
+        """
+        for i, (ti, yi) in enumerate(zip(t, y)):
+            self.postprocess_step(ti, yi)
+            if store is not None and not store[i]:
+                self.discard_step()
+
+    def discard_step(self):
+        """
+        Discard the last time step from the results.
+
+        It is called by the reactor after :meth:`postprocess_step`, if
+        the step is not stored in the output (see
+        :class:`pkp.reactor.Output`). The state of the model is kept,
+        because it is the initial state of the next step. Models which
+        store data at each step have to override it.
+        """
+        pass
+
     @abc.abstractmethod
     def get_yield(self, t, y):
         """Return the actual volatilization yield."""
@@ -124,6 +262,8 @@ class EmpiricalModel(Model):
         default_values=(1, 1))
     _len_parameters = len(_Parameters._fields)
     _mask = np.array([True] * _len_parameters)
+    # the model provides the closed form :meth:`solve_profile`
+    _analytical = False
 
     def __init__(self, *args, **kwargs):
         """Init empirical model."""
@@ -260,6 +400,31 @@ class EmpiricalModel(Model):
 
         return unsc_par
 
+    @classmethod
+    def unscale_parameters_derivative(cls, norm_parameters, parameters_min,
+                                      parameters_max):
+        """
+        Derivatives of the unscaled parameters.
+
+        Return the derivatives :math:`dp/dP` of the parameters unscaled
+        by :meth:`unscale_parameters` with respect to the normalized
+        parameters.
+
+        Return
+        ------
+        dp: array
+            Derivatives of the unscaled parameters
+        """
+        parameters_min = np.array(parameters_min, dtype=float)
+        parameters_max = np.array(parameters_max, dtype=float)
+        mask = np.array(cls._mask)
+        parameters_min[mask] = np.log10(parameters_min[mask])
+        parameters_max[mask] = np.log10(parameters_max[mask])
+        dp = parameters_max - parameters_min
+        dp[mask] *= np.log(10) * cls.unscale_parameters(
+            norm_parameters, 10**parameters_min, 10**parameters_max)[mask]
+        return dp
+
     @classmethod
     def scale_parameters(cls, parameters, parameters_min, parameters_max):
         """
@@ -302,6 +467,135 @@ class EmpiricalModel(Model):
                   (parameters_max - parameters_min))
         return sc_par
 
+    @classmethod
+    def integrate_population(cls, t, operating_conditions, parameters,
+                             dT_max=1.0):
+        """
+        Integrate the model for a population of parameter sets.
+
+        The states of all the parameter sets are stacked in a single
+        array and advanced together on a common time grid, built from
+        the requested times and the points of the operating conditions.
+        Each interval is split in substeps with a temperature increment
+        smaller than `dT_max`. Along every substep the reaction constants
+        are evaluated at the mid-point temperature and the yields are
+        updated with the exact exponential solution, therefore the
+        scheme is stable also for stiff parameter sets.
+
+        Parameters
+        ----------
+        t: array
+            Times where the yields are returned
+        operating_conditions: array, list
+            Time, temperature points [[t0, T0], ..., [tn, Tn]]
+        parameters: array
+            Array (n_pop, n_parameters) of non-scaled parameters
+        dT_max: float, default=1.0
+            Maximum temperature increment along a substep
+
+        Returns
+        -------
+        y: array
+            Volatile yields (len(t), n_pop)
+
+        """
+        t = np.asarray(t, dtype=float)
+        operating_conditions = np.asarray(operating_conditions, dtype=float)
+        parameters = np.atleast_2d(np.asarray(parameters, dtype=float))
+        t_oc, T_oc = operating_conditions[:, 0], operating_conditions[:, 1]
+
+        # common grid: requested times and operating condition points
+        t_grid = np.union1d(t, t_oc[(t_oc > t_oc[0]) & (t_oc < t.max())])
+        t_grid = t_grid[t_grid >= t_oc[0]]
+        t_grid = np.insert(t_grid, 0, t_oc[0])
+        T_grid = np.interp(t_grid, t_oc, T_oc)
+        n_sub = np.maximum(
+            np.ceil(np.abs(np.diff(T_grid)) / dT_max), 1).astype(int)
+
+        y = cls._init_population(len(parameters))
+        y_grid = np.empty((len(t_grid), len(parameters)))
+        y_grid[0] = cls._yield_population(y, parameters)
+        for i, n in enumerate(n_sub):
+            dt = (t_grid[i + 1] - t_grid[i]) / n
+            if dt > 0:
+                T_sub = np.linspace(T_grid[i], T_grid[i + 1], n + 1)
+                for Tm in 0.5 * (T_sub[1:] + T_sub[:-1]):
+                    y = cls._step_population(y, Tm, dt, parameters)
+            y_grid[i + 1] = cls._yield_population(y, parameters)
+
+        # times before the beginning of the operating conditions
+        y_t = np.zeros((len(t), len(parameters)))
+        started = t >= t_oc[0]
+        y_t[started] = y_grid[np.searchsorted(t_grid, t[started])]
+        return y_t
+
+    def solve_profile(self, t, operating_conditions):
+        """
+        Calculate the volatile yields with the closed form solution.
+
+        The operating conditions are piecewise linear in time, the yields
+        are calculated analytically on each segment without solving the
+        ODE. Only the models with `_analytical` set provide it.
+
+        Parameters
+        ----------
+        t: array
+            Times where the yields are returned
+        operating_conditions: array, list
+            Time, temperature points [[t0, T0], ..., [tn, Tn]]
+
+        Returns
+        -------
+        y: array
+            Volatile yields at `t`
+
+        """
+        raise NotImplementedError(
+            '{} has no closed form solution'.format(self.__class__.__name__))
+
+    def solve_profile_sensitivity(self, t, operating_conditions):
+        """
+        Calculate the volatile yields and their sensitivities.
+
+        The sensitivities are the derivatives of the closed form
+        solution of :meth:`solve_profile` with respect to the
+        parameters.
+
+        Parameters
+        ----------
+        t: array
+            Times where the yields are returned
+        operating_conditions: array, list
+            Time, temperature points [[t0, T0], ..., [tn, Tn]]
+
+        Returns
+        -------
+        y: array
+            Volatile yields at `t`
+        S: array
+            Sensitivities with shape (len(t), n_parameters)
+
+        """
+        raise NotImplementedError(
+            'Closed form sensitivities not available for {}'.format(
+                self.__class__.__name__))
+
+    @classmethod
+    def _init_population(cls, n_pop):
+        """Return the initial stacked state of the population."""
+        return np.tile(np.array(cls.y0, dtype=float), (n_pop, 1))
+
+    @classmethod
+    def _yield_population(cls, y, parameters):
+        """Return the volatile yield from the stacked state."""
+        return y[:, 0]
+
+    @classmethod
+    def _step_population(cls, y, T, dt, parameters):
+        """Advance the stacked state of the population of `dt`."""
+        raise NotImplementedError(
+            '{} cannot be integrated for a population'.format(cls.__name__))
+
     def postprocess(self, t, y):
         """Post process results after ODE."""
         # TODO not sure if it is the right way to return data
@@ -355,6 +649,7 @@ class SFOR(EmpiricalModel):
         units=('1/s', 'J/kmol', '-'))
     _mask = np.array([True, False, False])
     y0 = [0]
+    _analytical = True
 
     def rate(self, t, y):
         """
@@ -381,9 +676,84 @@ class SFOR(EmpiricalModel):
     def _calc_k(self, T):
         return (self.parameters.A / np.exp(self.parameters.E / Rgas / T))
 
-    # def jacob(self, t, y):
-    #    return -self._calc_k(t)
-    jacob = None
+    @classmethod
+    def _step_population(cls, y, T, dt, parameters):
+        """Advance the stacked SFOR yields of `dt` at temperature `T`."""
+        A, E, y0 = parameters[:, 0], parameters[:, 1], parameters[:, 2]
+        k = A / np.exp(E / Rgas / T)
+        return (y0 - (y0 - y[:, 0]) * np.exp(-k * dt))[:, np.newaxis]
+
+    def solve_profile(self, t, operating_conditions):
+        """
+        Calculate the volatile yields with the closed form solution.
+
+        .. math::
+            y(t) = y_0 (1 - e^{-K(t)})
+
+        where :math:`K(t)` is calculated by :func:`arrhenius_integral`.
+        """
+        K = arrhenius_integral(self.parameters.A, self.parameters.E, t,
+                               operating_conditions,
+                               T_threshold=self._T_threshold())
+        return -self.parameters.y0 * np.expm1(-K)
+
+    def solve_profile_sensitivity(self, t, operating_conditions):
+        """
+        Calculate the volatile yields and their sensitivities.
+
+        The derivative with respect to the threshold temperature of
+        :class:`SFORT` is set to zero.
+        """
+        p = self.parameters
+        K, dKdE = (arrhenius_integral(p.A, p.E, t, operating_conditions,
+                                      T_threshold=self._T_threshold(),
+                                      derivative=derivative)
+                   for derivative in (False, True))
+        exp_K = np.exp(-K)
+        S = np.zeros((len(K), len(self.parameters_list)))
+        S[:, 0] = p.y0 * exp_K * K / p.A
+        S[:, 1] = p.y0 * exp_K * dKdE
+        S[:, 2] = -np.expm1(-K)
+        return p.y0 * S[:, 2], S
+
+    def _T_threshold(self):
+        """Return the temperature threshold of the reaction."""
+        return None
+
+    def jacob(self, t, y):
+        """
+        Jacobian of the reaction rate.
+
+        Returns
+        -------
+        jac: np.ndarray
+            Array [[d(dy/dt)/dy, d(dy/dt)/dT]]
+
+        """
+        T = y[-1]
+        k = self._calc_k(T)
+        dy = self.parameters.y0 - y[0]
+        if dy > 1e-6:
+            return np.array([[-k, k * self.parameters.E / Rgas / T**2 * dy]])
+        return np.zeros((1, 2))
+
+    def jacob_parameters(self, t, y):
+        """
+        Derivatives of the reaction rate with respect to the parameters.
+
+        Returns
+        -------
+        jac: np.ndarray
+            Array [[d(dy/dt)/dA, d(dy/dt)/dE, d(dy/dt)/dy0]]
+
+        """
+        T = y[-1]
+        dy = self.parameters.y0 - y[0]
+        if dy <= 1e-6:
+            return np.zeros((1, 3))
+        exp_T = np.exp(-self.parameters.E / Rgas / T)
+        k = self.parameters.A * exp_T
+        return np.array([[exp_T * dy, -k * dy / Rgas / T, k]])
 
 
 @logged
@@ -403,7 +773,35 @@ class SFORT(SFOR):
         if y[1] >= self.parameters.T:
             return super(SFORT, self).rate(t, y)
         else:
-            return 0
+            return [0]
+
+    @classmethod
+    def _step_population(cls, y, T, dt, parameters):
+        """Advance the stacked SFORT yields of `dt` at temperature `T`."""
+        y_new = super(SFORT, cls)._step_population(y, T, dt, parameters)
+        return np.where((T >= parameters[:, 3])[:, np.newaxis], y_new, y)
+
+    def _T_threshold(self):
+        """Return the temperature threshold of the reaction."""
+        return self.parameters.T
+
+    def jacob(self, t, y):
+        """Jacobian of the reaction rate."""
+        if y[1] >= self.parameters.T:
+            return super(SFORT, self).jacob(t, y)
+        return np.zeros((1, 2))
+
+    def jacob_parameters(self, t, y):
+        """
+        Derivatives of the reaction rate with respect to the parameters.
+
+        The rate is discontinuous with respect to the threshold
+        temperature, whose derivative is set to zero.
+        """
+        if y[1] >= self.parameters.T:
+            return np.append(super(SFORT, self).jacob_parameters(t, y),
+                             [[0]], axis=1)
+        return np.zeros((1, 4))
 
 
 @logged
@@ -464,6 +862,7 @@ class C2SM(EmpiricalModel):
     _mask = np.array([True, False, False, True, False, False])
 
     y0 = [0, 1]  # volatile yield, raw solid
+    _analytical = True
 
     def rate(self, t, y):
         """
@@ -493,11 +892,50 @@ class C2SM(EmpiricalModel):
             dydt = [0, 0]
         return dydt
 
-    # def jacob(self, t, y):
-    #     k1, k2 = self._k(t)
-    #     return np.array([[0, (self.parameters.y1 * k1 +
-    #                           self.parameters.y2 * k2)],
-    #                      [0, -(k1 + k2)]])
+    def jacob(self, t, y):
+        """
+        Jacobian of the reaction rates.
+
+        Returns
+        -------
+        jac: np.ndarray
+            Derivatives of the rates of :math:`y` and :math:`s` with
+            respect to :math:`y`, :math:`s` and :math:`T`
+
+        """
+        if y[1] <= 1e-6:
+            return np.zeros((2, 3))
+        T = y[-1]
+        k1, k2 = self._k(T)
+        dk1, dk2 = (k1 * self.parameters.E1 / Rgas / T**2,
+                    k2 * self.parameters.E2 / Rgas / T**2)
+        p = self.parameters
+        return np.array([
+            [0, p.y1 * k1 + p.y2 * k2, (p.y1 * dk1 + p.y2 * dk2) * y[1]],
+            [0, -(k1 + k2), -(dk1 + dk2) * y[1]]])
+
+    def jacob_parameters(self, t, y):
+        """
+        Derivatives of the reaction rates with respect to the parameters.
+
+        Returns
+        -------
+        jac: np.ndarray
+            Derivatives of the rates of :math:`y` and :math:`s` with
+            respect to `A1`, `E1`, `y1`, `A2`, `E2`, `y2`
+
+        """
+        if y[1] <= 1e-6:
+            return np.zeros((2, 6))
+        RT = Rgas * y[-1]
+        p = self.parameters
+        s = y[1]
+        exp1, exp2 = np.exp(-p.E1 / RT), np.exp(-p.E2 / RT)
+        k1, k2 = p.A1 * exp1, p.A2 * exp2
+        return np.array([
+            [p.y1 * exp1 * s, -p.y1 * k1 * s / RT, k1 * s,
+             p.y2 * exp2 * s, -p.y2 * k2 * s / RT, k2 * s],
+            [-exp1 * s, k1 * s / RT, 0, -exp2 * s, k2 * s / RT, 0]])
 
     def _k(self, T):
         """Calculate the reaction constants."""
@@ -505,6 +943,132 @@ class C2SM(EmpiricalModel):
         return (self.parameters.A1 / np.exp(self.parameters.E1 / RT),
                 self.parameters.A2 / np.exp(self.parameters.E2 / RT))
 
+    @classmethod
+    def _step_population(cls, y, T, dt, parameters):
+        """Advance the stacked C2SM states of `dt` at temperature `T`."""
+        A1, E1, y1, A2, E2, y2 = parameters.T
+        RT = Rgas * T
+        k1, k2 = A1 / np.exp(E1 / RT), A2 / np.exp(E2 / RT)
+        k = k1 + k2
+        s = y[:, 1] * np.exp(-k * dt)
+        # fraction of volatiles released by the consumed raw coal
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y_frac = np.where(k > 0, (y1 * k1 + y2 * k2) / k, 0)
+        return np.column_stack([y[:, 0] + y_frac * (y[:, 1] - s), s])
+
+    def solve_profile(self, t, operating_conditions, dT_max=5.0):
+        r"""
+        Calculate the volatile yields with the closed form solution.
+
+        The raw coal fraction :math:`s = e^{-K_1(t)-K_2(t)}` is exact.
+        The volatile yield is :math:`y = \int \phi(T) (-ds)`, with
+        :math:`\phi = (y_1 k_1 + y_2 k_2)/(k_1 + k_2)`, which is exact
+        along isothermal segments and it is integrated with the mid-point
+        temperature along ramps, split in steps smaller than `dT_max`.
+
+        Parameters
+        ----------
+        t: array
+            Times where the yields are returned
+        operating_conditions: array, list
+            Time, temperature points [[t0, T0], ..., [tn, Tn]]
+        dT_max: float, default=5.0
+            Maximum temperature increment along the ramps
+
+        Returns
+        -------
+        y: array
+            Volatile yields at `t`
+
+        """
+        t = np.asarray(t, dtype=float)
+        t_fine, T_mid = self._fine_grid(t, operating_conditions, dT_max)
+        p = self.parameters
+        s = np.exp(-arrhenius_integral(p.A1, p.E1, t_fine,
+                                       operating_conditions) -
+                   arrhenius_integral(p.A2, p.E2, t_fine,
+                                      operating_conditions))
+        k1, k2 = self._k(T_mid)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi = np.where(k1 + k2 > 0, (p.y1 * k1 + p.y2 * k2) / (k1 + k2),
+                           0)
+        y_fine = np.concatenate(([0], np.cumsum(-phi * np.diff(s))))
+        return self._fine_to_t(y_fine, t_fine, t, operating_conditions)
+
+    def solve_profile_sensitivity(self, t, operating_conditions, dT_max=5.0):
+        """
+        Calculate the volatile yields and their sensitivities.
+
+        The sensitivities are the exact derivatives of the discretized
+        solution of :meth:`solve_profile`.
+        """
+        t = np.asarray(t, dtype=float)
+        t_fine, T_mid = self._fine_grid(t, operating_conditions, dT_max)
+        p = self.parameters
+        K1, dK1, K2, dK2 = (
+            arrhenius_integral(A, E, t_fine, operating_conditions,
+                               derivative=derivative)
+            for A, E in ((p.A1, p.E1), (p.A2, p.E2))
+            for derivative in (False, True))
+        s = np.exp(-K1 - K2)
+        # derivatives of s
+        ds = -s * np.array([K1 / p.A1, dK1, np.zeros_like(s),
+                            K2 / p.A2, dK2, np.zeros_like(s)])
+        k1, k2 = self._k(T_mid)
+        k = k1 + k2
+        valid = k > 0
+        k = np.where(valid, k, 1)
+        phi = np.where(valid, (p.y1 * k1 + p.y2 * k2) / k, 0)
+        RT = Rgas * T_mid
+        # derivatives of phi, using dphi/dk_i = (y_i - phi) / k
+        dphi = np.where(valid, np.array([
+            (p.y1 - phi) / k * k1 / p.A1,
+            -(p.y1 - phi) / k * k1 / RT,
+            k1 / k,
+            (p.y2 - phi) / k * k2 / p.A2,
+            -(p.y2 - phi) / k * k2 / RT,
+            k2 / k]), 0)
+        y_fine = np.concatenate(([0], np.cumsum(-phi * np.diff(s))))
+        S_fine = np.column_stack([np.concatenate(([0], np.cumsum(
+            -dphi[i] * np.diff(s) - phi * np.diff(ds[i]))))
+            for i in range(6)])
+        return (self._fine_to_t(y_fine, t_fine, t, operating_conditions),
+                self._fine_to_t(S_fine, t_fine, t, operating_conditions))
+
+    @staticmethod
+    def _fine_grid(t, operating_conditions, dT_max):
+        """
+        Return the fine grid used by the closed form solution.
+
+        The grid contains the requested times and the points of the
+        operating conditions and the ramps are split in steps smaller
+        than `dT_max`. The mid-point temperatures of the steps are also
+        returned.
+        """
+        operating_conditions = np.asarray(operating_conditions, dtype=float)
+        t_oc, T_oc = operating_conditions[:, 0], operating_conditions[:, 1]
+
+        # grid of requested times and operating conditions points
+        t_grid = np.union1d(t[t > t_oc[0]], t_oc[t_oc < t.max()])
+        T_grid = np.interp(t_grid, t_oc, T_oc)
+        n_sub = np.maximum(
+            np.ceil(np.abs(np.diff(T_grid)) / dT_max), 1).astype(int)
+        start = np.repeat(np.cumsum(n_sub) - n_sub, n_sub)
+        frac = (np.arange(n_sub.sum()) - start) / np.repeat(n_sub, n_sub)
+        t_fine = np.append(
+            np.repeat(t_grid[:-1], n_sub) +
+            frac * np.repeat(np.diff(t_grid), n_sub), t_grid[-1])
+        return t_fine, np.interp(0.5 * (t_fine[1:] + t_fine[:-1]),
+                                 t_oc, T_oc)
+
+    @staticmethod
+    def _fine_to_t(y_fine, t_fine, t, operating_conditions):
+        """Return the values on the fine grid at the requested times."""
+        y = np.zeros((len(t),) + y_fine.shape[1:])
+        started = t >= operating_conditions[0][0]
+        y[started] = y_fine[np.searchsorted(t_fine, t[started])]
+        return y
+
 
 @logged
 class DAEM(EmpiricalModel):
@@ -524,6 +1088,7 @@ class DAEM(EmpiricalModel):
         units=('1/s', 'J/kmol', 'J/kmol', '-'))
     _mask = np.array([True, False, False, False])
     y0 = [0, 0, 0, 0, 0]
+    _analytical = True
 
     n_quad = 4
     mt = 0.72
@@ -561,6 +1126,49 @@ class DAEM(EmpiricalModel):
         # self.__log.debug('dydt %s', dydt)
         return np.append(dydt, dIdt)
 
+    def jacob(self, t, yt):
+        """
+        Jacobian of the reaction rates.
+
+        The rates of the quadrature integrals depend only on the
+        temperature.
+        """
+        T = yt[-1]
+        dIdt = self.parameters.A0 * np.exp(-self._Em / Rgas / T)
+        dIdT = dIdt * self._Em / Rgas / T**2
+        coeff = (self.Wm * self.mt / sqrtpi *
+                 np.exp(-pow((self._Em - self.parameters.E0) /
+                             self.parameters.sigma, 2) / 2) *
+                 self.parameters.y0 * np.exp(-yt[1:-1]))
+        n = len(yt)
+        jac = np.zeros((n - 1, n))
+        jac[0, 1:-1] = -coeff * dIdt
+        jac[0, -1] = np.sum(coeff * dIdT)
+        jac[1:, -1] = dIdT
+        return jac
+
+    def jacob_parameters(self, t, yt):
+        """
+        Derivatives of the reaction rates with respect to the parameters.
+
+        The rates depend on `E0` and `sigma` through the activation
+        energies of the quadrature points.
+        """
+        RT = Rgas * yt[-1]
+        exp_T = np.exp(-self._Em / RT)
+        dIdt = self.parameters.A0 * exp_T
+        # dIdt derivatives respect to A0, E0, sigma
+        dI = np.column_stack([exp_T, -dIdt / RT,
+                              -dIdt * self.x * sqrt2 * self.mt / RT])
+        coeff = (self.Wm * self.mt / sqrtpi *
+                 np.exp(-pow(self.x * sqrt2 * self.mt, 2) / 2) *
+                 np.exp(-yt[1:-1]))
+        jac = np.zeros((len(yt) - 1, 4))
+        jac[0, :3] = self.parameters.y0 * coeff.dot(dI)
+        jac[0, 3] = np.sum(coeff * dIdt)
+        jac[1:, :3] = dI
+        return jac
+
     def _calc_Em(self):
         """Calculate activation energies for the quadrature points."""
         return (self.parameters.E0 +
@@ -571,6 +1179,56 @@ class DAEM(EmpiricalModel):
         super(DAEM, self).set_parameters(*args, **kwargs)
         self._Em = self._calc_Em()
 
+    @classmethod
+    def _step_population(cls, y, T, dt, parameters):
+        """Advance the stacked DAEM integrals of `dt` at temperature `T`."""
+        A0, E0, sigma = (parameters[:, i, np.newaxis] for i in range(3))
+        Em = E0 + cls.x * sqrt2 * sigma * cls.mt
+        y_new = y.copy()
+        y_new[:, 1:] += A0 * np.exp(-Em / Rgas / T) * dt
+        y_new[:, 0] = cls._yield_population(y_new, parameters)
+        return y_new
+
+    @classmethod
+    def _yield_population(cls, y, parameters):
+        """Return the DAEM volatile yields from the quadrature integrals."""
+        coeff1 = cls.Wm * cls.mt / sqrtpi
+        coeff2 = np.exp(-pow(cls.x * sqrt2 * cls.mt, 2) / 2)
+        return parameters[:, 3] * np.sum(
+            coeff1 * coeff2 * (1 - np.exp(-y[:, 1:])), axis=1)
+
+    def solve_profile(self, t, operating_conditions):
+        """
+        Calculate the volatile yields with the closed form solution.
+
+        The quadrature integrals are calculated exactly by
+        :func:`arrhenius_integral` for each activation energy.
+        """
+        integrals = np.column_stack(
+            [np.zeros(len(np.atleast_1d(t)))] +
+            [arrhenius_integral(self.parameters.A0, Em, t,
+                                operating_conditions)
+             for Em in self._Em])
+        return self._yield_population(
+            integrals, np.atleast_2d(self.parameters_list))
+
+    def solve_profile_sensitivity(self, t, operating_conditions):
+        """Calculate the volatile yields and their sensitivities."""
+        p = self.parameters
+        I, dIdE = (np.column_stack([
+            arrhenius_integral(p.A0, Em, t, operating_conditions,
+                               derivative=derivative)
+            for Em in self._Em]) for derivative in (False, True))
+        coeff = (self.Wm * self.mt / sqrtpi *
+                 np.exp(-pow(self.x * sqrt2 * self.mt, 2) / 2))
+        exp_I = np.exp(-I)
+        S = np.column_stack([
+            p.y0 * np.dot(exp_I * I / p.A0, coeff),
+            p.y0 * np.dot(exp_I * dIdE, coeff),
+            p.y0 * np.dot(exp_I * dIdE, coeff * self.x * sqrt2 * self.mt),
+            np.dot(1 - exp_I, coeff)])
+        return p.y0 * S[:, 3], S
+
     # parameters = property(_get_parameters, _set_parameters)
 
 
@@ -608,6 +1266,7 @@ class BT(SFOR):
     _mask = np.array([True, False, False])
     y0 = [0]
     Tst = 1223
+    _analytical = False
 
     def rate(self, t, y):
         """Reaction rate."""
@@ -620,3 +1279,34 @@ class BT(SFOR):
     def _calc_y0(self, T):
         """Calculate y0."""
         return 1 - np.exp(-self.parameters.k * T / self.Tst)
+
+    def jacob(self, t, y):
+        """Jacobian of the reaction rate."""
+        T = y[-1]
+        k = self._calc_k(T)
+        dy0dT = (self.parameters.k / self.Tst *
+                 np.exp(-self.parameters.k * T / self.Tst))
+        dy = self._calc_y0(T) - y[0]
+        return np.array(
+            [[-k, k * (self.parameters.E / Rgas / T**2 * dy + dy0dT)]])
+
+    def jacob_parameters(self, t, y):
+        """Derivatives of the reaction rate with respect to A, E, k."""
+        T = y[-1]
+        exp_T = np.exp(-self.parameters.E / Rgas / T)
+        k = self.parameters.A * exp_T
+        dy = self._calc_y0(T) - y[0]
+        dy0dk = T / self.Tst * np.exp(-self.parameters.k * T / self.Tst)
+        return np.array([[exp_T * dy, -k * dy / Rgas / T, k * dy0dk]])
+
+    @classmethod
+    def _step_population(cls, y, T, dt, parameters):
+        """Advance the stacked BT yields of `dt` at temperature `T`."""
+        A, E, k_di = parameters[:, 0], parameters[:, 1], parameters[:, 2]
+        y0 = 1 - np.exp(-k_di * T / cls.Tst)
+        k = A / np.exp(E / Rgas / T)
+        return (y0 - (y0 - y[:, 0]) * np.exp(-k * dt))[:, np.newaxis]
+
+    def solve_profile(self, t, operating_conditions):
+        """The yield depends on the temperature, no closed form is used."""
+        return EmpiricalModel.solve_profile(self, t, operating_conditions)
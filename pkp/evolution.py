@@ -74,6 +74,12 @@ from builtins import dict
 import numpy as np
 import random
 import array
+import os
+import pickle
+import shutil
+import tempfile
+import hashlib
+import multiprocessing
 from autologging import logged
 
 from deap import base
@@ -87,10 +93,6 @@ from . import algorithms
 from . import reactor
 
 
-# import multiprocessing
-from pathos.multiprocessing import ProcessPool
-# from scoop import futures
-
 from ._exceptions import PKPModelError, PKPParametersError
 
 
@@ -169,13 +171,55 @@ def error(cls_, individual):
 
 
 def run_reactor(model, parameters, results):
-    """Run reactor."""
+    """
+    Run reactor.
+
+    Models with a closed form solution are evaluated with
+    :meth:`pkp.empirical_model.EmpiricalModel.solve_profile` without
+    solving the ODE.
+    """
+    if getattr(model, '_analytical', False):
+        return model(parameters).solve_profile(
+            results['t'], results['operating_conditions'])
     m = reactor.Reactor(model, parameters)
     m.operating_conditions = results['operating_conditions']
     _, y = m.run(results['t'])
     return y
 
 
+@logged
+def error_population(cls_, population):
+    """
+    Calculate the error function for a population.
+
+    The error is the same of :func:`error`, but all the individuals
+    are integrated together for each target run using
+    :meth:`pkp.empirical_model.EmpiricalModel.integrate_population`.
+
+    Parameters
+    ----------
+    cls_: Evolution
+        Evolution instance.
+    population: iterable
+        List of individuals.
+
+    Return
+    ------
+    err: list
+        List of tuples containing the error of each individual.
+
+    """
+    parameters = np.array([cls_.unscale_parameters(individual)
+                           for individual in population])
+    err = np.zeros(len(parameters))
+    for run, results in cls_.ref_results.items():
+        y = cls_.empirical_model.integrate_population(
+            results['t'], results['operating_conditions'], parameters)
+        err += cls_.error_run(y, results['y'][:, np.newaxis])
+    error_population._log.debug('Population errors:%s', err)
+    return [(e,) for e in err]
+
+
 # @binary.bin2float(0, 1, 16)
 
 def error_binary(cls_, individual):
@@ -186,6 +230,46 @@ def error_binary(cls_, individual):
     return f(individual, cls_)
 
 
+def error_population_binary(cls_, population):
+    """Return population errors for binary representation."""
+    decode = binary.bin2float(0, 1, 16)(lambda individual: individual)
+    return error_population(cls_, [decode(ind) for ind in population])
+
+
+# Evolution instances loaded by the worker processes
+_contexts = {}
+
+
+def _evaluate_chunk(args):
+    """
+    Evaluate a chunk of individuals in a worker process.
+
+    The Evolution instance with the targets is published once for each
+    fit in a file (see :meth:`Evolution.evaluate`). It is loaded by the
+    worker at the first call and kept in memory, therefore only the
+    genes of the individuals are sent to the workers.
+
+    Parameters
+    ----------
+    args: tuple
+        Path of the published Evolution and list of genes
+
+    Returns
+    -------
+    list
+        List of fitness tuples
+
+    """
+    path, genes = args
+    ga = _contexts.get(path)
+    if ga is None:
+        _contexts.clear()
+        with open(path, 'rb') as f:
+            ga = pickle.load(f)
+        _contexts[path] = ga
+    return ga.evaluate_genes(genes)
+
+
 @logged
 class Evolution(object):
     r"""
@@ -200,9 +284,11 @@ class Evolution(object):
     individuals of the next generation from the joined population
     :math:`(\mu+\lambda)`.
     """
+    _encoding = 'float'
 
     def __init__(self, npop=40, ngen=30, cxpb=0.6, mutpb=0.2, mu=None,
-                 lambda_=None, skip=1):
+                 lambda_=None, skip=1, vectorized=False, cache=None,
+                 stop=None):
         """
         Init the evolution manager.
 
@@ -222,6 +308,15 @@ class Evolution(object):
             The number of children to produce at each generation.
         skip: int
             Skip rows in the results
+        vectorized: bool
+            Evaluate the whole population at once using
+            :func:`error_population` instead of mapping the individuals
+        cache: pkp.algorithms.FitnessCache, default=None
+            Cache of the fitness of the individuals. The same cache can
+            be shared with :class:`pkp.minimize.Minimization`.
+        stop: pkp.algorithms.StopCriteria, default=None
+            Stopping rules of the evolution. If None, the evolution runs
+            for `ngen` generations.
 
         """
         # GA parameters
@@ -249,6 +344,19 @@ class Evolution(object):
         self._parameters_max = None
 
         self._skip = skip
+        self._vectorized = vectorized
+        self.cache = cache
+        self.stop = stop
+        self._pool = None
+        self._n_p = 1
+        self._context = None
+
+    def __getstate__(self):
+        """Return the state for pickling, excluding DEAP and pool objects."""
+        exclude = ('toolbox', 'pop', 'log', 'stats', '_pool', '_context',
+                   'cache')
+        return {key: value for key, value in self.__dict__.items()
+                if key not in exclude}
 
     def set_target(self, t, y, operating_conditions):
         """
@@ -285,6 +393,27 @@ class Evolution(object):
         """Number of target solutions."""
         return self._ntargets
 
+    @property
+    def target_fingerprint(self):
+        """
+        Fingerprint of the target set.
+
+        The fingerprint identifies the empirical model, the encoding of
+        the genes, the parameters range and the target results, and it
+        is used for the keys of the fitness cache.
+        """
+        fingerprint = hashlib.sha1()
+        fingerprint.update('{}-{}-{}'.format(
+            self.empirical_model.__name__, self._encoding,
+            getattr(self, '_vectorized', False)).encode())
+        for value in (self._parameters_min, self._parameters_max):
+            fingerprint.update(np.asarray(value, dtype=float).tobytes())
+        for run in sorted(self.ref_results):
+            for key in ('t', 'y', 'operating_conditions'):
+                fingerprint.update(np.asarray(self.ref_results[run][key],
+                                              dtype=float).tobytes())
+        return fingerprint.hexdigest()
+
     @property
     def empirical_model(self):
         """Empirical model."""
@@ -300,10 +429,17 @@ class Evolution(object):
 
     @staticmethod
     def error_run(y, y_t):
-        """Calculate the error."""
-        return np.mean((y - y_t)**2)
+        """
+        Calculate the error.
+
+        If `y` is a 2D array with the yields of a population in the
+        columns (see :func:`error_population`), the array of the errors
+        of the individuals is returned.
+        """
+        return np.mean((y - y_t)**2, axis=0)
 
-    def evolve(self, n_p=1, verbose=True):
+    def evolve(self, n_p=1, verbose=True, pool=None, checkpoint=None,
+               resume=False):
         r"""
         Evolve the population.
 
@@ -312,9 +448,19 @@ class Evolution(object):
         Parameters
         ----------
         n_p: int, default=1
-            Number of precess to generate the new population.
+            Number of processes to generate the new population. If
+            `pool` is given, it is the number of its workers.
         verbose: bool, default=True
             Print extra message
+        pool: multiprocessing.Pool, default=None
+            Pool of workers used for the evaluation of the individuals.
+            If None and `n_p > 1`, a pool is created and closed at the
+            end of the evolution.
+        checkpoint: pkp.algorithms.Checkpoint, default=None
+            Checkpoint where the state of the evolution is periodically
+            saved
+        resume: bool, default=False
+            Resume the evolution from the checkpoint, if it exists
 
         Returns
         -------
@@ -324,36 +470,45 @@ class Evolution(object):
         """
         toolbox = self.toolbox
 
-        # Process Pool of 4 workers
-        if n_p > 1:
-            # pool = multiprocessing.Pool(processes=n_p)
-            # pool = Pool(2)
-            pool = ProcessPool(nodes=n_p)
-            toolbox.register("map", pool.map)
-            # toolbox.register("map", futures.map)
-            # self.__log.warning('n_p not supported at the moment!\n'
-            #                   'Only serial run supported!')
+        close_pool = pool is None and n_p > 1
+        if close_pool:
+            pool = multiprocessing.Pool(processes=n_p)
+        self.set_pool(pool, n_p)
 
         pop = toolbox.population(n=self._npop)
         hof = tools.HallOfFame(1)
 
         stats = self._set_stats()
-
-        # pop, log = algorithms.eaSimple(pop, toolbox, cxpb=CXPB,
-        #                               mutpb=MUTPB, ngen=NGEN,
-        #                               stats=stats, halloffame=hof,
-        #                               verbose=True)
-        pop, log = algorithms.eaMuPlusLambda(pop, toolbox,
-                                             mu=self._mu,
-                                             lambda_=self._lambda,
-                                             cxpb=self._cxpb,
-                                             mutpb=self._mutpb,
-                                             ngen=self._ngen,
-                                             stats=stats,
-                                             halloffame=hof,
-                                             verbose=verbose)
-        # if n_p > 1:
-        #    pool.close()
+        fingerprint = (self.target_fingerprint
+                       if self.cache is not None or checkpoint is not None
+                       else None)
+        state = None
+        if checkpoint is not None:
+            checkpoint.fingerprint = fingerprint
+            if resume:
+                state = checkpoint.load()
+
+        try:
+            pop, log = algorithms.eaMuPlusLambda(pop, toolbox,
+                                                 mu=self._mu,
+                                                 lambda_=self._lambda,
+                                                 cxpb=self._cxpb,
+                                                 mutpb=self._mutpb,
+                                                 ngen=self._ngen,
+                                                 stats=stats,
+                                                 halloffame=hof,
+                                                 verbose=verbose,
+                                                 cache=self.cache,
+                                                 fingerprint=fingerprint,
+                                                 stop=self.stop,
+                                                 checkpoint=checkpoint,
+                                                 state=state)
+        finally:
+            self._unpublish()
+            self.set_pool(None)
+            if close_pool:
+                pool.close()
+                pool.join()
 
         self.pop = pop
         self.log = log
@@ -368,6 +523,87 @@ class Evolution(object):
         return {p: v for p, v in
                 zip(self.empirical_model.parameters_names(), best)}
 
+    def set_pool(self, pool, n_p=1):
+        """
+        Set the pool of workers used by :meth:`evaluate`.
+
+        Parameters
+        ----------
+        pool: multiprocessing.Pool
+            Pool of workers or None
+        n_p: int, default=1
+            Number of workers of the pool
+
+        """
+        self._pool = pool
+        self._n_p = n_p if pool is not None else 1
+
+    def evaluate(self, population):
+        """
+        Evaluate the fitness of a population.
+
+        If a pool of workers is used, the population is split in one
+        chunk for each worker. The Evolution instance is published in a
+        temporary file at the first call, so that only the genes are
+        sent to the workers.
+
+        Parameters
+        ----------
+        population: list
+            List of individuals
+
+        Returns
+        -------
+        list
+            List of fitness tuples
+
+        """
+        genes = [list(individual) for individual in population]
+        if self._pool is None or len(genes) == 0:
+            return self.evaluate_genes(genes)
+        if self._context is None:
+            self._publish()
+        n_chunks = min(self._n_p, len(genes))
+        chunks = [(self._context, [genes[i] for i in index])
+                  for index in np.array_split(np.arange(len(genes)),
+                                              n_chunks)]
+        return [fitness
+                for chunk in self._pool.map(_evaluate_chunk, chunks)
+                for fitness in chunk]
+
+    def evaluate_genes(self, genes):
+        """
+        Calculate the fitness of a list of genes.
+
+        Parameters
+        ----------
+        genes: list
+            List of genes of the individuals
+
+        Returns
+        -------
+        list
+            List of fitness tuples
+
+        """
+        if self._vectorized:
+            return error_population(self, genes)
+        return [error(self, individual) for individual in genes]
+
+    def _publish(self):
+        """Publish the Evolution instance in a file for the workers."""
+        directory = tempfile.mkdtemp(prefix='pkp-')
+        self._context = os.path.join(directory, 'evolution.pkl')
+        with open(self._context, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__log.debug('Publish evolution to %s', self._context)
+
+    def _unpublish(self):
+        """Remove the file of the published Evolution instance."""
+        if self._context is not None:
+            shutil.rmtree(os.path.dirname(self._context), ignore_errors=True)
+            self._context = None
+
     def _set_stats(self):
         stats = tools.Statistics(lambda ind: ind.fitness.values)
         stats.register("avg", np.mean)
@@ -397,6 +633,7 @@ class Evolution(object):
         toolbox = self._individual(toolbox=toolbox)
 
         # toolbox.register('evaluate', self.error)
+        toolbox.register('evaluate_population', self.evaluate)
 
         self.toolbox = toolbox
 
@@ -503,6 +740,7 @@ class Evolution(object):
 class EvolutionBinary(Evolution):
     """Evolution class using binary representation."""
     n_decoding = 16
+    _encoding = 'binary'
 
     def _individual(self, toolbox):
         """Set individual enconding using binary."""
@@ -521,6 +759,14 @@ class EvolutionBinary(Evolution):
         toolbox.register('select', tools.selTournament, tournsize=3)
         return toolbox
 
+    def evaluate_genes(self, genes):
+        """Calculate the fitness of a list of binary genes."""
+        # bits are stored as float in the individual array
+        genes = [[int(bit) for bit in individual] for individual in genes]
+        if self._vectorized:
+            return error_population_binary(self, genes)
+        return [error_binary(self, individual) for individual in genes]
+
     def unscale_parameters_final(self, individual):
         """First convert to float from binary and then unscale parameters."""
         @binary.bin2float(0, 1, 16)
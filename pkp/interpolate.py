@@ -9,7 +9,7 @@ try:
     from numba import jit
 
     # @jit("f8(f8, f8[:], f8[:])", nopython=True)
-    @jit(nopython=True)
+    @jit(nopython=True, cache=True)
     def interp(xi, x, y):
         """
         Linear interpolation.
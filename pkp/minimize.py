@@ -3,31 +3,136 @@
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
+import numpy as np
 import scipy.optimize
 from autologging import logged
 
 from . import evolution
 from . import empirical_model
+from . import reactor
+
 
 @logged
 class Minimization(evolution.Evolution):
-    """Minimization class."""
+    """
+    Minimization class.
+
+    The error is minimized in the space of the normalized parameters.
+    Methods supporting bounds (i.e. `L-BFGS-B`) search the minimum in
+    the range of the parameters defined by :meth:`parameters_range`.
+    If the empirical model defines `jacob_parameters`, the gradient of
+    the error is calculated from the forward sensitivities of the model
+    (see :meth:`pkp.reactor.Reactor.run_sensitivity`) instead of finite
+    differences.
+    """
+
+    # methods of scipy.optimize.minimize supporting bounds
+    _bounded_methods = ('L-BFGS-B', 'TNC', 'SLSQP', 'Powell', 'Nelder-Mead',
+                        'trust-constr')
+
+    def __init__(self, cache=None, method='L-BFGS-B', gradient=True):
+        """
+        Init.
+
+        Parameters
+        ----------
+        cache: pkp.algorithms.FitnessCache, default=None
+            Cache of the error, shared with the genetic algorithm
+        method: str, default='L-BFGS-B'
+            Method of `scipy.optimize.minimize`
+        gradient: bool, default=True
+            Use the gradient calculated from the forward sensitivities,
+            if available for the empirical model
 
-    def __init__(self):
-        """Init."""
+        """
         self._ntargets = 0
         self.ref_results = {}
         self._empirical_model = empirical_model.SFOR
         self._parameters_min = None
         self._parameters_max = None
         self._skip = 1
+        self._vectorized = False
+        self.cache = cache
+        self._fingerprint = None
+        self.method = method
+        self.gradient = gradient
 
     def error(self, x):
         """Calc error."""
-        err = evolution.error(self, x)[0]
+        if self.cache is None:
+            err = evolution.error(self, x)[0]
+        else:
+            err = self.cache.evaluate(
+                self._fingerprint, [x],
+                lambda xs: [evolution.error(self, xi) for xi in xs])[0][0]
         self.__log.debug('x: %s - err: %s', x, err)
         return err
 
+    def error_gradient(self, x):
+        """
+        Calc error and its gradient.
+
+        The gradient respect to the normalized parameters is calculated
+        from the sensitivities of the volatile yields. Models with a
+        closed form solution use
+        :meth:`pkp.empirical_model.EmpiricalModel.solve_profile_sensitivity`
+        otherwise the forward sensitivities are integrated by the
+        reactor.
+
+        If a cache is defined, the error and the gradient are stored
+        with the fingerprint of the targets, and the error of the points
+        already evaluated (i.e. by the genetic algorithm) is reused.
+        """
+        if self.cache is None:
+            return self._error_gradient(x)
+        cache = self.cache
+        key = cache.key((self._fingerprint, 'gradient'), x)
+        value = cache.get(key)
+        if value is not None:
+            cache.hits += 1
+            return value[0], np.array(value[1:])
+        err, grad = self._error_gradient(x)
+        key_error = cache.key(self._fingerprint, x)
+        fitness = cache.get(key_error)
+        if fitness is None:
+            cache.misses += 1
+            cache.set(key_error, (err,))
+        else:
+            cache.hits += 1
+            err = fitness[0]
+        cache.set(key, (err,) + tuple(grad))
+        return err, grad
+
+    def _error_gradient(self, x):
+        """Calc error and its gradient without cache."""
+        parameters = self.unscale_parameters(x)
+        scale = self.empirical_model.unscale_parameters_derivative(
+            x, self._parameters_min, self._parameters_max)
+        err, grad = 0, np.zeros(len(x))
+        for run, results in self.ref_results.items():
+            if self.empirical_model._analytical:
+                y, S = self.empirical_model(
+                    parameters).solve_profile_sensitivity(
+                        results['t'], results['operating_conditions'])
+                S = S * scale
+            else:
+                m = reactor.Reactor(self.empirical_model, parameters)
+                m.operating_conditions = results['operating_conditions']
+                _, y, S = m.run_sensitivity(results['t'], scale=scale)
+                y, S = y[:, 0], S[:, 0, :]
+            res = y - results['y']
+            err += self.error_run(y, results['y'])
+            grad += 2 * np.dot(res, S) / len(res)
+        self.__log.debug('x: %s - err: %s - grad: %s', x, err, grad)
+        return err, grad
+
+    @property
+    def use_gradient(self):
+        """True if the gradient of the error is used."""
+        return self.gradient and (
+            self.empirical_model._analytical or
+            self.empirical_model.jacob_parameters is not None)
+
     def run(self, initial):
         """
         Run minimization.
@@ -44,15 +149,23 @@ class Minimization(evolution.Evolution):
             self._parameters_min,
             self._parameters_max)
         self.__log.debug('Initial scaled: %s', initial)
+        if self.cache is not None:
+            self._fingerprint = self.target_fingerprint
+        options = {}
+        if self.use_gradient:
+            options['jac'] = True
+        if self.method in self._bounded_methods:
+            options['bounds'] = [(0, 1)] * len(initial)
         res = scipy.optimize.minimize(
-            fun=self.error,
+            fun=self.error_gradient if self.use_gradient else self.error,
             x0=initial,
             args=(),
-            method='BFGS',
-            options={'disp': True}
+            method=self.method,
+            options={'disp': True},
             # maxiter=1000,
             # disp=True,
             # tol=1e-6)
+            **options
         )
         best = self.unscale_parameters_final(res.x)
         self.results = res
@@ -6,12 +6,15 @@ Define the class to work with Polimi model and for triangulation.
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 import sys
+import hashlib
+import threading
 
 
 import numpy as np
 import pandas as pd
 import os
 from autologging import logged
+from scipy.sparse import csr_matrix
 
 # pkp import
 from . import coal
@@ -78,6 +81,116 @@ class CompositionError(Exception):
     pass
 
 
+# parsed mechanisms, shared by the models of the process
+_mechanisms = {}
+_mechanisms_lock = threading.Lock()
+
+# groups of species lumped in the results
+lumped_groups = ('metaplast', 'char', 'raw', 'tar', 'light_gas')
+
+
+def species_groups(species_names):
+    """
+    Classify the species of the mechanism by their prefix.
+
+    Parameters
+    ----------
+    species_names: list
+        Names of the species of the mechanism
+
+    Returns
+    -------
+    groups: dict
+        Tuples of the names of tar, metaplast, raw, char, moisture, ash
+        and light_gas species, of the indices of the light gas
+        species `light_gas_index` and the sparse matrix `lumping`
+        (n_species x n_groups), which sums the species of each group of
+        :data:`lumped_groups`
+
+    """
+    groups = {g: [] for g in ('tar', 'metaplast', 'raw', 'char',
+                              'moisture', 'ash', 'light_gas')}
+    for sp in species_names:
+        if sp.startswith('VTAR'):
+            groups['tar'].append(sp)
+        elif sp.startswith('G') or sp.startswith('TAR'):
+            groups['metaplast'].append(sp)
+        elif sp.startswith('COAL'):
+            groups['raw'].append(sp)
+        elif sp.startswith('CHAR'):
+            groups['char'].append(sp)
+        elif sp == 'ACQUA':
+            groups['moisture'].append(sp)
+        elif sp == 'ASH':
+            groups['ash'].append(sp)
+        else:
+            groups['light_gas'].append(sp)
+    groups = {g: tuple(species) for g, species in groups.items()}
+    index = {sp: i for i, sp in enumerate(species_names)}
+    groups['light_gas_index'] = tuple(index[sp] for sp in groups['light_gas'])
+    lumping = np.zeros((len(species_names), len(lumped_groups)))
+    for j, g in enumerate(lumped_groups):
+        lumping[[index[sp] for sp in groups[g]], j] = 1
+    groups['lumping'] = csr_matrix(lumping)
+    return groups
+
+
+def get_mechanism(path):
+    """
+    Return a mechanism from the process-wide cache.
+
+    The mechanism file is parsed once for each path and modification
+    time. Each call returns a new :class:`cantera.Solution`, built from
+    the parsed species and reactions, so that each model has its own
+    thermodynamic state. The SHA1 hash of the content of the file
+    identifies the mechanism in the cache of the results.
+
+    Parameters
+    ----------
+    path: str
+        Mechanism file in Cantera format
+
+    Returns
+    -------
+    mechanism: cantera.Solution
+    groups: dict
+        Species groups of the mechanism (see :func:`species_groups`),
+        shared by all the models
+    sha1: str
+        SHA1 hash of the mechanism file
+
+    """
+    path = os.path.abspath(path)
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        raise MechanismError('Cannot read {}'.format(path))
+    with _mechanisms_lock:
+        if key not in _mechanisms:
+            try:
+                gas = cantera.Solution(path)
+                with open(path, 'rb') as f:
+                    sha1 = hashlib.sha1(f.read()).hexdigest()
+            except Exception:
+                raise MechanismError('Cannot read {}'.format(path))
+            _mechanisms[key] = {
+                'sha1': sha1,
+                'thermo': gas.thermo_model,
+                'kinetics': gas.kinetics_model,
+                'species': gas.species(),
+                'reactions': gas.reactions(),
+                'groups': species_groups(gas.species_names)}
+            # other versions of the file are not used anymore
+            for old in [k for k in _mechanisms if k[0] == path and
+                        k != key]:
+                del _mechanisms[old]
+        mech = _mechanisms[key]
+        mechanism = cantera.Solution(
+            thermo=mech['thermo'], kinetics=mech['kinetics'],
+            species=mech['species'], reactions=mech['reactions'])
+    return mechanism, mech['groups'], mech['sha1']
+
+
 @logged
 class TriangleCoal(Triangle):
     """Triangle class based on coal Van Kravelen diagram."""
@@ -163,7 +276,7 @@ class Polimi(coal.Coal, empirical_model.Model):
     # char = ['CHAR', 'CHARH', 'CHARG']
 
     # define here the modificable parameters
-    _parameters = ['mechanism']
+    _parameters = ['mechanism', 'lumped_only']
 
     def __init__(self, proximate_analysis=None, ultimate_analysis=None,
                  pressure=101325, name='Coal', **kwargs):
@@ -190,6 +303,7 @@ class Polimi(coal.Coal, empirical_model.Model):
         # this information should be setted in set_parameters
         self.mechanism = None
         self.skip = 1
+        self.lumped_only = False
         self.backend = None
         self._define_triangle()
         self.set_parameters(**kwargs)
@@ -203,6 +317,9 @@ class Polimi(coal.Coal, empirical_model.Model):
         ----------
         mechanism: string_types
             Polimi mechanism in Cantera format
+        lumped_only: bool
+            Return only the lumped yields in the results, without the
+            species mass fractions
 
         """
         for key, value in kwargs.items():
@@ -225,43 +342,34 @@ class Polimi(coal.Coal, empirical_model.Model):
     # @mechanism.setter
     # def mechanism(self, value=None):
     def _set_mechanism(self, value=None):
-        """Set mechanism. Default is COAL1207.xml."""
+        """
+        Set mechanism. Default is COAL1207.xml.
+
+        Mechanism files are read from the cache of :func:`get_mechanism`.
+        The hash of the file is stored in `mechanism_hash`, which is
+        None for mechanisms given as :class:`cantera.Solution`.
+        """
         if isinstance(value, cantera.Solution):
             self._mechanism = value
+            self.mechanism_hash = None
+            groups = species_groups(value.species_names)
         else:
             if value is None:
                 value = os.path.join(os.path.dirname(bins.__file__),
                                      'COAL1207.xml')
-            try:
-                self._mechanism = cantera.Solution(value)
-            except:
-                raise MechanismError('Cannot read {}'.format(value))
+            self._mechanism, groups, self.mechanism_hash = get_mechanism(
+                value)
         self._mechanism.TP = 300, self.pressure
 
-        self._tar = []
-        self._raw = []
-        self._metaplast = []
-        self._light_gas = []
-        self._char = []
-        self._moisture = []
-        self._ash = []
-        for sp in self._mechanism.species_names:
-            if sp.startswith('VTAR'):
-                self._tar.append(sp)
-            elif sp.startswith('G') or sp.startswith('TAR'):
-                self._metaplast.append(sp)
-            elif sp.startswith('COAL'):
-                self._raw.append(sp)
-            elif sp.startswith('CHAR'):
-                self._char.append(sp)
-            elif sp == 'ACQUA':
-                self._moisture.append(sp)
-            elif sp == 'ASH':
-                self._ash.append(sp)
-            else:
-                self._light_gas.append(sp)
-
-        self._calc_light_gas_index()
+        self._tar = list(groups['tar'])
+        self._raw = list(groups['raw'])
+        self._metaplast = list(groups['metaplast'])
+        self._light_gas = list(groups['light_gas'])
+        self._char = list(groups['char'])
+        self._moisture = list(groups['moisture'])
+        self._ash = list(groups['ash'])
+        self._light_gas_index = list(groups['light_gas_index'])
+        self._lumping = groups['lumping']
 
     mechanism = property(_get_mechanism, _set_mechanism,
                          doc='Mechanism in cantera format for Polimi')
@@ -357,18 +465,48 @@ class Polimi(coal.Coal, empirical_model.Model):
                    pressure=pressure,
                    name=c.name)
 
+    @property
+    def jacob_sparsity(self):
+        """
+        Sparsity pattern of the Jacobian from the mechanism.
+
+        The production rate of a species depends on the species which
+        are reactants of the reactions where it is involved and on the
+        temperature.
+        """
+        reactants = self.mechanism.reactant_stoich_coeffs
+        products = self.mechanism.product_stoich_coeffs
+        if callable(reactants):
+            reactants, products = reactants(), products()
+        reactants = np.asarray(reactants) != 0
+        involved = reactants | (np.asarray(products) != 0)
+        sparsity = np.dot(involved.astype(int),
+                          reactants.T.astype(int)) > 0
+        sparsity |= np.eye(len(sparsity), dtype=bool)
+        return np.hstack([sparsity, np.ones((len(sparsity), 1), dtype=bool)])
+
     def postprocess(self, t, y):
-        """Postprocess results."""
-        data = np.insert(y, 0, t, axis=1)[::self.skip]
-
-        data = pd.DataFrame(data=data,
-                            columns=['t'] + self.mechanism.species_names +
-                            ['T'])
-        for v in ('metaplast', 'char', 'raw', 'tar', 'light_gas'):
-            data[v] = data[getattr(self, v)].sum(axis=1)
-        data['solid'] = data[['metaplast', 'char', 'raw']].sum(axis=1)
-        data['volatiles'] = data[['tar', 'light_gas']].sum(axis=1)
-        return data
+        """
+        Postprocess results.
+
+        The lumped yields are calculated with the lumping matrix of the
+        species groups. If `lumped_only`, the mass fractions of the
+        species are not included in the results.
+        """
+        t, y = t[::self.skip], y[::self.skip]
+        lumped = self._lumping.T.dot(y[:, :-1].T).T
+        solid = lumped[:, :3].sum(axis=1)
+        volatiles = lumped[:, 3:].sum(axis=1)
+        if self.lumped_only:
+            blocks = [t[:, np.newaxis], y[:, -1:]]
+            columns = ['t', 'T']
+        else:
+            blocks = [t[:, np.newaxis], y]
+            columns = ['t'] + self.mechanism.species_names + ['T']
+        data = np.hstack(blocks + [lumped, solid[:, np.newaxis],
+                                   volatiles[:, np.newaxis]])
+        columns += list(lumped_groups) + ['solid', 'volatiles']
+        return pd.DataFrame(data=data, columns=columns)
 
     def get_yield(self, t, y):
         """Get the volatile yield."""
@@ -377,8 +515,3 @@ class Polimi(coal.Coal, empirical_model.Model):
     def postprocess_step(self, t, y):
         """Post process at time step of the ODE."""
         pass
-
-    def _calc_light_gas_index(self):
-        """Get the list of the index of the light gas."""
-        self._light_gas_index = [self._mechanism.species_index(sp)
-                                 for sp in self.light_gas]
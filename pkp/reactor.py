@@ -12,23 +12,93 @@ from six import string_types
 import numpy as np
 from autologging import logged
 from scipy.integrate import ode
+from scipy.integrate import RK45, RK23, DOP853, BDF, Radau, LSODA
+from scipy.integrate import solve_ivp
 import pandas as pd
+import importlib
 import warnings
-import logging
 
 # import the models that can be used in the reactor
-from .empirical_model import EmpiricalModel, SFOR, SFORT, C2SM, DAEM
+from . import empirical_model
+from .empirical_model import EmpiricalModel, SFOR, SFORT, C2SM, DAEM, BT
+from ._exceptions import PKPModelError
+from .temperature import get_profile
+
+# detailed models, they are imported only when they are used. The
+# Fortran CPD is not integrated by the reactor (see pkp.cpd_fortran)
+detailed_models = {
+    'CPD': ('.cpd', 'CPD'),
+    'Polimi': ('.polimi', 'Polimi'),
+    'BioPolimi': ('.biopolimi', 'BioPolimi')
+}
+
+
+def module_available(name):
+    """Check if a module can be imported, without importing it."""
+    try:
+        from importlib.util import find_spec
+    except ImportError:
+        # python 2
+        from pkgutil import find_loader as find_spec
+    return find_spec(name) is not None
+
+
+def get_model(name):
+    """
+    Return the class of a model from its name.
+
+    The modules of the detailed models, which depend on numba or
+    cantera, are imported only when the model is requested.
+
+    Parameters
+    ----------
+    name: str
+        Name of the empirical model (`SFOR`, `C2SM`, ...) or of the
+        detailed model (`CPD`, `Polimi`, `BioPolimi`)
+
+    Returns
+    -------
+    cls: class
+
+    """
+    if name in detailed_models:
+        module, cls = detailed_models[name]
+        return getattr(importlib.import_module(module, __package__), cls)
+    try:
+        return getattr(empirical_model, name)
+    except AttributeError:
+        raise PKPModelError('Model {} not defined'.format(name))
+
+
+def _substeps(t, dt_substep=None):
+    """
+    Divide the intervals of the output times in equal substeps.
 
-try:
-    from .polimi import Polimi
-    from .biopolimi import BioPolimi
-except ModuleNotFoundError:
-    logger = logging.getLogger('pkp.runner')
-    logger.warning(
-        'Cantera not available. Polimi and BioPolimi models cannot be used!')
+    Parameters
+    ----------
+    t: np.ndarray
+        Output times
+    dt_substep: float, default=None
+        Maximum length of the substeps. If None, the intervals are not
+        divided
 
-from .cpd import CPD
-from .interpolate import interp
+    Returns
+    -------
+    t_sub: np.ndarray
+        Times of the substeps, including the output times
+    store: np.ndarray
+        Boolean array, True for the output times
+
+    """
+    n = np.ones(len(t) - 1, dtype=int)
+    if dt_substep:
+        n = np.maximum(np.ceil(np.diff(t) / dt_substep - 1e-9), 1).astype(int)
+    t_sub = np.concatenate([t[:1]] + [
+        np.linspace(t0, t1, ni + 1)[1:]
+        for t0, t1, ni in zip(t[:-1], t[1:], n)])
+    store = np.zeros(len(t_sub), dtype=bool)
+    store[np.append(0, np.cumsum(n))] = True
+    return t_sub, store
 
 
 @logged
@@ -60,10 +130,53 @@ class Reactor(object):
 
         res = reactor.run()
 
+    The ODE system is solved by one of the backends registered in the
+    reactor (see :meth:`register_backend`), chosen with the parameter
+    `backend`::
+
+        reactor = Reactor(SFOR, backend='BDF')
+
+    The scipy integrators `dopri5`, `dop853`, `vode` (BDF method) and
+    `lsoda` and the solvers `RK45`, `RK23`, `DOP853`, `BDF`, `Radau` and
+    `LSODA` of `scipy.integrate.solve_ivp` are available. The implicit
+    solvers use the Jacobian of the model, if defined, or its sparsity
+    pattern. If Cantera is installed, the backend `cantera` integrates
+    the mechanism of Polimi with the reactor network of Cantera (see
+    :class:`CanteraBackend`).
+
+    The operating conditions can be also defined by a temperature
+    profile of :mod:`pkp.temperature`::
+
+        reactor.operating_conditions = Ramp(T0=300, T_max=1000, rate=1e4,
+                                            t_end=0.2)
+
+    Since the temperature is prescribed, it can be removed from the
+    variables integrated by the ODE solver with the parameter
+    `solve_T=False`. It is evaluated from the profile in the rates and
+    added to the results.
+
+    The time steps of the solver stored in the results are selected
+    during the integration (see :class:`Output`) with the parameters
+    `increment` (one step every `increment`), `n_output` (the first
+    step after each time of a grid of `n_output` times, with
+    `output_spacing` `linear` or `log`) and `output_tol` (the steps
+    where the solution changed more than `output_tol` from the last
+    stored step)::
+
+        reactor = Reactor(SFOR, n_output=100, output_spacing='log')
+
     """
 
     _ode_parameters = {'first_step': 1e-5, 'max_step': 1e-3}
+    # optional parameters of the ODE solver
+    _ode_optional = ('min_step', 'rtol', 'atol', 'solve_T')
+    # parameters of the output of the solver time steps
+    _output_parameters = {'n_output': None, 'output_spacing': 'linear',
+                          'output_tol': None}
     _increment = 1
+    _backend = 'dopri5'
+    _backends = {}
+    _postprocess = True
 
     def __init__(self, model=None, *args, **kwargs):
         """
@@ -77,17 +190,36 @@ class Reactor(object):
             Initial ODE time step
         max_step: double
             Maximum time step in the ODE.
+        backend: str
+            Name of the ODE solver backend. Default is dopri5.
+        increment: int
+            Store one time step of the solver every `increment`.
+        n_output: int
+            Number of times of the output grid.
+        output_spacing: str
+            Spacing of the output grid: `linear` or `log`.
+        output_tol: float
+            Store the time steps where the solution changed more than
+            `output_tol` from the last stored step.
         kwargs: additional parameters passed to the model.
 
         """
         model_parameters = {}
+        self._ode_parameters = dict(self._ode_parameters)
+        self._output_parameters = dict(self._output_parameters)
         for par, value in kwargs.items():
-            if par in self._ode_parameters:
+            if par in self._ode_parameters or par in self._ode_optional:
                 self._ode_parameters[par] = value
+            elif par in self._output_parameters:
+                self._set_output_parameter(par, value)
+            elif par == 'increment':
+                self.increment = value
+            elif par == 'backend':
+                self.backend = value
             else:
                 model_parameters[par] = value
 
-        cls = eval(model) if isinstance(model, string_types) else model
+        cls = get_model(model) if isinstance(model, string_types) else model
 
         if args:
             self._model = cls(*args)
@@ -103,39 +235,95 @@ class Reactor(object):
         Operating conditions for devolatilization. They are defined as
         list of operating points [[t0, T0], [t1, T1], ..., [tn, Tn]]
         Each operating point is defined by the time in second and
-        temperature in K.
+        temperature in K. The points define a
+        :class:`pkp.temperature.PiecewiseLinear` profile. Otherwise, a
+        :class:`pkp.temperature.TemperatureProfile` can be given, and
+        the operating conditions are its points.
         """
         return self._operating_conditions
 
     @operating_conditions.setter
     def operating_conditions(self, conditions):
         if conditions is None:
-            self.T = None
+            self._temperature = None
             self._operating_conditions = None
             return
-        if not isinstance(conditions, (np.ndarray, list)):
-            raise TypeError('Define conditions as list or numpy array')
-        elif isinstance(conditions, list):
-            conditions = np.array(conditions)
-        if not conditions.ndim == 2:
-            raise ValueError('Define conditions as array Nx2')
-        if not conditions.shape[-1] == 2:
-            raise ValueError('Define conditions as array Nx2')
-        self._operating_conditions = conditions
-
-        self._dTdt_array = (np.diff(self._operating_conditions[:, 1]) /
-                            np.diff(self._operating_conditions[:, 0]))
-
-        # def interp_tT(t):
-        #     '''Interpolate time with temperature'''
-        #     return interp(t, conditions[:, 0], conditions[:, 1])
-        # self.T = interp_tT
+        self._temperature = get_profile(conditions)
+        self._operating_conditions = self._temperature.points
+
+    @property
+    def temperature(self):
+        """Temperature profile, see :mod:`pkp.temperature`."""
+        return self._temperature
 
     @property
     def y0(self):
         """Get initial solution vector for the reactor."""
         return np.append(self._model.y0, self.operating_conditions[0, 1])
 
+    @property
+    def solve_T(self):
+        """True if the temperature is integrated by the ODE solver."""
+        return self._ode_parameters.get('solve_T', True)
+
+    def ode_y0(self):
+        """Initial solution vector of the ODE system."""
+        if self.solve_T:
+            return self.y0
+        return np.array(self._model.y0, dtype=float)
+
+    def ode_rate(self, t, z):
+        """
+        Rate of the ODE system.
+
+        If the temperature is not integrated, it is taken from the
+        profile.
+        """
+        if self.solve_T:
+            return self.rate(t, z)
+        return self._model.rate(t, np.append(z, self._temperature.T(t)))
+
+    def ode_jacobian(self):
+        """Return the Jacobian function of the ODE system."""
+        if self.solve_T or self._model.jacob is None:
+            return self.jacobian()
+
+        def jac(t, z):
+            return np.atleast_2d(self._model.jacob(
+                t, np.append(z, self._temperature.T(t))))[:, :-1]
+        return jac
+
+    def ode_jacobian_sparsity(self):
+        """Return the sparsity of the Jacobian of the ODE system."""
+        sparsity = self.jacobian_sparsity()
+        if self.solve_T or sparsity is None:
+            return sparsity
+        return sparsity[:-1, :-1]
+
+    def solution(self, t, z):
+        """
+        Return the solution vector from the ODE solution.
+
+        Parameters
+        ----------
+        t: float, np.ndarray
+            Time or array of times
+        z: np.ndarray
+            Solution of the ODE system, or array of solutions
+
+        Returns
+        -------
+        y: np.ndarray
+            Solution including the temperature
+
+        """
+        if self.solve_T:
+            return z
+        T = self._temperature.T(t)
+        if np.ndim(z) == 1:
+            return np.append(z, T)
+        return np.column_stack([z, T])
+
     def run(self, t=None, save=False, verbose=False):
         """
         Run reactor for a given time.
@@ -145,56 +333,170 @@ class Reactor(object):
         t: np.array, list, default=None
             Time array. This is used to take results from the ODE
             solver. If None times are automatically taken from
-            the solver
+            the solver and the stored steps are selected by the output
+            parameters (see :class:`Output`). If `t` is given, or the
+            model defines `dt_output`, the results are taken every
+            `increment` times, as the other output parameters do not
+            apply.
         save: Bool
             Save results in a csv file
         """
-        # backend = 'dopri5'
-
-        solver = ode(self.rate, jac=None)
-
-        t0 = self.operating_conditions[0, 0]
-        solver.set_initial_value(self.y0, t0)
-
-        # define the arguments for running the ODE solver
-        args = [solver]
-        ode_args = dict(self._ode_parameters)
-        # ode_args = {
-        #    'first_step': 1e-5,
-        #    'max_step': 1e-3,
-        # }
-        if t is None:
-            backend = 'dopri5'
-            ode_args['nsteps'] = 1
-            ode_args['verbosity'] = 2
-            ode_run = self._run_nostop
-        else:
-            # backend = 'vode'
-            backend = 'dopri5'
-            ode_run = self._run_t
-            ode_args['nsteps'] = 100000
-            # ode_args['min_step'] = 1e-13
-            args.append(t)
-
-        solver.set_integrator(backend, **ode_args)
+        backend = self._backends[self.backend]
         warnings.filterwarnings("ignore", category=UserWarning)
         if verbose:
-            self.__log.warning('ODE first step %s',
-                               solver._integrator.first_step)
-            self.__log.warning('ODE max_step %s', solver._integrator.max_step)
-            # self.__log.debug('ODE min_step', solver._integrator.min_step)
-            self.__log.warning('ODE atol %s', solver._integrator.atol)
-            self.__log.warning('ODE rtol %s', solver._integrator.rtol)
-            self.__log.warning('ODE beta %s', solver._integrator.beta)
-        t, y = ode_run(*args)
+            self.__log.warning('ODE backend %s', self.backend)
+            self.__log.warning('ODE parameters %s', self._ode_parameters)
+        dt_output = getattr(self._model, 'dt_output', None)
+        # the output selects the steps only if the times are not given
+        sliced = t is not None or bool(dt_output)
+        if t is None and dt_output:
+            # solve the ODE on the output times, divided in substeps, and
+            # post process after
+            t0, time_end = self.operating_conditions[[0, -1], 0]
+            t, store = _substeps(
+                np.append(np.arange(t0, time_end, dt_output), time_end),
+                getattr(self._model, 'dt_substep', None))
+            self._postprocess = False
+            try:
+                t, y = backend.run(self, t)
+            finally:
+                self._postprocess = True
+            y = self.solution(t, y)
+            self._model.postprocess_steps(t[1:], y[1:], store[1:])
+            t, y = t[store], y[store]
+        else:
+            t, y = backend.run(self, t)
+            y = self.solution(t, y)
         warnings.resetwarnings()
 
         # return t, np.squeeze(y)
         res = self.model.postprocess(t, y)
         if save and isinstance(res, pd.DataFrame):
             res.set_index('t').to_csv(self.model._out_csv)
+        if not sliced:
+            return res
+        if isinstance(res, tuple):
+            return tuple(r[::self.increment] for r in res)
         return res[::self.increment]
 
+    def output(self):
+        """
+        Return the output of the ODE solution.
+
+        Returns
+        -------
+        output: Output
+            Output, initialized with the initial time and solution
+
+        """
+        return Output(self, self.operating_conditions[0, 0], self.ode_y0())
+
+    def run_sensitivity(self, t, scale=None, method='RK45'):
+        r"""
+        Run the reactor integrating the forward sensitivities.
+
+        The sensitivities :math:`S = \partial y / \partial p` of the
+        solution respect to the model parameters are integrated together
+        with the model:
+
+        .. math::
+            dS/dt = J_y S + J_p
+
+        where :math:`J_y` and :math:`J_p` are the Jacobian of the rates
+        with respect to the solution (`jacob`) and to the parameters
+        (`jacob_parameters`) of the model. The temperature does not
+        depend on the parameters.
+
+        Parameters
+        ----------
+        t: np.array, list
+            Output times, larger than the initial time of the operating
+            conditions
+        scale: np.array, default=None
+            Derivatives of the parameters respect to the variables used
+            for the sensitivities. For example, using the derivatives
+            of the unscaled parameters, the sensitivities are calculated
+            respect to the normalized parameters.
+        method: str, default='RK45'
+            Method of `scipy.integrate.solve_ivp`
+
+        Returns
+        -------
+        t: np.ndarray
+            Times
+        y: np.ndarray
+            Solution, including the temperature
+        S: np.ndarray
+            Sensitivities with shape (len(t), len(y0) - 1, n_parameters)
+
+        """
+        model = self._model
+        if model.jacob is None or model.jacob_parameters is None:
+            raise NotImplementedError(
+                'Sensitivities not available for {}'.format(
+                    model.__class__.__name__))
+        t = np.asarray(t, dtype=float)
+        n = len(self.y0)
+        n_p = len(model.parameters_list)
+        scale = np.ones(n_p) if scale is None else np.asarray(scale)
+
+        def rate(ti, z):
+            y, S = z[:n], z[n:].reshape(n - 1, n_p)
+            dSdt = (np.dot(np.atleast_2d(model.jacob(ti, y))[:, :-1], S) +
+                    np.atleast_2d(model.jacob_parameters(ti, y)) * scale)
+            return np.concatenate([self.rate(ti, y), dSdt.ravel()])
+
+        options = dict(IVPBackend._tolerances)
+        options.update({key: value
+                        for key, value in self._ode_parameters.items()
+                        if key in ('first_step', 'max_step', 'rtol', 'atol')})
+        sol = solve_ivp(rate, (self.operating_conditions[0, 0], t[-1]),
+                        np.append(self.y0, np.zeros((n - 1) * n_p)),
+                        method=method, t_eval=t, **options)
+        if not sol.success:
+            raise RuntimeError(sol.message)
+        z = sol.y.T
+        return sol.t, z[:, :n], z[:, n:].reshape(len(sol.t), n - 1, n_p)
+
+    @classmethod
+    def register_backend(cls, name, backend):
+        """
+        Register an ODE solver backend.
+
+        Parameters
+        ----------
+        name: str
+            Name of the backend, used for the parameter `backend`
+        backend: object
+            Backend object. It has to provide the method
+            `run(reactor, t)`, which solves the ODE system defined by
+            `reactor.ode_rate`, `reactor.ode_y0` and
+            `reactor.ode_jacobian` and returns the arrays of times and
+            solutions. If `t` is None, each time step is passed to
+            the :class:`Output` of :meth:`output`, otherwise
+            `reactor.postprocess_step` is called at each time of `t`.
+
+        """
+        cls._backends[name] = backend
+
+    @classmethod
+    def backends(cls):
+        """Return the names of the available backends."""
+        return list(cls._backends)
+
+    @property
+    def backend(self):
+        """Name of the ODE solver backend."""
+        return self._backend
+
+    @backend.setter
+    def backend(self, value):
+        if value not in self._backends:
+            raise ValueError(
+                'Backend {} not available. Use one of {}'.format(
+                    value, ', '.join(sorted(self._backends))))
+        self._backend = value
+
     @property
     def increment(self):
         """Increment in the time step output."""
@@ -208,80 +510,96 @@ class Reactor(object):
             raise ValueError('Define increment as integer > 1')
         self._increment = value
 
+    @property
+    def output_parameters(self):
+        """Parameters of the output of the solver time steps."""
+        return self._output_parameters
+
+    def _set_output_parameter(self, key, value):
+        if value is None:
+            pass
+        elif key == 'n_output':
+            if not isinstance(value, int):
+                raise TypeError('Define n_output as integer > 1')
+            if value < 2:
+                raise ValueError('Define n_output as integer > 1')
+        elif key == 'output_spacing':
+            if value not in ('linear', 'log'):
+                raise ValueError('Define output_spacing as linear or log')
+        elif key == 'output_tol':
+            if value <= 0:
+                raise ValueError('Define output_tol > 0')
+        self._output_parameters[key] = value
+
     def rate(self, t, y):
         """Rate for the ode integral."""
         dydt = self._model.rate(t, y)
         return np.concatenate([dydt, [self._dTdt(t, y, dydt)]])
 
-    def _run_nostop(self, solver):
+    def postprocess_step(self, t, y):
         """
-        Run ODE solver with dense output.
+        Post process the model after a time step of the ODE solver.
 
-        _Parameters
+        The post processing is skipped when it is done on the output
+        times after the solution of the ODE (see `dt_output` of the
+        model).
+
+        Parameters
         ----------
-        solver: scipy.integrate.ode
+        t: float
+            Time
+        y: np.ndarray
+            Solution of the ODE system
 
-        Returns
-        -------
-        t, y: np.ndarray
-            Time and yields arrays.
+        """
+        if self._postprocess:
+            self._model.postprocess_step(t, self.solution(t, y))
 
+    def jacobian(self):
         """
-        solver._integrator.iwork[2] = -1
-        warnings.filterwarnings("ignore", category=UserWarning)
-        time_end = self.operating_conditions[-1, 0]
+        Return the Jacobian function of the ODE system.
 
-        t = [0]
-        y = [np.array(self.y0)]
-        while solver.t < time_end:
-            solver.integrate(time_end, step=True)
-            # print(solver.t, solver.y, self.rate(
-            #     solver.t, solver.y), self.parameters.y0 - solver.y[0])
-            self.model.postprocess_step(solver.t, solver.y)
-            # print(solver.t, solver.y)
-            t.append(solver.t)
-            y.append(solver.y)
+        The Jacobian of the model rates with respect to the solution
+        vector (including the temperature) is completed with the
+        temperature row, which is zero for prescribed temperature.
 
-        return np.array(t), np.array(y)
+        Returns
+        -------
+        jac: callable, None
+            Jacobian function `jac(t, y)` or None if the model does not
+            define `jacob`
 
-    def _run_t(self, solver, t):
         """
-        Run the ODE solver stopping at the prescribed time steps.
+        if self._model.jacob is None:
+            return None
 
-        _Parameters
-        ----------
-        solver: scipy.integrate.ode
+        def jac(t, y):
+            J = np.zeros((len(y), len(y)))
+            J[:-1] = self._model.jacob(t, y)
+            return J
+        return jac
+
+    def jacobian_sparsity(self):
+        """
+        Return the sparsity pattern of the Jacobian of the ODE system.
 
         Returns
         -------
-        t, y: np.ndarray
-            Time and yields arrays.
+        sparsity: np.ndarray, None
+            Boolean array or None if the model does not define
+            `jacob_sparsity`
 
         """
-        # self.__log.info('Solver backend %s', solver)
-        y = []
-        t_calc = []
-        for ti in t:
-            solver.integrate(ti)
-            y.append(solver.y)
-            t_calc.append(solver.t)
-            self.model.postprocess_step(solver.t, solver.y)
-            # print(solver.t)
-
-        # if not np.allclose(t, t_calc):
-        if not np.allclose(t, t_calc):
-            raise RuntimeError('t and t_calc not the same!')
-
-        return np.array(t_calc), np.array(y)
+        sparsity = getattr(self._model, 'jacob_sparsity', None)
+        if sparsity is None:
+            return None
+        n = len(self.y0)
+        S = np.zeros((n, n), dtype=bool)
+        S[:-1] = sparsity
+        return S
 
     def _dTdt(self, t, y, dydt):
-        t_array = self.operating_conditions[:, 0]
-        if t < t_array[0] or t >= t_array[-1]:
-            return 0.0
-        index = next(
-            (idx for idx, val in np.ndenumerate(t_array) if val > t))[0]
-
-        return self._dTdt_array[index - 1]
+        return self._temperature.dTdt(t)
 
     @property
     def model(self):
@@ -302,7 +620,8 @@ class Reactor(object):
         """
         Set the parameters.
 
-        Keep the old values constant.
+        Keep the old values constant. Reactor parameters are the ODE
+        parameters, the output parameters, `increment` and `backend`.
 
         Example
         -------
@@ -317,10 +636,14 @@ class Reactor(object):
         for key, value in kwargs.items():
             if key in model_parameters:
                 model_parameters[key] = value
-            elif key in self._ode_parameters:
+            elif key in self._ode_parameters or key in self._ode_optional:
                 self._ode_parameters[key] = value
+            elif key in self._output_parameters:
+                self._set_output_parameter(key, value)
             elif key == 'increment':
                 self.increment = value
+            elif key == 'backend':
+                self.backend = value
 
         self._model.set_parameters(**model_parameters)
 
@@ -363,16 +686,29 @@ class DTR(Reactor):
         self.h = 2000
         self.h_pyro = 0
 
+    def jacobian(self):
+        """The particle heat transfer is not included in the Jacobian."""
+        return None
+
     def calc_mass(self, y):
         """Calc mass of the particle for the given volatile yield y."""
         return self.mash + (1 - y) * self.mdaf
 
+    @property
+    def solve_T(self):
+        """The particle temperature is always integrated."""
+        return True
+
+    def Tg(self, t):
+        """Gas temperature."""
+        return self._temperature.T(t)
+
     def run(self, t=None):
         res = super(DTR, self).run(t=t)
         # evaluate the gas temperature
         is_tuple = isinstance(res, tuple)
         t = res[0] if is_tuple else res['t']
-        Tg = np.array([self.Tg(ti) for ti in t])
+        Tg = self.Tg(np.asarray(t))
         if is_tuple:
             y = np.insert(res[1], res[1].shape[1], Tg, axis=1)
             res = (t, y)
@@ -380,43 +716,6 @@ class DTR(Reactor):
             res['Tg'] = Tg
         return res
 
-    @property
-    def operating_conditions(self):
-        """
-        Operating conditions for devolatilization.
-
-        They are defined as
-        list of operating points [[t0, T0], [t1, T1], ..., [tn, Tn]]
-        Each operating point is defined by the time in second and
-        temperature in K.
-        """
-        return self._operating_conditions
-
-    @operating_conditions.setter
-    def operating_conditions(self, conditions):
-        if conditions is None:
-            self.T = None
-            self._operating_conditions = None
-            return
-        if not isinstance(conditions, (np.ndarray, list)):
-            raise TypeError('Define conditions as list or numpy array')
-        elif isinstance(conditions, list):
-            conditions = np.array(conditions)
-        if not conditions.ndim == 2:
-            raise ValueError('Define conditions as array Nx2')
-        if not conditions.shape[-1] == 2:
-            raise ValueError('Define conditions as array Nx2')
-        self._operating_conditions = conditions
-
-        self._dTdt_array = (np.diff(self._operating_conditions[:, 1]) /
-                            np.diff(self._operating_conditions[:, 0]))
-
-        def interp_tT(t):
-            """Interpolate time with temperature."""
-            return interp(t, conditions[:, 0], conditions[:, 1])
-
-        self.Tg = interp_tT
-
     def _dTdt(self, t, yt, dydt):
         """Temperature time derivative."""
         # TODO y is not the correct volatile yield
@@ -459,3 +758,466 @@ class DTR(Reactor):
             self._T0 = 300
         else:
             self._T0 = value
+
+
+class Output(object):
+    """
+    Output of the ODE solution.
+
+    The time steps of the solver are passed to :meth:`append` during the
+    integration. The model is post processed at every step, but only the
+    steps selected by the output parameters of the reactor are stored:
+
+    * `increment`: one step every `increment`
+    * `n_output`: the first step after each time of a grid of
+      `n_output` times between the initial and the final time of the
+      operating conditions, with `output_spacing` `linear` or `log`.
+      The log grid starts from `first_step`.
+    * `output_tol`: the steps where a variable changed from the last
+      stored step more than `output_tol` times its magnitude (or
+      `output_tol` for magnitudes lower than one)
+
+    A step is stored if it is selected by any of the parameters.
+    The initial solution is always stored and, with `n_output` or
+    `output_tol`, also the final one. The steps not stored are
+    discarded from the model (see
+    :meth:`pkp.empirical_model.Model.discard_step`).
+    """
+
+    def __init__(self, reactor, t0, z0):
+        """
+        Init the output.
+
+        Parameters
+        ----------
+        reactor: Reactor
+        t0: float
+            Initial time
+        z0: np.ndarray
+            Initial solution of the ODE system
+
+        """
+        self.reactor = reactor
+        self.t = [t0]
+        self.z = [np.array(z0, dtype=float)]
+        self._step = 0
+        self._last = None
+        parameters = reactor.output_parameters
+        self._increment = reactor.increment
+        self._tol = parameters['output_tol']
+        self._grid = None
+        if parameters['n_output']:
+            n = parameters['n_output']
+            t_end = reactor.operating_conditions[-1, 0]
+            if parameters['output_spacing'] == 'log':
+                first_step = reactor.reactor_parameters['first_step']
+                grid = t0 + np.geomspace(first_step, t_end - t0, n - 1)
+            else:
+                grid = np.linspace(t0, t_end, n)[1:]
+            self._grid = grid.tolist()
+            self._i_grid = 0
+        # store every step if no parameter selects them
+        self._all = (self._increment == 1 and self._tol is None and
+                     self._grid is None)
+
+    @property
+    def grid(self):
+        """Times of the output grid after the initial time, or None."""
+        return self._grid
+
+    def _select(self, t, z):
+        """Return True if the step has to be stored."""
+        selected = self._increment > 1 and self._step % self._increment == 0
+        if self._grid is not None:
+            grid = self._grid
+            while self._i_grid < len(grid) and t >= grid[self._i_grid]:
+                selected = True
+                self._i_grid += 1
+        if self._tol is not None and not selected:
+            z_ref = self.z[-1]
+            selected = np.any(np.abs(z - z_ref) >
+                              self._tol * np.maximum(np.abs(z_ref), 1))
+        return selected
+
+    def append(self, t, z):
+        """
+        Post process a time step of the solver and store it if selected.
+
+        Parameters
+        ----------
+        t: float
+            Time
+        z: np.ndarray
+            Solution of the ODE system
+
+        """
+        self.reactor.postprocess_step(t, z)
+        self._step += 1
+        if self._all or self._select(t, z):
+            self.t.append(t)
+            self.z.append(np.array(z, dtype=float))
+            self._last = None
+        else:
+            self.reactor.model.discard_step()
+            self._last = (t, np.array(z, dtype=float))
+
+    def result(self):
+        """
+        Return the stored times and solutions.
+
+        Returns
+        -------
+        t, z: np.ndarray
+            Time and solution arrays
+
+        """
+        if self._last is not None and (self._grid is not None or
+                                       self._tol is not None):
+            self.t.append(self._last[0])
+            self.z.append(self._last[1])
+            self._last = None
+        return np.array(self.t), np.array(self.z)
+
+
+@logged
+class ODEBackend(object):
+    """
+    Backend based on the integrators of :class:`scipy.integrate.ode`.
+
+    If times are not given, the solution is stored at every internal
+    time step of the integrator.
+    """
+
+    # parameters accepted by the integrators
+    _parameters = {
+        'dopri5': ('first_step', 'max_step', 'rtol', 'atol'),
+        'dop853': ('first_step', 'max_step', 'rtol', 'atol'),
+        'vode': ('first_step', 'min_step', 'max_step', 'rtol', 'atol'),
+        'lsoda': ('first_step', 'min_step', 'max_step', 'rtol', 'atol')
+    }
+
+    def __init__(self, integrator, **options):
+        """
+        Init backend.
+
+        Parameters
+        ----------
+        integrator: str
+            Name of the scipy integrator
+        options:
+            Additional options passed to the integrator
+
+        """
+        self.integrator = integrator
+        self.options = options
+
+    def run(self, reactor, t=None):
+        """
+        Solve the ODE system of the reactor.
+
+        Parameters
+        ----------
+        reactor: Reactor
+        t: np.array, list, default=None
+            Output times.
+
+        Returns
+        -------
+        t, y: np.ndarray
+            Time and solution arrays.
+
+        """
+        jac = reactor.ode_jacobian()
+        solver = ode(reactor.ode_rate, jac=jac)
+        solver.set_initial_value(reactor.ode_y0(),
+                                 reactor.operating_conditions[0, 0])
+        ode_args = {key: value
+                    for key, value in reactor.reactor_parameters.items()
+                    if key in self._parameters[self.integrator]}
+        ode_args.update(self.options)
+        if self.integrator == 'vode':
+            ode_args['with_jacobian'] = True
+        dense = self.integrator in ('dopri5', 'dop853')
+        if t is None and dense:
+            # one step for each call of integrate
+            ode_args['nsteps'] = 1
+            ode_args['verbosity'] = 2
+            solver.set_integrator(self.integrator, **ode_args)
+            solver._integrator.iwork[2] = -1
+            return self._run_nostop(reactor, solver, step=False)
+        ode_args['nsteps'] = 100000
+        solver.set_integrator(self.integrator, **ode_args)
+        if t is None:
+            if solver._integrator.supports_step:
+                return self._run_nostop(reactor, solver, step=True)
+            # store the solution every max_step
+            t0, time_end = reactor.operating_conditions[[0, -1], 0]
+            t = np.append(np.arange(t0, time_end,
+                                    reactor.reactor_parameters['max_step']),
+                          time_end)
+        return self._run_t(reactor, solver, t)
+
+    @staticmethod
+    def _run_nostop(reactor, solver, step):
+        """
+        Run ODE solver with dense output.
+
+        _Parameters
+        ----------
+        reactor: Reactor
+        solver: scipy.integrate.ode
+        step: bool
+            Use the step mode of the integrator
+
+        Returns
+        -------
+        t, y: np.ndarray
+            Time and yields arrays.
+
+        """
+        time_end = reactor.operating_conditions[-1, 0]
+
+        output = reactor.output()
+        while solver.t < time_end:
+            solver.integrate(time_end, step=step)
+            output.append(solver.t, solver.y)
+
+        return output.result()
+
+    @staticmethod
+    def _run_t(reactor, solver, t):
+        """
+        Run the ODE solver stopping at the prescribed time steps.
+
+        _Parameters
+        ----------
+        reactor: Reactor
+        solver: scipy.integrate.ode
+        t: np.array, list
+
+        Returns
+        -------
+        t, y: np.ndarray
+            Time and yields arrays.
+
+        """
+        y = []
+        t_calc = []
+        for ti in t:
+            if ti != solver.t:
+                solver.integrate(ti)
+            y.append(solver.y)
+            t_calc.append(solver.t)
+            reactor.postprocess_step(solver.t, solver.y)
+
+        if not np.allclose(t, t_calc):
+            raise RuntimeError('t and t_calc not the same!')
+
+        return np.array(t_calc), np.array(y)
+
+
+@logged
+class IVPBackend(object):
+    """
+    Backend based on the solvers of :func:`scipy.integrate.solve_ivp`.
+
+    The solver is advanced step by step, therefore the model is
+    post processed as with :class:`ODEBackend`. The solution at the
+    requested times is taken from the dense output of each step.
+    """
+
+    _solvers = {'RK45': RK45, 'RK23': RK23, 'DOP853': DOP853,
+                'BDF': BDF, 'Radau': Radau, 'LSODA': LSODA}
+    _parameters = ('first_step', 'max_step', 'rtol', 'atol')
+    # same tolerances of scipy.integrate.ode
+    _tolerances = {'rtol': 1e-6, 'atol': 1e-12}
+
+    def __init__(self, method, **options):
+        """
+        Init backend.
+
+        Parameters
+        ----------
+        method: str
+            Name of the solver: RK45, RK23, DOP853, BDF, Radau, LSODA
+        options:
+            Additional options passed to the solver
+
+        """
+        self.method = method
+        self.options = options
+
+    @property
+    def implicit(self):
+        """Return True if the solver uses the Jacobian."""
+        return self.method in ('BDF', 'Radau', 'LSODA')
+
+    def run(self, reactor, t=None):
+        """
+        Solve the ODE system of the reactor.
+
+        Parameters
+        ----------
+        reactor: Reactor
+        t: np.array, list, default=None
+            Output times.
+
+        Returns
+        -------
+        t, y: np.ndarray
+            Time and solution arrays.
+
+        """
+        t0 = reactor.operating_conditions[0, 0]
+        t_end = reactor.operating_conditions[-1, 0] if t is None else t[-1]
+        y0 = np.array(reactor.ode_y0(), dtype=float)
+        options = dict(self._tolerances)
+        options.update({key: value
+                        for key, value in reactor.reactor_parameters.items()
+                        if key in self._parameters})
+        if self.method == 'LSODA' and 'min_step' in reactor.reactor_parameters:
+            options['min_step'] = reactor.reactor_parameters['min_step']
+        if self.implicit:
+            jac = reactor.ode_jacobian()
+            if jac is not None:
+                options['jac'] = jac
+            elif self.method != 'LSODA':
+                options['jac_sparsity'] = reactor.ode_jacobian_sparsity()
+        options.update(self.options)
+        solver = self._solvers[self.method](
+            reactor.ode_rate, t0, y0, t_end, **options)
+
+        if t is None:
+            output = reactor.output()
+            while solver.status == 'running':
+                self._step(solver)
+                output.append(solver.t, solver.y)
+            return output.result()
+
+        t = np.asarray(t, dtype=float)
+        y = np.empty((len(t), len(y0)))
+        i = 0
+        while i < len(t):
+            if t[i] <= solver.t:
+                y[i] = (y0 if solver.t == t0 else
+                        solver.y if t[i] == solver.t else
+                        solver.dense_output()(t[i]))
+                reactor.postprocess_step(t[i], y[i])
+                i += 1
+            else:
+                self._step(solver)
+        return t, y
+
+    @staticmethod
+    def _step(solver):
+        """Advance the solver of one step."""
+        message = solver.step()
+        if solver.status == 'failed':
+            raise RuntimeError('ODE solver failed: {}'.format(message))
+
+
+@logged
+class CanteraBackend(object):
+    """
+    Backend based on the reactor network of Cantera.
+
+    The mechanism of the model (:class:`pkp.polimi.Polimi` and
+    :class:`pkp.biopolimi.BioPolimi`) is integrated in a constant
+    pressure reactor by the CVODES solver of Cantera, which evaluates
+    the production rates and the Jacobian in compiled code. The energy
+    equation of the reactor is replaced by the prescribed temperature
+    profile.
+
+    If times are not given, the solution is stored on the output grid
+    of the reactor (see :class:`Output`), or every `max_step`.
+    """
+
+    _parameters = ('rtol', 'atol', 'max_step')
+
+    def run(self, reactor, t=None):
+        """
+        Solve the ODE system of the reactor.
+
+        Parameters
+        ----------
+        reactor: Reactor
+        t: np.array, list, default=None
+            Output times.
+
+        Returns
+        -------
+        t, y: np.ndarray
+            Time and solution arrays.
+
+        """
+        import cantera
+        model = reactor.model
+        mechanism = getattr(model, 'mechanism', None)
+        if not isinstance(mechanism, cantera.Solution) or isinstance(
+                reactor, DTR):
+            raise PKPModelError(
+                'Backend cantera can be used only for models with a '
+                'cantera mechanism in a reactor with prescribed '
+                'temperature')
+        profile = reactor.temperature
+
+        class PrescribedTemperatureReactor(
+                cantera.ExtensibleIdealGasConstPressureReactor):
+            """Constant pressure reactor with prescribed temperature."""
+
+            def after_eval(self, t, *args):
+                # the state is (mass, T, Y). The arguments are LHS and
+                # RHS of the equations (Cantera >= 3.0) or ydot
+                if len(args) == 2:
+                    LHS, RHS = args
+                    LHS[1] = 1
+                    RHS[1] = profile.dTdt(t)
+                else:
+                    args[0][1] = profile.dTdt(t)
+
+        y0 = reactor.y0
+        mechanism.TPY = y0[-1], model.pressure, y0[:-1]
+        r = PrescribedTemperatureReactor(mechanism)
+        net = cantera.ReactorNet([r])
+        parameters = reactor.reactor_parameters
+        for key in self._parameters:
+            if key in parameters:
+                setattr(net, key if key != 'max_step' else 'max_time_step',
+                        parameters[key])
+
+        def state():
+            if reactor.solve_T:
+                return np.append(r.thermo.Y, r.thermo.T)
+            return r.thermo.Y
+
+        t0 = reactor.operating_conditions[0, 0]
+        net.initial_time = t0
+        if t is not None:
+            t = np.asarray(t, dtype=float)
+            y = []
+            for ti in t:
+                if ti > net.time:
+                    net.advance(ti)
+                y.append(state())
+                reactor.postprocess_step(ti, y[-1])
+            return t, np.array(y)
+
+        output = reactor.output()
+        grid = output.grid
+        if grid is None:
+            t_end = reactor.operating_conditions[-1, 0]
+            grid = np.append(np.arange(t0, t_end, parameters['max_step']),
+                             t_end)[1:]
+        for ti in grid:
+            net.advance(ti)
+            output.append(ti, state())
+        return output.result()
+
+
+for _integrator in ('dopri5', 'dop853', 'lsoda'):
+    Reactor.register_backend(_integrator, ODEBackend(_integrator))
+Reactor.register_backend('vode', ODEBackend('vode', method='bdf'))
+for _method in IVPBackend._solvers:
+    Reactor.register_backend(_method, IVPBackend(_method))
+if module_available('cantera'):
+    Reactor.register_backend('cantera', CanteraBackend())
@@ -7,7 +7,9 @@ calculations with PKP.
 Contains
 --------
 * :class:`pkp.PKPRunner`
+* :class:`pkp.PKPCampaign`
 * :class:`pkp.ReadConfiguration`
+* :class:`pkp.ResultsCache`
 """
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
@@ -28,48 +30,58 @@ except:
         import yaml
 
 import os
+import json
+import hashlib
+import multiprocessing
 import numpy as np
 import pandas as pd
 
-# detailed models
-# they must be loaded here if you want to use them!
-from .cpd import CPD
-# from cpd import CPD
-# from .cpd_fortran import CPD as CPDfortran
-
-try:
-    from .polimi import Polimi
-    from .biopolimi import BioPolimi
-    models = ['CPD', 'CPDfortran', 'Polimi', 'BioPolimi']
-except ModuleNotFoundError:
-    logger = logging.getLogger('pkp.runner')
-    logger.warning(
-        'Cantera not available. Polimi and BioPolimi models cannot be used!')
-    models = ['CPD', 'CPDfortran']
-
 # optimization
+from . import algorithms
 from . import evolution
 from . import minimize
 from . import coal
 from . import reactor
 from . import empirical_model
 from . import __version__
+from .store import get_store, NpzStore
 from ._exceptions import (PKPKeyError, PKPModelError, PKPMethodError,
                           PKPParametersError)
 
-import matplotlib
-# Force matplotlib to not use any Xwindows backend.
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-try:
-    plt.style.use('newstyle')
-    plt.rcParams['font.size'] = 10
-except:
-    pass
+# detailed models, they are imported by the reactor when they are run
+if reactor.module_available('cantera'):
+    models = ['CPD', 'CPDfortran', 'Polimi', 'BioPolimi']
+else:
+    logger = logging.getLogger('pkp.runner')
+    logger.warning(
+        'Cantera not available. Polimi and BioPolimi models cannot be used!')
+    models = ['CPD', 'CPDfortran']
 
-colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
 col_right = "#C54E6D"
 col_left = "#009380"
+_plt = None
+
+
+def _pyplot():
+    """
+    Return matplotlib.pyplot.
+
+    matplotlib is imported when the first plot is done, with the Agg
+    backend.
+    """
+    global _plt
+    if _plt is None:
+        import matplotlib
+        # Force matplotlib to not use any Xwindows backend.
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        try:
+            plt.style.use('newstyle')
+            plt.rcParams['font.size'] = 10
+        except:
+            pass
+        _plt = plt
+    return _plt
 
 
 def ndarray_representer(dumper, data):
@@ -110,6 +122,167 @@ def runs_iterator(op_cond):
         yield i - 1
 
 
+def _jsonable(value):
+    """Convert the values of the settings for hashing them with json."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    elif isinstance(value, np.generic):
+        return value.item()
+    # objects (i.e. cantera mechanisms) are identified by their type,
+    # the mechanisms by the hash of their file (see `run_detailed_model`)
+    return type(value).__name__
+
+
+@logged
+class ResultsCache(NpzStore):
+    """
+    Content-addressed cache of the results of the detailed models.
+
+    The results are stored in the directory `path` as compressed numpy
+    archives (see :class:`pkp.store.NpzStore`), named with the SHA1 hash
+    of the settings of the simulation (see :meth:`key`).
+    """
+
+    def __init__(self, path):
+        """
+        Init the cache.
+
+        Parameters
+        ----------
+        path: str
+            Directory of the cache
+
+        """
+        super(ResultsCache, self).__init__(path)
+
+    @staticmethod
+    def key(**settings):
+        """Return the SHA1 hash of the settings."""
+        return hashlib.sha1(json.dumps(
+            settings, sort_keys=True, default=_jsonable).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Load the results.
+
+        Returns
+        -------
+        res: pd.DataFrame
+            Results DataFrame or None if the results are not stored
+
+        """
+        filename = self._filename(key)
+        if not os.path.exists(filename):
+            return None
+        self.__log.debug('Load results from %s', filename)
+        return self._read(key)
+
+    def save(self, key, results):
+        """Store the results DataFrame."""
+        if results.values.dtype == object:
+            self.__log.warning('Results with non numeric columns are not '
+                               'cached')
+            return
+        self.write(key, results)
+        self.__log.debug('Save results to %s', self._filename(key))
+
+
+def run_detailed_model(task):
+    """
+    Run a single simulation of a detailed model.
+
+    The function is defined at module level for running the simulations
+    in the worker processes of a pool.
+
+    Parameters
+    ----------
+    task: dict
+        Dictionary with the keys `model`, `model_settings`,
+        `coal_settings` (ultimate and proximate analysis, pressure and
+        name of the coal), `operating_conditions`, `basename`,
+        `results_dir` and `cache_dir`. If `cache_dir` is not None, the
+        results are taken from the :class:`ResultsCache`, if available,
+        otherwise they are stored in it. The mechanisms of the Polimi
+        models are identified in the cache by the hash of their file,
+        the results of mechanisms given as objects are not cached. The
+        results are not exported, see :meth:`PKPRunner.run_model`.
+        `CPDfortran` is run by the Fortran solver (see
+        :mod:`pkp.cpd_fortran`), the other models by the reactor.
+
+    Returns
+    -------
+    res: pd.DataFrame
+        Results DataFrame
+
+    """
+    if task['model'] == 'CPDfortran':
+        run = _cpd_fortran(task)
+        settings = {'model_parameters': run.get_parameters()}
+    else:
+        run = reactor.Reactor(task['model'], **task['coal_settings'])
+        # TODO change path from detailed model to reactor
+        run.model.basename = task['basename']
+        run.model.path = task['results_dir']
+        run.set_parameters(**task['model_settings'])
+        run.operating_conditions = task['operating_conditions']
+        settings = {'model_parameters': run.model_parameters,
+                    'reactor_parameters': run.reactor_parameters,
+                    'output_parameters': run.output_parameters,
+                    'increment': run.increment,
+                    'backend': run.backend}
+        if hasattr(run.model, 'mechanism_hash'):
+            settings['mechanism_hash'] = run.model.mechanism_hash
+
+    cache_dir = task.get('cache_dir')
+    if cache_dir is None or ('mechanism_hash' in settings and
+                             settings['mechanism_hash'] is None):
+        res = run.run()
+    else:
+        cache = ResultsCache(cache_dir)
+        key = cache.key(
+            version=__version__,
+            model=task['model'],
+            coal_settings=task['coal_settings'],
+            model_settings={k: v for k, v in task['model_settings'].items()
+                            if k not in ('fit', 'active')},
+            operating_conditions=task['operating_conditions'],
+            **settings)
+        res = cache.load(key)
+        if res is None:
+            res = run.run()
+            cache.save(key, res)
+    return res
+
+
+def _cpd_fortran(task):
+    """
+    Return the Fortran CPD model of a task of :func:`run_detailed_model`.
+
+    The CPD parameters of the model settings are set as in the Python
+    CPD, while `dt`, `increment`, `dt_max`, `nmax` and `solver` are the
+    options of the Fortran solver.
+
+    Returns
+    -------
+    model: pkp.cpd_fortran.CPD
+
+    """
+    from .cpd_fortran import CPD
+    settings = task['model_settings']
+    model = CPD(**task['coal_settings'])
+    model.path = task['results_dir']
+    model.basename = task['basename']
+    model.set_parameters(**{key: value for key, value in settings.items()
+                            if key in model.get_parameters()})
+    model.dt = settings['dt']
+    model.dt_max = settings['dt_max']
+    model.increment = settings.get('increment', 1)
+    model.nmax = settings.get('nmax', model.n_frag)
+    model.solver = settings.get('solver')
+    model.operating_conditions = np.array(task['operating_conditions'])
+    return model
+
+
 @logged
 class ReadConfiguration(coal.Coal):
     """Read configuration file for PKP."""
@@ -178,8 +351,20 @@ class PKPRunner(ReadConfiguration):
     """
 
     models = models
-
-    def run(self, results_dir=None, n_p=1, run_only=False):
+    # pool of n_p workers shared by the calibrations
+    _pool = None
+    _n_p = 1
+    _resume = False
+    # cache of the detailed models results (see run)
+    _cache = True
+    _cache_dir = None
+    # store of the results (see run)
+    _store = None
+    _store_backend = 'auto'
+    _csv = False
+
+    def run(self, results_dir=None, n_p=1, run_only=False, resume=False,
+            cache=True, store='auto', csv=False):
         """
         Run detailed models and fit them.
 
@@ -190,6 +375,22 @@ class PKPRunner(ReadConfiguration):
             used the directory from where PKP is launched.
         np: int, default=1
             Number of processors for evolution fitting
+        resume: bool, default=False
+            Resume the evolutions from the checkpoints stored in
+            `results_dir`
+        cache: bool, str, default=True
+            Reuse the results of the detailed models stored in the
+            :class:`ResultsCache`. If True the cache is stored in the
+            directory `cache` of `results_dir`, if str it is the path
+            of the cache directory. If False, the detailed models are
+            always run.
+        store: str, default='auto'
+            Backend of the results store (see :func:`pkp.store.get_store`),
+            where the results of the detailed models and of the
+            calibrations are saved.
+        csv: bool, default=False
+            Export also the results of each run of the detailed models
+            in csv files
 
         Returns
         -------
@@ -199,8 +400,61 @@ class PKPRunner(ReadConfiguration):
             Dictionary with the results of the calibration of the
             empirical models.
 
+        Note
+        ----
+        If `n_p > 1`, a pool of `n_p` workers is created at the
+        beginning and it is used for running the detailed models and
+        for all the calibrations.
+
         """
+        if n_p > 1:
+            self._pool = multiprocessing.Pool(processes=n_p)
+            self._n_p = n_p
+        self._set_options(resume=resume, cache=cache, store=store, csv=csv)
+        try:
+            return self._run(results_dir, n_p, run_only)
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+                self._n_p = 1
+            self._resume = False
+
+    def _set_options(self, resume=False, cache=True, store='auto',
+                     csv=False):
+        """Set the options of the run (see :meth:`run`)."""
+        self._resume = resume
+        self._cache = cache
+        self._store_backend = store
+        self._csv = csv
+
+    def _setup(self, results_dir):
+        """Set the results directory, the cache and the store."""
         results_dir = self.set_results_dir(results_dir)
+        if self._cache is True:
+            self._cache_dir = os.path.join(results_dir, 'cache')
+        elif self._cache:
+            self._cache_dir = self._cache
+        else:
+            self._cache_dir = None
+        self._store = get_store(
+            os.path.join(results_dir, '{}-results'.format(self.name)),
+            self._store_backend)
+        self.__log.info('Store results in %s', self._store.path)
+        return results_dir
+
+    def _run(self, results_dir, n_p, run_only, outputs=None):
+        """
+        Run detailed models and fit them.
+
+        If `outputs` is given, it is a dictionary with the iterators of
+        the results of the runs of each detailed model, which are used
+        instead of running them (see :class:`PKPCampaign`).
+        """
+        results_dir = self._setup(results_dir)
+        if outputs is None:
+            outputs = {}
         run_results = {}
 
         # define a information structure for the coal properties
@@ -229,7 +483,8 @@ class PKPRunner(ReadConfiguration):
                 if active:
                     self.__log.info('Run model %s', model)
                     results = self.run_model(
-                        model=model, results_dir=results_dir)
+                        model=model, results_dir=results_dir,
+                        outputs=outputs.get(model))
                     self.__log.debug('Finish run %s %s', model, results.keys())
                     if results:
                         run_results[model] = results
@@ -336,10 +591,14 @@ class PKPRunner(ReadConfiguration):
             os.mkdir(results_dir)
         return results_dir
 
-    def run_model(self, model, results_dir):
+    def run_model(self, model, results_dir, outputs=None):
         """
         Run simulations for the given model.
 
+        The runs are independent and, if a pool of workers is available,
+        they are executed concurrently. The results are collected in
+        the order of the runs.
+
         Parameters
         ----------
         model: str
@@ -347,6 +606,9 @@ class PKPRunner(ReadConfiguration):
             of a defined class
         results_dir: str
             Path of results
+        outputs: iterator, default=None
+            Results of the runs, in the order of the runs, if they have
+            been already executed
 
         Returns
         -------
@@ -362,10 +624,24 @@ class PKPRunner(ReadConfiguration):
             # new implementation run all the cases
             # for n in range(
             #        self.operating_conditions['runs']):
-            for n in runs_iterator(self.operating_conditions):
-                self.__log.info('Run %s with %s model', n, model)
-                res = self._run_single(model, model_settings, n, results_dir)
+            runs = list(runs_iterator(self.operating_conditions))
+            tasks = [self._run_task(model, model_settings, n, results_dir)
+                     for n in runs]
+            if outputs is not None:
+                outputs = iter(outputs)
+            elif self._pool is not None and len(tasks) > 1:
+                self.__log.info('Run %s with %s model on %s processes',
+                                ', '.join(str(n) for n in runs), model,
+                                self._n_p)
+                outputs = self._pool.imap(run_detailed_model, tasks)
+            for n, task in zip(runs, tasks):
+                if outputs is None:
+                    self.__log.info('Run %s with %s model', n, model)
+                    res = run_detailed_model(task)
+                else:
+                    res = next(outputs)
                 results['run{}'.format(n)] = res
+                self._save_results(model, n, res, results_dir)
 
                 # add last row to vol_composition
                 vol_composition = vol_composition.append(
@@ -380,6 +656,9 @@ class PKPRunner(ReadConfiguration):
                 'run{}'.format(n)
                 for n in runs_iterator(self.operating_conditions)
             ]
+            if self._store is not None:
+                self._store.write('{}/finalyields'.format(model),
+                                  vol_composition)
             final_yield = '{name}-{model}-finalyields.csv'.format(
                 name=self.name, model=model)
             self.__log.debug('Export vol_composition to csv %s', final_yield)
@@ -389,10 +668,24 @@ class PKPRunner(ReadConfiguration):
             results = None
         return results
 
+    def _save_results(self, model, n, res, results_dir):
+        """Save the results of a run in the store and export them."""
+        if self._store is not None:
+            self._store.write('{model}/run{run}'.format(model=model, run=n),
+                              res)
+        if self._csv:
+            out_csv = os.path.join(
+                results_dir, '{name}-{model}-run{run}.csv'.format(
+                    name=self.name, model=model, run=n))
+            self.__log.debug('Export run %s to csv %s', n, out_csv)
+            res.set_index('t').to_csv(out_csv)
+
     def _run_single(self, model, model_settings, n, results_dir):
         """
         Run a single simulation for the given detailed model.
 
+        See :func:`run_detailed_model`.
+
         Parameters
         ----------
         model: str, unicode
@@ -411,6 +704,11 @@ class PKPRunner(ReadConfiguration):
 
         """
         self.__log.debug('Initialize run %s for %s', n, model)
+        return run_detailed_model(
+            self._run_task(model, model_settings, n, results_dir))
+
+    def _run_task(self, model, model_settings, n, results_dir):
+        """Return the task of a single run for :func:`run_detailed_model`."""
         if model == 'Polimi' and 'reference' in model_settings:
             raise NotImplementedError("Polimi reference not working")
             # self.__log.debug('Use reference coal for Polimi %s',
@@ -422,42 +720,26 @@ class PKPRunner(ReadConfiguration):
             # )
             # self.__log.debug(
             #     'Polimi coal composition is set to %s', run.composition)
-
-        self.__log.debug('Initialize detailed model %s', model)
-        # run = globals()[model](
-        #     ultimate_analysis=self.ultimate_analysis,
-        #     proximate_analysis=self.proximate_analysis,
-        #     pressure=self.pressure,
-        #     # name='{}-{}-Run{}'.format(self.name, model, n)
-        #     name=self.name
-        # )
-        run = reactor.Reactor(
-            model,
-            ultimate_analysis=self.ultimate_analysis,
-            proximate_analysis=self.proximate_analysis,
-            pressure=self.pressure,
-            name=self.name)
-        # TODO change path from detailed model to reactor
-        run.model.basename = '{name}-{model}-run{run}'.format(
-            name=self.name, model=model, run=n)
-        self.__log.debug('Set basename %s', run.model.basename)
-        run.model.path = results_dir
-        self.__log.debug('Set path to: %s', run.model.path)
-        run.set_parameters(**model_settings)
-        self.__log.debug('Reactor Parameters:\n%s', run.reactor_parameters)
-        self.__log.debug('increment: %s %s', run.increment,
-                         model_settings['increment'])
-        self.__log.debug('Model %s Parameters:\n%s', model,
-                         run.model_parameters)
-        self.__log.debug('Set property run %s for %s', n, model)
-        run.operating_conditions = (
-            self.operating_conditions['run{}'.format(n)])
-        self.__log.debug('Run %s for %s', n, model)
-        res = run.run(save=True)
-        return res
+        task = {
+            'model': model,
+            'model_settings': model_settings,
+            'coal_settings': {
+                'ultimate_analysis': self.ultimate_analysis,
+                'proximate_analysis': self.proximate_analysis,
+                'pressure': self.pressure,
+                'name': self.name},
+            'operating_conditions':
+                self.operating_conditions['run{}'.format(n)],
+            'basename': '{name}-{model}-run{run}'.format(
+                name=self.name, model=model, run=n),
+            'results_dir': results_dir,
+            'cache_dir': self._cache_dir}
+        self.__log.debug('Task run %s for %s: %s', n, model, task)
+        return task
 
     def _plot_results(self, model, n, res, results_dir):
         """Plot results of the single run with detailed model."""
+        plt = _pyplot()
         fig, ax = plt.subplots()
         for sp in ['tar', 'light_gas', 'char', 'solid', 'volatiles']:
             if sp in res:
@@ -492,6 +774,7 @@ class PKPRunner(ReadConfiguration):
         self.__log.debug('Save plot to %s', fig_name)
         fig.savefig(
             os.path.join(results_dir, fig_name), dpi=120, bbox_inches='tight')
+        plt.close(fig)
 
     def fit_single(self,
                    results,
@@ -499,7 +782,8 @@ class PKPRunner(ReadConfiguration):
                    fit_dict,
                    fit_settings,
                    results_dir,
-                   n_p=1):
+                   n_p=1,
+                   resume=None):
         """
         Fit single case.
 
@@ -525,6 +809,10 @@ class PKPRunner(ReadConfiguration):
             Path where results are stored
         n_p: int
             Number of processors for the evolution
+        resume: bool, default=None
+            Resume the evolution from the checkpoint stored in
+            `results_dir`. If None, the `resume` option of :meth:`run`
+            is used.
 
         """
         # parameters_init = fit_settings['parameters_init']
@@ -553,13 +841,28 @@ class PKPRunner(ReadConfiguration):
         self.__log.debug('Runs used for calibration %s',
                          list(target_conditions_used.keys()))
 
+        # the fitness cache is shared by evolution and minimization
+        cache_size = fit_settings.get('cache_size', 10000)
+        cache = algorithms.FitnessCache(maxsize=cache_size) \
+            if cache_size else None
+
         if 'evolve' in method:
             self.__log.info('%s Evolution to fit %s with %s', fitname,
                             det_model, emp_model)
             # Define properties of evolutionary model
 
+            # checkpoint of the evolution
+            freq = fit_settings.get('checkpoint', 10)
+            checkpoint = algorithms.Checkpoint(
+                os.path.join(results_dir,
+                             '{}-checkpoint.pkl'.format(filename)),
+                freq=freq) if freq else None
+            if resume is None:
+                resume = self._resume
+
             best, ga = self.evolve(n_p, fit_results, fit_settings,
-                                   target_conditions_used)
+                                   target_conditions_used, cache=cache,
+                                   checkpoint=checkpoint, resume=resume)
             # plot results (evolution history)
             self._plot_evolution(det_model, filename, fitname, ga, results_dir)
 
@@ -574,9 +877,13 @@ class PKPRunner(ReadConfiguration):
                             det_model, emp_model)
             best, fmin = self.minimization(fit_results, fit_settings,
                                            target_conditions_used,
-                                           parameters_init)
+                                           parameters_init, cache=cache)
             emp_model_class = fmin.empirical_model
 
+        if cache is not None:
+            self.__log.info('%s fitness cache hits=%s misses=%s', fitname,
+                            cache.hits, cache.misses)
+
             # run optimized empirical model
         # m = emp_model_class(best)
         m = reactor.Reactor(emp_model_class, **best)
@@ -586,6 +893,12 @@ class PKPRunner(ReadConfiguration):
         self._plot_yieldfit(det_model, emp_model, filename, fit_dict,
                             fit_results, fitname, m, results_dir,
                             target_conditions)
+        if self._store is not None:
+            for run in sorted(target_conditions):
+                self._store.write(
+                    '{}/{}/{}'.format(det_model, fitname, run),
+                    pd.DataFrame({key: fit_results[run][key]
+                                  for key in ('t', 'y', 'y_fit')}))
         # calc postulate species
         if 'y0' in m.model.parameters_names():
             y0 = best['y0']
@@ -648,6 +961,8 @@ class PKPRunner(ReadConfiguration):
 
         """
         self.__log.debug('Plot yields')
+        plt = _pyplot()
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
         fig, ax = plt.subplots()
         runs = list(sorted(target_conditions))
         for i, run in enumerate(runs):
@@ -726,6 +1041,7 @@ class PKPRunner(ReadConfiguration):
         """
         color = 'black'
         color_min = 'red'
+        plt = _pyplot()
         fig, ax = plt.subplots()
         fit_min, fit_max, fit_avg, fit_std = ga.log.select(
             'min', 'max', 'avg', 'std')
@@ -744,7 +1060,8 @@ class PKPRunner(ReadConfiguration):
             bbox_inches='tight')
         plt.close(fig)
 
-    def evolve(self, n_p, fit_results, fit_settings, target_conditions):
+    def evolve(self, n_p, fit_results, fit_settings, target_conditions,
+               cache=None, checkpoint=None, resume=False):
         """Evolve the genetic algorithm."""
         model = fit_settings['model']
         self.__log.debug('Evolution fit with model %s', model)
@@ -755,6 +1072,7 @@ class PKPRunner(ReadConfiguration):
         cxpb = fit_settings['cxpb']
         mutpb = fit_settings['mutpb']
         skip = fit_settings.get('skip', 1)
+        vectorized = fit_settings.get('vectorized', False)
 
         parameters_min = fit_settings['parameters_min']
         parameters_max = fit_settings['parameters_max']
@@ -766,6 +1084,14 @@ class PKPRunner(ReadConfiguration):
             if fit_settings.get('binary', False) else \
             evolution.Evolution
 
+        # stopping rules of the evolution
+        stop_settings = {key: fit_settings[key]
+                         for key in ('ftol', 'stall', 'stall_rtol',
+                                     'max_time', 'max_evals')
+                         if fit_settings.get(key) is not None}
+        stop = algorithms.StopCriteria(**stop_settings) \
+            if stop_settings else None
+
         # Init Evolution
         self.__log.debug('Set skip=%s', skip)
         ga = Evolution(
@@ -775,7 +1101,10 @@ class PKPRunner(ReadConfiguration):
             mutpb=mutpb,
             mu=mu,
             lambda_=lambda_,
-            skip=skip)
+            skip=skip,
+            vectorized=vectorized,
+            cache=cache,
+            stop=stop)
         self.__log.debug('Init GA %s', ga)
         ga.empirical_model = getattr(empirical_model, model)
 
@@ -804,7 +1133,8 @@ class PKPRunner(ReadConfiguration):
         # Register the DEAP toolbox and do the evolution! (Pearl
         # Jam)
         ga.register()
-        best = ga.evolve(n_p=n_p, verbose=True)
+        best = ga.evolve(n_p=n_p, verbose=True, pool=self._pool,
+                         checkpoint=checkpoint, resume=resume)
         self.__log.debug('Best: %s', best)
 
         fit_results['evolve'] = {
@@ -813,7 +1143,13 @@ class PKPRunner(ReadConfiguration):
                 for p, unit in zip(ga.empirical_model.parameters_names(),
                                    ga.empirical_model.parameters_units())
             },
-            'log': ga.log[-1]
+            'log': ga.log[-1],
+            'stop': {
+                'reason': (stop.reason if stop is not None and stop.reason
+                           else 'ngen'),
+                'generations': ga.log[-1]['gen'],
+                'nevals': int(sum(ga.log.select('nevals')))
+            }
         }
 
         # report only last iteration
@@ -821,14 +1157,18 @@ class PKPRunner(ReadConfiguration):
 
         return best, ga
 
-    def minimization(self, fit_results, fit_settings, target_conditions, init):
+    def minimization(self, fit_results, fit_settings, target_conditions, init,
+                     cache=None):
         model = fit_settings['model']
         self.__log.debug('Minimization fit with model %s', model)
 
         parameters_min = fit_settings['parameters_min']
         parameters_max = fit_settings['parameters_max']
 
-        fmin = minimize.Minimization()
+        fmin = minimize.Minimization(
+            cache=cache,
+            method=fit_settings.get('min_method', 'L-BFGS-B'),
+            gradient=fit_settings.get('gradient', True))
 
         self.__log.debug('Init fmin %s', fmin)
         fmin.empirical_model = getattr(empirical_model, model)
@@ -869,9 +1209,219 @@ class PKPRunner(ReadConfiguration):
                 for p, unit in zip(fmin.empirical_model.parameters_names(),
                                    fmin.empirical_model.parameters_units())
             },
-            'report': dict(fmin.results)
+            # the inverse Hessian of L-BFGS-B is a linear operator
+            'report': {key: value for key, value in fmin.results.items()
+                       if key != 'hess_inv' or
+                       isinstance(value, np.ndarray)}
         }
 
         self.__log.info('Minimized value: %s', fit_results['fmin']['best'])
 
         return best, fmin
+
+
+@logged
+class PKPCampaign(object):
+    """
+    PKP campaign manager class.
+
+    Run PKP for a table of coals, using the same detailed models,
+    operating conditions and calibrations defined in a *yaml* file.
+    The runs of the detailed models of all the coals are scheduled
+    together on the pool of workers, which is also used by all the
+    calibrations.
+    """
+
+    proximate = ('FC', 'VM', 'Ash', 'Moist')
+    ultimate = ('C', 'H', 'O', 'N', 'S')
+
+    def __init__(self, coals, yml):
+        """
+        Init the campaign.
+
+        Parameters
+        ----------
+        coals: str, pd.DataFrame
+            Table (or csv file) of the coals, with the columns `name`,
+            the proximate analysis `FC`, `VM`, `Ash`, `Moist`, the
+            ultimate analysis `C`, `H`, `O`, `N`, `S`, the density
+            `rho_dry` and, optionally, `HHV`.
+        yml: str, unicode, dict
+            Input dict or yaml file containing the configuration of the
+            detailed models and of the calibrations. The `Coal` section
+            is optional and it is used for the default values of `HHV`
+            and `rho_dry`. See :ref:`input-file-label`.
+
+        Raises
+        ------
+        PKPKeyError
+            If a column is missing or `rho_dry` of a coal is defined
+            neither in the table nor in the `Coal` section.
+
+        """
+        if isinstance(coals, string_types):
+            coals = pd.read_csv(coals)
+        missing = [key for key in ('name',) + self.proximate + self.ultimate
+                   if key not in coals]
+        if missing:
+            raise PKPKeyError('Columns {} missing in the coals table'.format(
+                missing))
+        if coals['name'].duplicated().any():
+            raise PKPKeyError('Coal names in the coals table are not unique')
+        self.coals = coals
+
+        if isinstance(yml, string_types):
+            with open(yml, 'r') as f:
+                yml = yaml.safe_load(f)
+        elif not isinstance(yml, dict):
+            raise ValueError('Define yml as file name or dictionary')
+        self.settings = yml
+
+        for _, coal in self.coals.iterrows():
+            if self._coal_settings(coal)['rho_dry'] is None:
+                raise PKPKeyError(
+                    'Column rho_dry missing for coal {} in the coals table '
+                    'and in the Coal section'.format(coal['name']))
+
+    def _coal_settings(self, coal):
+        """Return the Coal section of the input for a row of the table."""
+        default = self.settings.get('Coal') or {}
+
+        def value(key):
+            if key in coal and not pd.isnull(coal[key]):
+                return coal[key]
+            return default.get(key)
+
+        return {
+            'name': str(coal['name']),
+            'proximate_analysis': {key: float(coal[key])
+                                   for key in self.proximate},
+            'ultimate_analysis': {key: float(coal[key])
+                                  for key in self.ultimate},
+            'HHV': value('HHV'),
+            'rho_dry': value('rho_dry')}
+
+    def runners(self):
+        """Return the list of the :class:`PKPRunner` of the coals."""
+        runners = []
+        for _, coal in self.coals.iterrows():
+            yml = dict(self.settings)
+            yml['Coal'] = self._coal_settings(coal)
+            runners.append(PKPRunner(yml))
+        return runners
+
+    def run(self, results_dir=None, n_p=1, run_only=False, resume=False,
+            cache=True, store='auto', csv=False):
+        """
+        Run detailed models and fit them for all the coals.
+
+        The results of each coal are stored in a sub directory of
+        `results_dir` with the name of the coal. The options are the
+        same of :meth:`PKPRunner.run`, but, if `cache` is True, the
+        cache is shared by all the coals in the directory `cache` of
+        `results_dir`.
+
+        Returns
+        -------
+        summary: pd.DataFrame
+            Summary of the calibrated parameters (see :meth:`summary`),
+            exported in `campaign-summary.csv`.
+
+        """
+        results_dir = PKPRunner.set_results_dir(results_dir)
+        if cache is True:
+            cache = os.path.join(results_dir, 'cache')
+        pool = multiprocessing.Pool(processes=n_p) if n_p > 1 else None
+        runners = self.runners()
+        try:
+            coal_dirs = []
+            tasks = []
+            for i, runner in enumerate(runners):
+                runner._pool, runner._n_p = pool, n_p
+                runner._set_options(resume=resume, cache=cache, store=store,
+                                    csv=csv)
+                coal_dir = runner._setup(
+                    os.path.join(results_dir, runner.name))
+                coal_dirs.append(coal_dir)
+                for model in runner.models:
+                    model_settings = getattr(runner, model, None)
+                    if model_settings and model_settings['active']:
+                        tasks.extend(
+                            ((i, model), runner._run_task(
+                                model, model_settings, n, coal_dir))
+                            for n in runs_iterator(
+                                runner.operating_conditions))
+
+            # run all the detailed models together
+            self.__log.info('Run %s detailed model runs for %s coals',
+                            len(tasks), len(runners))
+            if pool is not None:
+                res_iter = pool.imap(run_detailed_model,
+                                     [task for _, task in tasks])
+            else:
+                res_iter = (run_detailed_model(task) for _, task in tasks)
+            outputs = [{} for _ in runners]
+            for (i, model), res in zip([job for job, _ in tasks], res_iter):
+                outputs[i].setdefault(model, []).append(res)
+
+            fit_results = {}
+            for runner, coal_dir, output in zip(runners, coal_dirs, outputs):
+                self.__log.info('Run coal %s', runner.name)
+                fit_results[runner.name] = runner._run(
+                    coal_dir, n_p, run_only, outputs=output)[1]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for runner in runners:
+                runner._pool, runner._n_p = None, 1
+                runner._resume = False
+
+        summary = self.summary(fit_results)
+        summary_csv = os.path.join(results_dir, 'campaign-summary.csv')
+        self.__log.info('Export summary to %s', summary_csv)
+        summary.to_csv(summary_csv, index=False)
+        return summary
+
+    @staticmethod
+    def summary(fit_results):
+        """
+        Summary of the calibrations.
+
+        Parameters
+        ----------
+        fit_results: dict
+            Fit results of each coal returned by :meth:`PKPRunner.run`
+
+        Returns
+        -------
+        summary: pd.DataFrame
+            Table with a row for each coal, detailed model and fit,
+            with the empirical model, the calibration step (`fmin` or
+            `evolve`) of the reported parameters, its fitness and the
+            calibrated parameters.
+
+        """
+        rows = []
+        for coal, coal_results in fit_results.items():
+            for model in models:
+                model_results = coal_results.get(model, {})
+                for fitname, fit in sorted(model_results.items()):
+                    row = {'coal': coal, 'model': model, 'fit': fitname,
+                           'empirical_model': fit['model'],
+                           'species': fit['species']}
+                    if 'fmin' in fit:
+                        row['method'] = 'fmin'
+                        row['fitness'] = fit['fmin']['report']['fun']
+                    else:
+                        row['method'] = 'evolve'
+                        row['fitness'] = fit['evolve']['log']['min']
+                    row.update({p: value for p, (value, _) in
+                                fit[row['method']]['best'].items()})
+                    rows.append(row)
+        columns = ['coal', 'model', 'fit', 'empirical_model', 'species',
+                   'method', 'fitness']
+        summary = pd.DataFrame(rows)
+        return summary[columns + sorted(set(summary.columns) -
+                                        set(columns))] if rows else \
+            pd.DataFrame(columns=columns)
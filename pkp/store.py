@@ -0,0 +1,270 @@
+"""
+Results store module.
+
+The results of the detailed models are stored in a columnar binary
+format, with one dataset for each model and run, identified by keys as
+``CPD/run0``. The columns are stored as `float64`.
+
+Contains
+--------
+* :class:`pkp.store.ResultsStore`
+* :class:`pkp.store.HDF5Store`
+* :class:`pkp.store.ParquetStore`
+* :class:`pkp.store.NpzStore`
+* :func:`pkp.store.get_store`
+"""
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from autologging import logged
+
+from ._exceptions import PKPKeyError
+
+try:
+    import tables
+except ImportError:
+    tables = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def _typed(df):
+    """Return the DataFrame with the numeric columns as float64."""
+    return df.astype({c: np.float64 for c in df.columns
+                      if np.issubdtype(df[c].dtype, np.number)})
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # created by another process
+            pass
+
+
+@logged
+class ResultsStore(object):
+    """
+    Base class of the results store.
+
+    Each dataset is a DataFrame stored with a key, as ``CPD/run0``.
+    The stores are written only by the main process.
+    """
+
+    backend = None
+    extension = ''
+
+    def __init__(self, path):
+        """
+        Init the store.
+
+        Parameters
+        ----------
+        path: str
+            Path of the store without extension
+
+        """
+        self.path = path + self.extension
+
+    def write(self, key, df):
+        """
+        Write a dataset.
+
+        Parameters
+        ----------
+        key: str
+            Key of the dataset, as ``CPD/run0``. An existing dataset
+            with the same key is replaced
+        df: pd.DataFrame
+            Dataset
+
+        """
+        self.__log.debug('Write %s to %s', key, self.path)
+        self._write(key.strip('/'), _typed(df))
+
+    def read(self, key):
+        """Read the dataset with the given key."""
+        key = key.strip('/')
+        if key not in self.keys():
+            raise PKPKeyError('{} not in {}'.format(key, self.path))
+        return self._read(key)
+
+    def keys(self):
+        """Return the list of the keys of the stored datasets."""
+        raise NotImplementedError()
+
+    def __contains__(self, key):
+        """Check if a dataset is stored."""
+        return key.strip('/') in self.keys()
+
+    def _write(self, key, df):
+        raise NotImplementedError()
+
+    def _read(self, key):
+        raise NotImplementedError()
+
+
+class HDF5Store(ResultsStore):
+    """
+    Store the datasets in a single HDF5 file.
+
+    The datasets are written with the chunked table format of
+    :class:`pandas.HDFStore`, compressed with blosc. It requires
+    PyTables.
+    """
+
+    backend = 'hdf5'
+    extension = '.h5'
+    complevel = 5
+    complib = 'blosc'
+
+    def __init__(self, path):
+        if tables is None:
+            raise ImportError('PyTables not installed! HDF5 store cannot '
+                              'be used')
+        super(HDF5Store, self).__init__(path)
+
+    def keys(self):
+        if not os.path.exists(self.path):
+            return []
+        with pd.HDFStore(self.path, mode='r') as store:
+            return [key.strip('/') for key in store.keys()]
+
+    def _write(self, key, df):
+        _makedirs(os.path.dirname(os.path.abspath(self.path)))
+        with pd.HDFStore(self.path, mode='a', complevel=self.complevel,
+                         complib=self.complib) as store:
+            store.put(key, df, format='table')
+
+    def _read(self, key):
+        with pd.HDFStore(self.path, mode='r') as store:
+            return store.get(key)
+
+
+class _DirectoryStore(ResultsStore):
+    """Store each dataset in a file of the store directory."""
+
+    suffix = ''
+
+    def _filename(self, key):
+        return os.path.join(self.path, *key.split('/')) + self.suffix
+
+    def keys(self):
+        keys = []
+        for root, _, files in os.walk(self.path):
+            for f in files:
+                if f.endswith(self.suffix):
+                    name = os.path.relpath(
+                        os.path.join(root, f[:-len(self.suffix)]), self.path)
+                    keys.append(name.replace(os.sep, '/'))
+        return sorted(keys)
+
+    def _write(self, key, df):
+        filename = self._filename(key)
+        _makedirs(os.path.dirname(filename))
+        # write to a temporary file and rename it, so that a dataset
+        # is never left partially written
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                   suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            self._dump(f, df)
+        getattr(os, 'replace', os.rename)(tmp, filename)
+
+    def _read(self, key):
+        with open(self._filename(key), 'rb') as f:
+            return self._load(f)
+
+
+class ParquetStore(_DirectoryStore):
+    """
+    Store each dataset in a Parquet file.
+
+    The files are compressed with snappy. It requires pyarrow.
+    """
+
+    backend = 'parquet'
+    suffix = '.parquet'
+    compression = 'snappy'
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise ImportError('pyarrow not installed! Parquet store cannot '
+                              'be used')
+        super(ParquetStore, self).__init__(path)
+
+    def _dump(self, f, df):
+        df.to_parquet(f, engine='pyarrow', compression=self.compression)
+
+    def _load(self, f):
+        return pd.read_parquet(f, engine='pyarrow')
+
+
+class NpzStore(_DirectoryStore):
+    """
+    Store each dataset in a compressed numpy archive.
+
+    It is used when neither PyTables nor pyarrow are available.
+    """
+
+    backend = 'npz'
+    suffix = '.npz'
+
+    def _dump(self, f, df):
+        index = df.index.values
+        if index.dtype == object:
+            index = index.astype(str)
+        np.savez_compressed(
+            f, values=df.values, index=index,
+            columns=np.array(df.columns, dtype=str))
+
+    def _load(self, f):
+        with np.load(f, allow_pickle=False) as data:
+            return pd.DataFrame(data['values'], index=data['index'],
+                                columns=data['columns'])
+
+
+backends = {
+    'hdf5': HDF5Store,
+    'parquet': ParquetStore,
+    'npz': NpzStore
+}
+
+
+def available_backends():
+    """Return the list of the backends available, in order of preference."""
+    return [backend for backend, module in (
+        ('hdf5', tables), ('parquet', pyarrow), ('npz', np))
+        if module is not None]
+
+
+def get_store(path, backend='auto'):
+    """
+    Return the results store.
+
+    Parameters
+    ----------
+    path: str
+        Path of the store without extension
+    backend: str, default='auto'
+        Backend of the store: `hdf5`, `parquet` or `npz`. With `auto`,
+        the first available of them is used.
+
+    Returns
+    -------
+    store: ResultsStore
+
+    """
+    if backend == 'auto':
+        backend = available_backends()[0]
+    if backend not in backends:
+        raise PKPKeyError('Store backend {} not available. Use one of '
+                          '{}'.format(backend, list(backends)))
+    return backends[backend](path)
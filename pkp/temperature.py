@@ -0,0 +1,341 @@
+"""
+Temperature module.
+
+Define the temperature profiles prescribed in the reactors. Each profile
+evaluates the temperature `T(t)` and its time derivative `dTdt(t)` for
+scalar times, as in the right hand side of the ODE systems, and for
+arrays of times.
+
+Contains
+--------
+* :class:`pkp.temperature.TemperatureProfile`
+* :class:`pkp.temperature.PiecewiseLinear`
+* :class:`pkp.temperature.Tabulated`
+* :class:`pkp.temperature.Spline`
+* :class:`pkp.temperature.Ramp`
+"""
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+from bisect import bisect_right
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+
+def _points(points):
+    """Check the points of a profile and return them as Nx2 array."""
+    if not isinstance(points, (np.ndarray, list, tuple)):
+        raise TypeError('Define conditions as list or numpy array')
+    points = np.array(points, dtype=float)
+    if not points.ndim == 2:
+        raise ValueError('Define conditions as array Nx2')
+    if not points.shape[-1] == 2:
+        raise ValueError('Define conditions as array Nx2')
+    return points
+
+
+class TemperatureProfile(object):
+    """
+    Base class of the temperature profiles.
+
+    The profiles are defined between the initial and the final times of
+    :attr:`points`, outside the temperature is constant and its
+    derivative is zero.
+    """
+
+    @property
+    def points(self):
+        """Points (t, T) of the profile, as array Nx2."""
+        return self._points
+
+    @property
+    def t_start(self):
+        """Initial time."""
+        return self._points[0, 0]
+
+    @property
+    def t_end(self):
+        """Final time."""
+        return self._points[-1, 0]
+
+    def T(self, t):
+        """
+        Temperature.
+
+        Parameters
+        ----------
+        t: float, np.ndarray
+            Time
+
+        Returns
+        -------
+        T: float, np.ndarray
+
+        """
+        if isinstance(t, float):
+            return self._T(t)
+        t = np.asarray(t, dtype=float)
+        if t.ndim == 0:
+            return self._T(float(t))
+        return self._T_array(t)
+
+    def dTdt(self, t):
+        """
+        Time derivative of the temperature.
+
+        Parameters
+        ----------
+        t: float, np.ndarray
+            Time
+
+        Returns
+        -------
+        dTdt: float, np.ndarray
+
+        """
+        if isinstance(t, float):
+            return self._dTdt(t)
+        t = np.asarray(t, dtype=float)
+        if t.ndim == 0:
+            return self._dTdt(float(t))
+        return self._dTdt_array(t)
+
+    def __call__(self, t):
+        """Return the temperature."""
+        return self.T(t)
+
+    def _T(self, t):
+        return float(self._T_array(np.array(t)))
+
+    def _dTdt(self, t):
+        return float(self._dTdt_array(np.array(t)))
+
+    def _T_array(self, t):
+        raise NotImplementedError()
+
+    def _dTdt_array(self, t):
+        raise NotImplementedError()
+
+
+class PiecewiseLinear(TemperatureProfile):
+    """
+    Piecewise linear profile through the operating points.
+
+    The segment of the last evaluation is cached: since the solvers
+    advance in time, the segment is usually found with one comparison,
+    otherwise with a bisection.
+    """
+
+    def __init__(self, points):
+        """
+        Init the profile.
+
+        Parameters
+        ----------
+        points: list, np.ndarray
+            Operating points [[t0, T0], [t1, T1], ..., [tn, Tn]], with
+            time in s and temperature in K
+
+        """
+        self._points = _points(points)
+        t, T = self._points[:, 0], self._points[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._slopes = np.diff(T) / np.diff(t)
+        # lists are faster than arrays for scalar access
+        self._t = t.tolist()
+        self._T_points = T.tolist()
+        self._slopes_list = self._slopes.tolist()
+        self._index = 0
+
+    def _segment(self, t):
+        """Return the index i of the segment t_i <= t < t_(i+1)."""
+        t_ = self._t
+        i = self._index
+        if t_[i] <= t < t_[i + 1]:
+            return i
+        if i + 2 < len(t_) and t_[i + 1] <= t < t_[i + 2]:
+            i += 1
+        else:
+            i = bisect_right(t_, t) - 1
+        self._index = i
+        return i
+
+    def _T(self, t):
+        t_ = self._t
+        if t <= t_[0]:
+            return self._T_points[0]
+        elif t >= t_[-1]:
+            return self._T_points[-1]
+        i = self._segment(t)
+        return self._T_points[i] + self._slopes_list[i] * (t - t_[i])
+
+    def _dTdt(self, t):
+        t_ = self._t
+        if t < t_[0] or t >= t_[-1]:
+            return 0.0
+        return self._slopes_list[self._segment(t)]
+
+    def _T_array(self, t):
+        return np.interp(t, self._points[:, 0], self._points[:, 1])
+
+    def _dTdt_array(self, t):
+        t_points = self._points[:, 0]
+        if len(t_points) < 2:
+            return np.zeros_like(t)
+        index = np.clip(np.searchsorted(t_points, t, side='right') - 1,
+                        0, len(self._slopes) - 1)
+        inside = (t >= t_points[0]) & (t < t_points[-1])
+        return np.where(inside, self._slopes[index], 0.0)
+
+
+class Tabulated(PiecewiseLinear):
+    """
+    Tabulated profile on a uniform time grid.
+
+    The profile, for example measured, is interpolated on `n` equally
+    spaced times, so that the segment is found directly from the time.
+    """
+
+    def __init__(self, t, T, n=None):
+        """
+        Init the profile.
+
+        Parameters
+        ----------
+        t, T: np.ndarray, list
+            Times and temperatures of the table
+        n: int, default=None
+            Number of points of the uniform grid. If None, the number
+            of points of the table is used.
+
+        """
+        t, T = np.asarray(t, dtype=float), np.asarray(T, dtype=float)
+        if n is None:
+            n = len(t)
+        grid = np.linspace(t[0], t[-1], n)
+        super(Tabulated, self).__init__(
+            np.column_stack([grid, np.interp(grid, t, T)]))
+        self._dt = grid[1] - grid[0]
+
+    def _segment(self, t):
+        t_ = self._t
+        i = min(int((t - t_[0]) / self._dt), len(t_) - 2)
+        # correct the round-off of the division at the grid points
+        if t < t_[i]:
+            return i - 1
+        elif t >= t_[i + 1]:
+            return i + 1
+        return i
+
+
+class Spline(TemperatureProfile):
+    """
+    Cubic spline profile through the operating points.
+
+    The profile and its derivative are continuous. Note that the
+    closed-form solutions of the empirical models (see
+    :meth:`pkp.empirical_model.EmpiricalModel.solve_profile`) use the
+    piecewise linear profile through :attr:`points`.
+    """
+
+    def __init__(self, points, bc_type='not-a-knot'):
+        """
+        Init the profile.
+
+        Parameters
+        ----------
+        points: list, np.ndarray
+            Operating points [[t0, T0], [t1, T1], ..., [tn, Tn]]
+        bc_type: str, default='not-a-knot'
+            Boundary conditions of :class:`scipy.interpolate.CubicSpline`
+
+        """
+        self._points = _points(points)
+        self._spline = CubicSpline(self._points[:, 0], self._points[:, 1],
+                                   bc_type=bc_type)
+        self._derivative = self._spline.derivative()
+
+    def _T_array(self, t):
+        return self._spline(np.clip(t, self.t_start, self.t_end))
+
+    def _dTdt_array(self, t):
+        inside = (t >= self.t_start) & (t < self.t_end)
+        return np.where(inside, self._derivative(t), 0.0)
+
+
+class Ramp(TemperatureProfile):
+    """
+    Linear heating ramp followed by an isothermal hold.
+
+    The temperature increases from `T0` with the heating rate `rate`
+    until `T_max`, and it is constant until `t_end`.
+    """
+
+    def __init__(self, T0, T_max, rate, t_end, t0=0.0):
+        """
+        Init the profile.
+
+        Parameters
+        ----------
+        T0: float
+            Initial temperature, K
+        T_max: float
+            Final temperature, K
+        rate: float
+            Heating rate, K/s
+        t_end: float
+            Final time, s
+        t0: float, default=0
+            Initial time, s
+
+        """
+        if rate <= 0:
+            raise ValueError('Define rate > 0')
+        self.T0, self.T_max, self.rate = float(T0), float(T_max), float(rate)
+        self._t0 = float(t0)
+        self._t_heat = min(self._t0 + (self.T_max - self.T0) / self.rate,
+                           float(t_end))
+        points = [[self._t0, self.T0],
+                  [self._t_heat, self._T(self._t_heat)]]
+        if t_end > self._t_heat:
+            points.append([t_end, self.T_max])
+        self._points = np.array(points)
+        self._t_end = float(t_end)
+
+    def _T(self, t):
+        if t <= self._t0:
+            return self.T0
+        return min(self.T0 + self.rate * (t - self._t0), self.T_max)
+
+    def _dTdt(self, t):
+        if self._t0 <= t < self._t_heat:
+            return self.rate
+        return 0.0
+
+    def _T_array(self, t):
+        return np.clip(self.T0 + self.rate * (t - self._t0), self.T0,
+                       self.T_max)
+
+    def _dTdt_array(self, t):
+        return np.where((t >= self._t0) & (t < self._t_heat), self.rate, 0.0)
+
+
+def get_profile(conditions):
+    """
+    Return the temperature profile of the operating conditions.
+
+    Parameters
+    ----------
+    conditions: TemperatureProfile, list, np.ndarray
+        Temperature profile or operating points, which define a
+        :class:`PiecewiseLinear` profile
+
+    Returns
+    -------
+    profile: TemperatureProfile
+
+    """
+    if isinstance(conditions, TemperatureProfile):
+        return conditions
+    return PiecewiseLinear(conditions)
@@ -72,7 +72,6 @@ setup(
         # 'cantera (>=2.2.0)',
         'tabulate',
         'future',
-        'pathos',
         'termcolor',
         'versioneer'
     ])
@@ -0,0 +1,102 @@
+"""
+Benchmark of the startup time of PKP.
+
+Run from the root of the repository::
+
+    python test/benchmark_startup.py [-n 5] [--run]
+
+The import time of `pkp` and `pkp.runner` is the best of `n` fresh
+interpreters. The slowest modules imported by `pkp.runner` are taken
+from ``python -X importtime`` (python >= 3.7). With ``--run``, also
+``runPKP test/input_CPD.yml --run-only --no-cache`` is timed. The
+results are reported in `performances.md`.
+"""
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+heavy_modules = ('matplotlib', 'cantera', 'numba', 'pkp.cpd', 'pkp.polimi')
+
+
+def _python(code, *options):
+    """Run the code in a new interpreter and return stdout and stderr."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    p = subprocess.Popen([sys.executable] + list(options) + ['-c', code],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         env=env)
+    out, err = p.communicate()
+    return out.decode(), err.decode()
+
+
+def import_time(module, n=5):
+    """Return the best import time of the module and the heavy modules."""
+    code = ('import sys, time; t = time.time(); import {}; '
+            'print(time.time() - t); '
+            'print([m for m in {} if m in sys.modules])').format(
+                module, heavy_modules)
+    times = []
+    for _ in range(n):
+        out = _python(code)[0].strip().splitlines()
+        times.append(float(out[-2]))
+    return min(times), out[-1]
+
+
+def slowest_imports(module, n=10):
+    """Return the slowest modules imported by the module (self time)."""
+    err = _python('import {}'.format(module), '-X', 'importtime')[1]
+    imports = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        imports.append((int(self_us), name.strip()))
+    return sorted(imports, reverse=True)[:n]
+
+
+def run_time():
+    """Return the time of runPKP with only the detailed models."""
+    results_dir = tempfile.mkdtemp()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            t = timeit.default_timer()
+            subprocess.check_call(
+                [sys.executable, os.path.join(root, 'runPKP'),
+                 os.path.join(root, 'test', 'input_CPD.yml'), '--run-only',
+                 '--no-cache', '-o', results_dir],
+                stdout=devnull, stderr=devnull, cwd=results_dir)
+            return timeit.default_timer() - t
+    finally:
+        shutil.rmtree(results_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', type=int, default=5,
+                        help='Number of interpreters for the import time')
+    parser.add_argument('--run', action='store_true',
+                        help='Time also runPKP with --run-only')
+    args = parser.parse_args()
+
+    for module in ('pkp', 'pkp.runner'):
+        t, modules = import_time(module, args.n)
+        print('import {}: {:.3f} s, heavy modules: {}'.format(
+            module, t, modules))
+    print('Slowest imports of pkp.runner (self time):')
+    for self_us, name in slowest_imports('pkp.runner'):
+        print('  {:8.1f} ms {}'.format(self_us / 1000, name))
+    if args.run:
+        print('runPKP --run-only: {:.2f} s'.format(run_time()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """Test module for CPD."""
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
+import platform
 import pytest
 import numpy as np
 
@@ -88,3 +89,250 @@ def test_set_parameters(cpd):
     ma = cpd.mw - cpd.sig * mdel_corr
 
     assert cpd.ma == ma
+
+
+def test_fragments(cpd):
+    """Test the invariants of the fragments."""
+    from scipy.stats import binom
+    cpd.set_parameters(n_frag=25)
+    cpd.set_parameters(sig=5.0)
+    assert cpd._fragments.shape == (5, 25)
+    n = np.arange(1, 26)
+    tau = n * (cpd.sigma - 1) + 2
+    np.testing.assert_allclose(cpd._frag_tau, tau)
+    p = 0.6
+    s = n - 1
+    Qn = cpd.sig / (tau + s) / n * binom.pmf(s, tau + s, p)
+    np.testing.assert_allclose(
+        cpd._frag_coeff * np.exp(cpd._frag_ln_comb + cpd._frag_s * np.log(p) +
+                                 cpd._frag_tau * np.log(1 - p)), Qn)
+
+
+@pytest.mark.parametrize('sigma', [3.5, 4.0, 5.2])
+def test_pstar_solve(sigma):
+    """Test the solution of pstar respect to brentq."""
+    from scipy.optimize import brentq
+    from pkp import _np_functions
+    p = np.linspace(1 / sigma + 1e-3, 0.999, 50)
+    ref = np.array([brentq(_np_functions.pstar_f, 0, 1 / sigma,
+                           args=(sigma, _np_functions.fp(pi, sigma)),
+                           xtol=1e-14)
+                    for pi in p])
+    np.testing.assert_allclose(pkp.cpd.pstar_solve_array(p, sigma), ref,
+                               atol=1e-11)
+    np.testing.assert_allclose(_np_functions.pstar_solve_array(p, sigma),
+                               ref, atol=1e-11)
+    # cold start and initial guess outside the interval
+    for x0 in (0, 0.5 / sigma, 2):
+        assert np.isclose(pkp.cpd.pstar_solve(p[10], sigma, x0), ref[10],
+                          rtol=1e-9, atol=0)
+
+
+def test_rachford_rice():
+    """Test the Rachford-Rice solver respect to brentq."""
+    from scipy.optimize import brentq
+    from pkp import _np_functions
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        z_n = rng.rand(21)
+        z_n /= z_n.sum()
+        k_n_1 = 10 ** rng.uniform(-3, 3, 21) - 1
+        f = _np_functions.sum_x_n_calc
+        if f(0, z_n, k_n_1) * f(0.9999, z_n, k_n_1) > 0:
+            continue
+        ref = brentq(f, 0, 0.9999, args=(z_n, k_n_1), xtol=1e-14)
+        for x0 in (-1, 0.01, ref * 1.01, 0.99):
+            assert np.isclose(pkp.cpd.rachford_rice(z_n, k_n_1, x0), ref,
+                              rtol=0, atol=1e-10)
+            assert np.isclose(_np_functions.rachford_rice(z_n, k_n_1, x0),
+                              ref, rtol=0, atol=1e-10)
+
+
+def test_pstar_table(cpd):
+    """Test the interpolation table of pstar."""
+    y = np.array([0.4, 0.3, 0.35, 1000])
+    p = y[0] + y[2]
+    assert p > 1 / cpd.sigma
+    pstar = cpd._percolation(y)['pstar']
+    cpd.set_parameters(pstar_table=200)
+    assert np.isclose(cpd._percolation(y)['pstar'], pstar, rtol=1e-3)
+    p_table, _ = cpd._get_pstar_table()
+    assert len(p_table) == 200
+    # the table is calculated again when the number of points changes
+    cpd.set_parameters(pstar_table=100)
+    assert cpd._pstar_grid is None
+    p_table, _ = cpd._get_pstar_table()
+    assert len(p_table) == 100
+    assert np.isclose(cpd._percolation(y)['pstar'], pstar, rtol=1e-2)
+    # the table is calculated again when sigma changes
+    cpd.set_parameters(sig=cpd.sig + 0.5)
+    assert cpd._pstar_grid is None
+    # without table pstar is solved
+    cpd.pstar_table = None
+    cpd._percolation(y)
+    assert cpd._pstar_grid is None
+
+
+def test_postprocess_steps():
+    """Test the post processing on the output times."""
+    from pkp.reactor import Reactor
+    r = Reactor('CPD', ultimate_analysis=ua, proximate_analysis=pa,
+                pressure=pressure, name='CPD coal', dt_output=1e-3,
+                dt_substep=None)
+    r.operating_conditions = [[0, 400], [0.005, 1400], [0.02, 1400]]
+    assert r.model.get_parameters()['dt_output'] == 1e-3
+    res = r.run()
+    np.testing.assert_allclose(res['t'], np.linspace(0, 0.02, 21))
+
+    # post process step by step the same solution
+    cpd = pkp.cpd.CPD(ultimate_analysis=ua, proximate_analysis=pa,
+                      pressure=pressure, name='CPD coal')
+    y = res[['l', 'delta', 'c', 'T']].values
+    for ti, yi in zip(res['t'][1:], y[1:]):
+        cpd.postprocess_step(ti, yi)
+    np.testing.assert_allclose(
+        np.array(cpd.f), res[['char', 'light_gas', 'tar', 'metaplast',
+                              'cross']].values, atol=1e-10)
+
+
+@pytest.mark.parametrize('use_numba', [True, False])
+def test_dt_output(monkeypatch, use_numba):
+    """Test the results on the output times against the solver steps."""
+    from pkp.reactor import Reactor
+    if use_numba and not pkp.cpd._use_numba:
+        pytest.skip('numba not available')
+    monkeypatch.setattr(pkp.cpd, '_use_numba', use_numba)
+    operating_conditions = [[0, 400], [0.005, 1400], [0.02, 1400]]
+    results = []
+    for dt_output in (None, 1e-3):
+        r = Reactor('CPD', ultimate_analysis=ua, proximate_analysis=pa,
+                    pressure=pressure, name='CPD coal', dt_output=dt_output)
+        r.operating_conditions = operating_conditions
+        results.append(r.run())
+    ref, res = results
+    np.testing.assert_allclose(res['t'], np.linspace(0, 0.02, 21))
+    for column in ('light_gas', 'tar', 'metaplast', 'cross'):
+        np.testing.assert_allclose(
+            res[column], np.interp(res['t'], ref['t'], ref[column]),
+            atol=5e-3)
+    assert (res['cross'] >= 0).all() and (res['cross'] <= 1).all()
+
+
+@pytest.mark.skipif(not pkp.cpd._use_numba, reason='numba not available')
+def test_percolation_grid(monkeypatch):
+    """Test the post processing on the output times without numba."""
+    from pkp.reactor import Reactor
+    results = []
+    for use_numba in (True, False):
+        monkeypatch.setattr(pkp.cpd, '_use_numba', use_numba)
+        r = Reactor('CPD', ultimate_analysis=ua, proximate_analysis=pa,
+                    pressure=pressure, name='CPD coal', dt_output=1e-3)
+        r.operating_conditions = [[0, 400], [0.005, 1400], [0.02, 1400]]
+        results.append(r.run())
+    columns = ['char', 'light_gas', 'tar', 'metaplast', 'cross']
+    np.testing.assert_allclose(results[0][columns].values,
+                               results[1][columns].values, atol=1e-10)
+
+    # percolation of the grid against the single steps
+    cpd = r.model
+    y = results[0][['l', 'delta', 'c', 'T']].values[1:]
+    percolation = cpd._percolation_grid(y)
+    for i, yi in enumerate(y):
+        ref = cpd._percolation(yi)
+        for key in ('f_gas', 'f_frag_n', 'mw_frag_n'):
+            np.testing.assert_allclose(percolation[key][i], ref[key],
+                                       rtol=1e-10)
+
+
+def test_cpd_n_output():
+    """Test the CPD results stored on the output grid."""
+    from pkp.reactor import Reactor
+    results = []
+    for n_output in (None, 10):
+        r = Reactor('CPD', ultimate_analysis=ua, proximate_analysis=pa,
+                    pressure=pressure, name='CPD coal', n_output=n_output)
+        r.operating_conditions = [[0, 400], [0.005, 1400], [0.02, 1400]]
+        results.append(r.run())
+    full, res = results
+    assert len(res) <= 10
+    assert np.isin(res['t'], full['t']).all()
+    columns = ['tar', 'light_gas', 'metaplast']
+    np.testing.assert_allclose(
+        res[columns].values, full.set_index('t').loc[res['t'], columns].values)
+
+
+@pytest.mark.parametrize('increment', [3, 5, 7])
+def test_cpd_increment(increment):
+    """Test the CPD results stored every increment steps."""
+    from pkp.reactor import Reactor
+    results = []
+    for inc in (1, increment):
+        r = Reactor('CPD', ultimate_analysis=ua, proximate_analysis=pa,
+                    pressure=pressure, name='CPD coal', increment=inc)
+        r.operating_conditions = [[0, 400], [0.005, 1400], [0.02, 1400]]
+        results.append(r.run())
+    full, res = results
+    np.testing.assert_array_equal(res['t'], full['t'][::increment])
+    columns = ['tar', 'light_gas', 'metaplast']
+    np.testing.assert_allclose(res[columns].values,
+                               full[columns].values[::increment])
+
+
+@pytest.mark.skipif(not pkp.cpd._use_numba, reason='numba not available')
+def test_cpd_step(monkeypatch):
+    """Test the numba time step against the python implementation."""
+    from pkp.reactor import Reactor
+
+    def run():
+        r = Reactor('CPD', ultimate_analysis=ua, proximate_analysis=pa,
+                    pressure=pressure, name='CPD coal', max_step=1e-4)
+        r.operating_conditions = [[0, 400], [0.005, 1400], [0.02, 1400]]
+        return r.run()
+
+    res_nb = run()
+    monkeypatch.setattr(pkp.cpd, '_use_numba', False)
+    res_py = run()
+    columns = ['char', 'light_gas', 'tar', 'metaplast', 'cross']
+    np.testing.assert_allclose(res_nb[columns].values,
+                               res_py[columns].values, atol=1e-8)
+
+
+@pytest.mark.skipif(platform.system() != 'Linux',
+                    reason='CPD solver tested on Linux')
+def test_fortran_run_many(tmpdir):
+    """Test concurrent runs of the Fortran CPD solver."""
+    from pkp.cpd_fortran import CPD, run_many
+    models = []
+    for i, T in enumerate((1000, 1400)):
+        m = CPD(ultimate_analysis=ua, proximate_analysis=pa,
+                pressure=pressure, name='CPD coal')
+        m.path = str(tmpdir)
+        m.basename = 'run{}'.format(i)
+        m.operating_conditions = np.array([[0, 400], [0.005, T], [0.02, T]])
+        m.dt, m.increment, m.dt_max, m.nmax = 1e-5, 1, 1e-4, 20
+        m.solver = None
+        models.append(m)
+    res = run_many(models, n_p=2)
+    assert res[0]['volatiles'].iloc[-1] < res[1]['volatiles'].iloc[-1]
+    for m in models:
+        assert tmpdir.join(m.basename + '_1.out').check()
+    assert not tmpdir.join('test.out').check()
+
+    # compare the reader with pandas
+    import pandas as pd
+    ref = []
+    for n in range(1, 5):
+        fname = str(tmpdir.join('run0_{}.out'.format(n)))
+        with open(fname) as f:
+            header = f.readline()[2:].split()
+        ref.append(pd.read_csv(fname, index_col=0, delimiter=r'\s+',
+                               names=header, comment='c'))
+    ref[0] = ref[0].iloc[:-1]
+    ref = pd.concat(ref, axis=1).reset_index()
+    ref = ref.loc[:, ~ref.columns.duplicated()]
+    assert len(res[0].columns) == len(ref.columns)
+    assert 'volatiles' in res[0] and 'tar' in res[0]
+    np.testing.assert_allclose(res[0].values[:, 1:], ref.values[:, 1:])
+    np.testing.assert_allclose(res[0]['t'], ref.values[:, 0] * 1e-3)
+    with pytest.raises(ValueError):
+        run_many(models + models[:1])
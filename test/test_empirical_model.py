@@ -3,7 +3,7 @@ import pytest
 
 # from pkp.empirical_model_t import EmpiricalModel
 from pkp.empirical_model import namedtuple_with_defaults, Rgas
-from pkp.empirical_model import SFOR, C2SM
+from pkp.empirical_model import SFOR, SFORT, C2SM, DAEM
 import numpy as np
 import array
 
@@ -138,3 +138,57 @@ def test_c2sm_rate(c2sm):
 
     np.testing.assert_almost_equal(dydt, rates[0])
     np.testing.assert_almost_equal(dsdt, rates[1])
+
+
+@pytest.mark.parametrize('model, parameters', [
+    (SFOR, [[1e5, 60e6, 0.5], [1e8, 120e6, 0.6]]),
+    (SFORT, [[1e5, 60e6, 0.5, 800], [1e8, 120e6, 0.6, 1000]]),
+    (C2SM, [[49e3, 34e6, 0.41, 7.2e7, 95e6, 0.58],
+            [1e5, 50e6, 0.3, 1e8, 150e6, 0.7]]),
+    (DAEM, [[1e5, 50e6, 12e6, 0.6], [1e8, 120e6, 20e6, 0.5]])])
+def test_integrate_population(model, parameters):
+    """Test the stacked integration against the reactor."""
+    from pkp.reactor import Reactor
+    operating_conditions = [[0, 500], [0.005, 1500], [0.02, 1500]]
+    t = np.linspace(0, 0.02, 50)
+    y_pop = model.integrate_population(t, operating_conditions, parameters)
+    assert y_pop.shape == (len(t), len(parameters))
+    for i, par in enumerate(parameters):
+        r = Reactor(model, par)
+        r.operating_conditions = operating_conditions
+        _, y = r.run(t)
+        np.testing.assert_allclose(y_pop[:, i], y[:, 0], atol=1e-4)
+
+
+@pytest.mark.parametrize('model', [SFOR, C2SM, DAEM])
+def test_solve_profile(model):
+    """Test the closed form solution against the reactor."""
+    from pkp.reactor import Reactor
+    operating_conditions = [[0, 300], [0.01, 1000], [0.02, 1000],
+                            [0.03, 600]]
+    t = np.linspace(0, 0.03, 50)
+    m = model()
+    y_an = m.solve_profile(t, operating_conditions)
+    r = Reactor(model, m.parameters_list)
+    r.operating_conditions = operating_conditions
+    _, y = r.run(t)
+    np.testing.assert_allclose(y_an, y[:, 0], atol=1e-4)
+
+
+@pytest.mark.parametrize('model', [SFOR, C2SM, DAEM])
+def test_solve_profile_sensitivity(model):
+    """Test the closed form sensitivities against finite differences."""
+    operating_conditions = [[0, 300], [0.01, 1000], [0.02, 1000],
+                            [0.03, 600]]
+    t = np.linspace(0, 0.03, 50)
+    parameters = np.array(model().parameters_list, dtype=float)
+    y, S = model(parameters).solve_profile_sensitivity(
+        t, operating_conditions)
+    np.testing.assert_allclose(
+        y, model(parameters).solve_profile(t, operating_conditions))
+    for i, p in enumerate(parameters):
+        dp = np.zeros_like(parameters)
+        dp[i] = 1e-6 * p
+        dy = (model(parameters + dp).solve_profile(t, operating_conditions) -
+              model(parameters - dp).solve_profile(t, operating_conditions))
+        np.testing.assert_allclose(S[:, i] * p, dy / 2e-6, atol=1e-7)
@@ -68,3 +68,223 @@ def test_run_error(ga):
 
     individual = 3 * [0.5]
     err = pkp.evolution.error(ga, individual=individual)
+
+
+@pytest.mark.parametrize('model, parameters_min, parameters_max', [
+    ('SFOR', par_min, par_max),
+    ('SFORT', [1e3, 50e6, 0.2, 400], [1e10, 200e6, 0.8, 1200]),
+    ('C2SM', [1e3, 50e6, 0.2, 1e5, 100e6, 0.5],
+     [1e8, 150e6, 0.5, 1e10, 250e6, 0.9]),
+    ('DAEM', [1e3, 50e6, 5e6, 0.2], [1e10, 200e6, 30e6, 0.8])])
+def test_error_population(ga, model, parameters_min, parameters_max):
+    """Test the error of the population against the single error."""
+    ga.empirical_model = getattr(pkp.empirical_model, model)
+    ga.set_target(t=t, y=y, operating_conditions=operating_conditions)
+    ga.parameters_range(parameters_min, parameters_max)
+
+    n = len(parameters_min)
+    population = [n * [0.5], list(np.linspace(0.2, 0.7, n)),
+                  list(np.linspace(0.9, 0.1, n))]
+    err_pop = pkp.evolution.error_population(ga, population)
+    for individual, err in zip(population, err_pop):
+        np.testing.assert_allclose(
+            err, pkp.evolution.error(ga, individual), rtol=1e-3)
+
+
+def test_evaluate_pool():
+    """Test the evaluation of the population with a pool of workers."""
+    import multiprocessing
+    ga = pkp.evolution.Evolution(npop=10, ngen=2, mu=10, lambda_=6)
+    ga.set_target(t=t, y=y, operating_conditions=operating_conditions)
+    ga.parameters_range(par_min, par_max)
+    ga.register()
+
+    population = [3 * [0.5], [0.2, 0.7, 0.4], [0.9, 0.1, 0.3]]
+    err = ga.evaluate(population)
+    pool = multiprocessing.Pool(processes=2)
+    try:
+        ga.set_pool(pool, 2)
+        np.testing.assert_allclose(ga.evaluate(population), err)
+        ga._unpublish()
+        # the same pool is reused by the evolution
+        best = ga.evolve(n_p=2, verbose=False, pool=pool)
+        assert set(best) == set(ga.empirical_model.parameters_names())
+        assert ga._context is None
+    finally:
+        pool.close()
+        pool.join()
+
+
+def test_fitness_cache():
+    """Test the fitness cache with the evolution and minimization."""
+    import pkp.algorithms
+    import pkp.minimize
+    cache = pkp.algorithms.FitnessCache(maxsize=100)
+    ga = pkp.evolution.Evolution(npop=10, ngen=2, mu=10, lambda_=6,
+                                 cache=cache)
+    ga.set_target(t=t, y=y, operating_conditions=operating_conditions)
+    ga.parameters_range(par_min, par_max)
+    ga.register()
+
+    population = [3 * [0.5], [0.2, 0.7, 0.4], 3 * [0.5]]
+    err = cache.evaluate(ga.target_fingerprint, population, ga.evaluate)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert err[0] == err[2]
+    np.testing.assert_allclose(err[1], pkp.evolution.error(ga, population[1]))
+
+    ga.evolve(verbose=False)
+    assert len(cache) <= cache.maxsize
+    assert sum(ga.log.select('misses')) > 0
+    assert sum(ga.log.select('hits')) + sum(ga.log.select('misses')) == \
+        cache.hits + cache.misses - 3
+    assert ga.log.select('nevals') == ga.log.select('misses')
+
+    # the minimization shares the cache with the same targets
+    fmin = pkp.minimize.Minimization(cache=cache)
+    fmin.set_target(t=t, y=y, operating_conditions=operating_conditions)
+    fmin.parameters_range(par_min, par_max)
+    fmin._fingerprint = fmin.target_fingerprint
+    assert fmin._fingerprint == ga.target_fingerprint
+    hits = cache.hits
+    assert fmin.error(np.array(population[1])) == err[1][0]
+    assert cache.hits == hits + 1
+
+    # the error of the points evaluated by the evolution is reused by
+    # the minimization with the gradient
+    x = np.array(population[0])
+    err_x, grad = fmin.error_gradient(x)
+    assert err_x == err[0][0]
+    assert cache.hits == hits + 2
+    np.testing.assert_allclose(fmin._error_gradient(x)[1], grad)
+    misses = cache.misses
+    err_x, grad_x = fmin.error_gradient(x)
+    assert (cache.hits, cache.misses) == (hits + 3, misses)
+    assert err_x == err[0][0]
+    np.testing.assert_array_equal(grad_x, grad)
+    # new points are stored for the evolution
+    x = np.array([0.3, 0.6, 0.5])
+    err_x = fmin.error_gradient(x)[0]
+    assert cache.misses == misses + 1
+    assert cache.evaluate(fmin._fingerprint, [x], ga.evaluate)[0] == (err_x,)
+    fmin.run(fmin.unscale_parameters(np.array(population[1])))
+
+    # the least recently used values are removed
+    cache = pkp.algorithms.FitnessCache(maxsize=2)
+    cache.set(cache.key('a', [0.1]), (1,))
+    cache.set(cache.key('a', [0.2]), (2,))
+    assert cache.get(cache.key('a', [0.1])) == (1,)
+    cache.set(cache.key('a', [0.3]), (3,))
+    assert cache.get(cache.key('a', [0.2])) is None
+    assert cache.get(cache.key('b', [0.1])) is None
+
+
+def test_stop_criteria():
+    """Test the stopping rules of the evolution."""
+    import pkp.algorithms
+    stop = pkp.algorithms.StopCriteria(stall=3)
+    ga = pkp.evolution.Evolution(npop=10, ngen=200, mu=10, lambda_=6,
+                                 stop=stop)
+    ga.set_target(t=t, y=y, operating_conditions=operating_conditions)
+    ga.parameters_range(par_min, par_max)
+    ga.register()
+    ga.evolve(verbose=False)
+    assert stop.reason == 'stall'
+    assert stop.generations == ga.log[-1]['gen'] < 200
+
+    stop = pkp.algorithms.StopCriteria(max_evals=20)
+    assert not stop(0, 1.0, 10)
+    assert stop(1, 0.5, 10)
+    assert stop.reason == 'max_evals'
+
+    stop = pkp.algorithms.StopCriteria(ftol=1e-3, stall=2, stall_rtol=0.1)
+    assert not stop(0, 1.0, 10)
+    assert not stop(1, 0.95, 10)
+    assert stop(2, 0.95, 10)
+    assert stop.reason == 'stall'
+    stop.start()
+    assert stop(0, 1e-4, 10)
+    assert stop.reason == 'ftol'
+
+
+def test_checkpoint(tmpdir):
+    """Test the checkpoint and resume of the evolution."""
+    import random
+    import pkp.algorithms
+
+    def evolution(ngen):
+        ga = pkp.evolution.Evolution(npop=10, ngen=ngen, mu=10, lambda_=6)
+        ga.set_target(t=t, y=y, operating_conditions=operating_conditions)
+        ga.parameters_range(par_min, par_max)
+        ga.register()
+        return ga
+
+    path = str(tmpdir.join('checkpoint.pkl'))
+    random.seed(1)
+    ga = evolution(4)
+    best = ga.evolve(verbose=False,
+                     checkpoint=pkp.algorithms.Checkpoint(path, freq=2))
+
+    # the evolution is interrupted after 2 generations
+    random.seed(1)
+    ga = evolution(2)
+    ga.evolve(verbose=False,
+              checkpoint=pkp.algorithms.Checkpoint(path, freq=2))
+    ga = evolution(4)
+    checkpoint = pkp.algorithms.Checkpoint(path, freq=2)
+    best_resume = ga.evolve(verbose=False, checkpoint=checkpoint, resume=True)
+    assert ga.log.select('gen') == list(range(5))
+    assert best_resume == best
+    assert checkpoint.load()['gen'] == 4
+
+    # the checkpoint is saved when the user interrupts the evolution
+    random.seed(1)
+    ga = evolution(4)
+    select = ga.toolbox.select
+
+    def interrupt(individuals, k):
+        # interrupt the third generation
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(k)
+        return select(individuals, k)
+    calls = []
+    ga.toolbox.register('select', interrupt)
+    ga.evolve(verbose=False,
+              checkpoint=pkp.algorithms.Checkpoint(path, freq=10))
+    assert checkpoint.load()['gen'] == 2
+    ga = evolution(4)
+    ga.evolve(verbose=False, checkpoint=checkpoint, resume=True)
+    assert ga.log.select('gen') == list(range(5))
+
+    # different targets are not resumed
+    ga = evolution(1)
+    ga.parameters_range(par_min, par_max * 2)
+    ga.evolve(verbose=False, checkpoint=checkpoint, resume=True)
+    assert ga.log.select('gen') == [0, 1]
+
+
+@pytest.mark.parametrize('gradient', [True, False])
+def test_minimization(gradient):
+    """Test the bounded minimization with and without gradient."""
+    import pkp.minimize
+    parameters = [1e6, 80e6, 0.6]
+    fmin = pkp.minimize.Minimization(gradient=gradient)
+    fmin.parameters_range(par_min, par_max)
+    fmin.set_target(t=t,
+                    y=pkp.empirical_model.SFOR(parameters).solve_profile(
+                        t, operating_conditions),
+                    operating_conditions=operating_conditions)
+    assert fmin.use_gradient == gradient
+
+    x = np.array([0.5, 0.5, 0.5])
+    if gradient:
+        err, grad = fmin.error_gradient(x)
+        assert err == pytest.approx(fmin.error(x))
+        grad_fd = [(fmin.error(x + dx) - fmin.error(x - dx)) / 2e-6
+                   for dx in np.eye(3) * 1e-6]
+        np.testing.assert_allclose(grad, grad_fd, rtol=1e-4)
+
+    best = fmin.run(initial=fmin.unscale_parameters(x))
+    assert np.all((fmin.results.x >= 0) & (fmin.results.x <= 1))
+    np.testing.assert_allclose([best[p] for p in ('A', 'E', 'y0')],
+                               parameters, rtol=1e-2)
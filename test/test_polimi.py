@@ -3,7 +3,10 @@
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
+import os
+import shutil
 import pkp.polimi
+import pkp.bins
 import matplotlib.pyplot as plt
 import itertools
 import pytest
@@ -121,3 +124,78 @@ def test_rate(coal):
     np.testing.assert_allclose(rate, rate_c)
 
     assert coal.get_yield(0, coal.y0) == 0
+
+
+def test_cantera_backend():
+    """Test the Cantera backend respect to the scipy integrator."""
+    from pkp.reactor import Reactor
+    results = {}
+    for backend in ('dopri5', 'cantera'):
+        r = Reactor('Polimi', ultimate_analysis=ua, proximate_analysis=pa,
+                    pressure=101325, name='Polimi test', backend=backend,
+                    max_step=1e-4)
+        r.operating_conditions = op_cond
+        results[backend] = r.run()
+    res = results['cantera']
+    assert list(res.columns) == list(results['dopri5'].columns)
+    assert res['t'].iloc[-1] == op_cond[-1][0]
+    assert (np.diff(res['t']) > 0).all()
+    np.testing.assert_allclose(res['T'], np.interp(res['t'], *zip(*op_cond)))
+    np.testing.assert_allclose(res['volatiles'].iloc[-1],
+                               results['dopri5']['volatiles'].iloc[-1],
+                               rtol=1e-3)
+
+
+def test_mechanism_cache(coal):
+    """Test the cache of the mechanisms."""
+    other = pkp.polimi.Polimi(ultimate_analysis=ua, proximate_analysis=pa,
+                              pressure=101325, name='Polimi other')
+    # each model has its own state of the same mechanism
+    assert other.mechanism is not coal.mechanism
+    assert other.mechanism.species_names == coal.mechanism.species_names
+    assert other.light_gas == coal.light_gas
+    other.mechanism.TP = 1000, 101325
+    assert coal.mechanism.T == 300
+    assert len([key for key in pkp.polimi._mechanisms
+                if key[0].endswith('COAL1207.xml')]) == 1
+    assert other.mechanism_hash == coal.mechanism_hash is not None
+
+
+def test_mechanism_hash(coal, tmpdir):
+    """Test the hash of the mechanism file."""
+    mechanism = tmpdir.join('mechanism.xml')
+    shutil.copy(os.path.join(os.path.dirname(pkp.bins.__file__),
+                             'COAL1207.xml'), str(mechanism))
+    coal.mechanism = str(mechanism)
+    sha1 = coal.mechanism_hash
+    # same content, same hash
+    other = pkp.polimi.Polimi(ultimate_analysis=ua, proximate_analysis=pa,
+                              pressure=101325, name='Polimi other')
+    other.mechanism = str(mechanism)
+    assert other.mechanism_hash == sha1
+    # the file is read again when it changes
+    mechanism.write('<!-- new version -->\n', mode='a')
+    os.utime(str(mechanism), (0, 0))
+    coal.mechanism = str(mechanism)
+    assert coal.mechanism_hash != sha1
+    coal.mechanism = coal.mechanism
+    assert coal.mechanism_hash is None
+
+
+def test_postprocess(coal):
+    """Test the lumped yields of the results."""
+    n = len(coal.mechanism.species_names)
+    t = np.linspace(0, 0.01, 5)
+    y = np.random.rand(len(t), n + 1)
+    res = coal.postprocess(t, y)
+    for v in ('metaplast', 'char', 'raw', 'tar', 'light_gas'):
+        np.testing.assert_allclose(
+            res[v], res[getattr(coal, v)].sum(axis=1))
+    np.testing.assert_allclose(
+        res['volatiles'], res[['tar', 'light_gas']].sum(axis=1))
+
+    coal.set_parameters(lumped_only=True)
+    lumped = coal.postprocess(t, y)
+    assert list(lumped.columns) == ['t', 'T', 'metaplast', 'char', 'raw',
+                                    'tar', 'light_gas', 'solid', 'volatiles']
+    np.testing.assert_allclose(lumped.values, res[lumped.columns].values)
@@ -36,6 +36,11 @@ def test_reactor_class():
     assert reactor.model_parameters == sfor_parameters
     assert reactor.reactor_parameters['max_step'] == max_step
 
+    # the Fortran CPD is not integrated by the reactor
+    from pkp._exceptions import PKPModelError
+    with pytest.raises(PKPModelError):
+        Reactor(model='CPDfortran')
+
 
 def test_operating_conditions(reactor):
     """Test the operating conditions."""
@@ -68,7 +73,7 @@ def test_dTdt(reactor):
     dTdt_c = (T1 - T0) / (t1 - t0)
 
     np.testing.assert_almost_equal(dTdt, dTdt_c)
-    np.testing.assert_almost_equal(reactor._dTdt_array[0], dTdt_c)
+    np.testing.assert_almost_equal(reactor.temperature.dTdt(t), dTdt_c)
 
 
 def test_run(reactor):
@@ -148,6 +153,78 @@ def test_reactor_cpd():
     assert all(sp in sol for sp in ['CO', 'CO2', 'H2O', 'CH4', 'others'])
 
 
+@pytest.mark.parametrize('backend', Reactor.backends())
+def test_backend(backend):
+    """Test the ODE solver backends against the default one."""
+    t = np.linspace(0, 0.2, 20)
+    r = Reactor(model='C2SM', max_step=max_step)
+    r.operating_conditions = operating_conditions
+    _, y_ref = r.run(t)
+
+    r = Reactor(model='C2SM', max_step=max_step, backend=backend)
+    r.operating_conditions = operating_conditions
+    assert r.backend == backend
+    t_b, y_b = r.run(t)
+    np.testing.assert_allclose(t_b, t)
+    np.testing.assert_allclose(y_b[:, 0], y_ref[:, 0], atol=1e-3)
+
+    t_b, y_b = r.run()
+    np.testing.assert_allclose(y_b[-1, 0], y_ref[-1, 0], atol=1e-3)
+
+
+def test_set_backend(reactor):
+    """Test the selection of the backend."""
+    reactor.set_parameters(backend='BDF')
+    assert reactor.backend == 'BDF'
+    with pytest.raises(ValueError):
+        reactor.backend = 'foo'
+
+
+@pytest.mark.parametrize('model, y', [
+    ('SFOR', [0.1, 800]),
+    ('C2SM', [0.1, 0.7, 800]),
+    ('DAEM', [0.1, 0.2, 0.3, 0.4, 0.5, 800]),
+    ('BT', [0.1, 800])])
+def test_jacobian(model, y):
+    """Test the model Jacobian against finite differences."""
+    r = Reactor(model=model)
+    r.operating_conditions = operating_conditions
+    y = np.array(y, dtype=float)
+    jac = r.jacobian()(0.15, y)
+    jac_fd = np.zeros_like(jac)
+    for j in range(len(y)):
+        dy = 1e-6 * max(1, abs(y[j]))
+        y_p, y_m = y.copy(), y.copy()
+        y_p[j] += dy
+        y_m[j] -= dy
+        jac_fd[:-1, j] = (np.array(r.rate(0.15, y_p)) -
+                          np.array(r.rate(0.15, y_m)))[:-1] / 2 / dy
+    np.testing.assert_allclose(jac, jac_fd, rtol=1e-5,
+                               atol=1e-8 * np.abs(jac).max())
+
+
+@pytest.mark.parametrize('model', ['SFOR', 'C2SM', 'DAEM', 'BT'])
+def test_run_sensitivity(model):
+    """Test the forward sensitivities against finite differences."""
+    t = np.linspace(0, 0.2, 20)
+    r = Reactor(model=model, rtol=1e-10, atol=1e-14)
+    r.operating_conditions = operating_conditions
+    parameters = np.array(r.model.parameters_list, dtype=float)
+    _, y, S = r.run_sensitivity(t, scale=parameters)
+    assert S.shape == (len(t), len(y[0]) - 1, len(parameters))
+
+    for i, p in enumerate(parameters):
+        dy = []
+        for sign in (1, -1):
+            par = parameters.copy()
+            par[i] += sign * 1e-5 * p
+            r_fd = Reactor(model, par, rtol=1e-10, atol=1e-14)
+            r_fd.operating_conditions = operating_conditions
+            dy.append(r_fd.run_sensitivity(t)[1][:, 0])
+        np.testing.assert_allclose(S[:, 0, i], (dy[0] - dy[1]) / 2e-5,
+                                   atol=1e-4)
+
+
 @pytest.fixture()
 def dtr():
     """Init a Drop Tube Reactor."""
@@ -183,3 +260,56 @@ def test_run_increment(reactor):
 
     # assert len(t0) > len(t1)
     assert (t0[::increment] == t1).all()
+
+    # the given times are sliced as well
+    t = np.linspace(0, reactor.operating_conditions[-1, 0], 10)
+    t2, y2 = reactor.run(t=t)
+    np.testing.assert_array_equal(t2, t[::increment])
+    assert len(y2) == len(t2)
+
+
+@pytest.mark.parametrize('spacing', ['linear', 'log'])
+def test_run_n_output(reactor, spacing):
+    """Test the output grid."""
+    t0, y0 = reactor.run()
+    reactor.set_parameters(n_output=5, output_spacing=spacing)
+    t1, y1 = reactor.run()
+    assert len(t1) <= 5
+    assert t1[0] == t0[0] and t1[-1] == t0[-1]
+    # the stored steps are steps of the solver
+    assert np.isin(t1, t0).all()
+    np.testing.assert_allclose(y1[-1], y0[-1])
+
+
+def test_run_output_tol(reactor):
+    """Test the output selected by the change of the solution."""
+    t0, y0 = reactor.run()
+    reactor.set_parameters(output_tol=0.05)
+    t1, y1 = reactor.run()
+    assert len(t1) < len(t0)
+    assert t1[-1] == t0[-1]
+    # the steps not stored changed less than the tolerance
+    stored = np.isin(t0, t1)
+    for i in np.flatnonzero(~stored):
+        y_ref = y0[np.flatnonzero(stored[:i])[-1]]
+        assert (np.abs(y0[i] - y_ref) <=
+                0.05 * np.maximum(np.abs(y_ref), 1)).all()
+    with pytest.raises(ValueError):
+        reactor.set_parameters(output_tol=-1)
+
+
+@pytest.mark.parametrize('backend', ['dopri5', 'BDF'])
+def test_solve_T(backend):
+    """Test the reactor without the temperature in the ODE system."""
+    from pkp.temperature import Ramp
+    results = []
+    for solve_T in (True, False):
+        r = Reactor(model='SFOR', max_step=1e-3, backend=backend,
+                    solve_T=solve_T, rtol=1e-8, **sfor_parameters)
+        r.operating_conditions = Ramp(T0=400, T_max=1000, rate=1e4,
+                                      t_end=0.2)
+        assert len(r.ode_y0()) == (2 if solve_T else 1)
+        results.append(r.run(t=np.linspace(0, 0.2, 11)))
+    np.testing.assert_allclose(results[0][1], results[1][1], rtol=1e-5)
+    np.testing.assert_allclose(results[1][1][:, -1],
+                               r.temperature.T(results[1][0]))
@@ -3,9 +3,11 @@ from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
 import logging
+import platform
 
 import pytest
 import pkp.runner
+import pkp.store
 import os.path
 
 
@@ -56,3 +58,155 @@ def test_CPD(input_yml):
     # no assert because of the random nature of the problem
     # shutil.rmtree(res_dir)
     logger.warning('End run %s', input_yml)
+
+
+def test_run_model_pool(tmpdir):
+    """Test the detailed runs on a pool against the serial runs."""
+    import pandas as pd
+    results = []
+    for n_p in (1, 2):
+        res_dir = str(tmpdir.join('Results_{}'.format(n_p)))
+        runner = pkp.runner.PKPRunner(os.path.join('test', 'input_CPD.yml'))
+        runner.run(results_dir=res_dir, n_p=n_p, run_only=True)
+        results.append(pd.read_csv(os.path.join(
+            res_dir, '{}-CPD-finalyields.csv'.format(runner.name)),
+            index_col=0))
+    pd.testing.assert_frame_equal(*results)
+    assert list(results[0].index) == [
+        'run{}'.format(n) for n in range(len(results[0]))]
+
+
+def test_results_cache(tmpdir, monkeypatch):
+    """Test the cache of the detailed model results."""
+    import pandas as pd
+    res_dir = str(tmpdir.join('Results'))
+    runner = pkp.runner.PKPRunner(os.path.join('test', 'input_CPD.yml'))
+    results = runner.run(results_dir=res_dir, run_only=True)[0]['CPD']
+    cache_dir = os.path.join(res_dir, 'cache')
+    assert len(os.listdir(cache_dir)) == len(results)
+
+    # the cached results are used without running the reactor
+    run = pkp.reactor.Reactor.run
+    monkeypatch.setattr(pkp.reactor.Reactor, 'run', None)
+    cached = runner.run(results_dir=res_dir, run_only=True)[0]['CPD']
+    monkeypatch.setattr(pkp.reactor.Reactor, 'run', run)
+    for run, res in results.items():
+        pd.testing.assert_frame_equal(cached[run].reset_index(drop=True),
+                                      res.reset_index(drop=True))
+
+    # a different setting changes the key
+    task = runner._run_task('CPD', runner.CPD, 0, res_dir)
+    keys = set(os.listdir(cache_dir))
+    task['operating_conditions'] = [[0, 300], [0.01, 1300]]
+    pkp.runner.run_detailed_model(task)
+    assert len(set(os.listdir(cache_dir)) - keys) == 1
+
+
+@pytest.mark.skipif(platform.system() != 'Linux',
+                    reason='CPD solver tested on Linux')
+def test_cpd_fortran(tmpdir):
+    """Test the run of the Fortran CPD solver."""
+    res_dir = str(tmpdir)
+    runner = pkp.runner.PKPRunner(os.path.join('test', 'input_CPD.yml'))
+    task = runner._run_task('CPD', runner.CPD, 0, res_dir)
+    task.update(model='CPDfortran', basename='fortran', cache_dir=None)
+    res = pkp.runner.run_detailed_model(task)
+    assert tmpdir.join('fortran_1.out').check()
+    assert res['T'].iloc[-1] == runner.operating_conditions['run0'][-1][1]
+    assert 0 < res['volatiles'].iloc[-1] < 1
+
+
+@pytest.mark.parametrize('backend', pkp.store.available_backends())
+def test_results_store(tmpdir, backend):
+    """Test the results store."""
+    import numpy as np
+    import pandas as pd
+    store = pkp.store.get_store(str(tmpdir.join('results')), backend)
+    assert store.keys() == []
+    df = pd.DataFrame({'t': np.linspace(0, 1, 11),
+                       'volatiles': np.arange(11)},
+                      index=['run{}'.format(i) for i in range(11)])
+    store.write('CPD/run0', df)
+    store.write('CPD/finalyields', df.iloc[:2])
+    store.write('CPD/run0', df.iloc[::2])
+    assert store.keys() == ['CPD/finalyields', 'CPD/run0']
+    assert 'CPD/run0' in store
+    res = store.read('CPD/run0')
+    assert (res.dtypes == np.float64).all()
+    pd.testing.assert_frame_equal(res, df.iloc[::2].astype(np.float64))
+    with pytest.raises(KeyError):
+        store.read('CPD/run1')
+
+
+def test_runner_store(tmpdir):
+    """Test the results store and the csv export of the runner."""
+    import pandas as pd
+    res_dir = str(tmpdir.join('Results'))
+    runner = pkp.runner.PKPRunner(os.path.join('test', 'input_CPD.yml'))
+    results = runner.run(results_dir=res_dir, run_only=True,
+                         store='npz')[0]['CPD']
+    store = pkp.store.get_store(
+        os.path.join(res_dir, '{}-results'.format(runner.name)), 'npz')
+    assert store.keys() == sorted(['CPD/finalyields'] + [
+        'CPD/{}'.format(run) for run in results])
+    pd.testing.assert_frame_equal(store.read('CPD/run0'), results['run0'],
+                                  check_dtype=False)
+    csv = os.path.join(res_dir, '{}-CPD-run0.csv'.format(runner.name))
+    assert not os.path.exists(csv)
+
+    runner.run(results_dir=res_dir, run_only=True, store='npz', csv=True)
+    pd.testing.assert_frame_equal(pd.read_csv(csv), results['run0'],
+                                  check_dtype=False)
+
+
+def test_campaign(tmpdir):
+    """Test the campaign of coals."""
+    import pandas as pd
+    with open(os.path.join('test', 'input_CPD.yml')) as f:
+        settings = pkp.runner.yaml.safe_load(f)
+    settings['CPD']['fit']['fit0'].update(npop=10, ngen=2, mu=10, lambda_=10)
+    coals = pd.DataFrame(
+        [['Pittsburg', 56.46, 35.89, 6.95, 0.47, 75.23, 5.16, 9.83, 1.43, 2],
+         ['Lignite', 40, 50, 5, 5, 65, 5.5, 25, 1, 0.5]],
+        columns=['name', 'FC', 'VM', 'Ash', 'Moist', 'C', 'H', 'O', 'N', 'S'])
+    campaign = pkp.runner.PKPCampaign(coals, settings)
+    res_dir = str(tmpdir.join('Results'))
+    summary = campaign.run(results_dir=res_dir)
+
+    assert list(summary['coal']) == ['Pittsburg', 'Lignite']
+    assert list(summary['empirical_model']) == ['SFOR', 'SFOR']
+    assert summary[['A', 'E', 'y0']].notnull().values.all()
+    pd.testing.assert_frame_equal(
+        pd.read_csv(os.path.join(res_dir, 'campaign-summary.csv')), summary)
+    for coal in coals['name']:
+        assert os.path.exists(os.path.join(
+            res_dir, coal, '{}-fitreport.yml'.format(coal)))
+    # the cache is shared by the coals
+    n_runs = len(list(pkp.runner.runs_iterator(
+        settings['operating_conditions'])))
+    assert len(os.listdir(os.path.join(res_dir, 'cache'))) == 2 * n_runs
+
+    with pytest.raises(KeyError):
+        pkp.runner.PKPCampaign(coals.drop('C', axis=1), settings)
+    # rho_dry defined neither in the table nor in the Coal section
+    del settings['Coal']
+    with pytest.raises(KeyError, match='Pittsburg'):
+        pkp.runner.PKPCampaign(coals, settings)
+    coals['rho_dry'] = [1300, None]
+    with pytest.raises(KeyError, match='Lignite'):
+        pkp.runner.PKPCampaign(coals, settings)
+    coals['rho_dry'] = 1300
+    pkp.runner.PKPCampaign(coals, settings)
+
+
+@pytest.mark.parametrize('module', ['pkp', 'pkp.runner'])
+def test_lazy_imports(module):
+    """Test that the heavy modules are not imported at startup."""
+    import subprocess
+    import sys
+    modules = ('matplotlib', 'cantera', 'numba', 'pkp.cpd', 'pkp.polimi')
+    code = ('import sys, {}; '
+            'print([m for m in {} if m in sys.modules])'.format(
+                module, modules))
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.decode().strip().splitlines()[-1] == '[]'
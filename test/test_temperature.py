@@ -0,0 +1,81 @@
+"""Test temperature module."""
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+import pytest
+import numpy as np
+
+from pkp.temperature import (PiecewiseLinear, Tabulated, Spline, Ramp,
+                             get_profile)
+
+points = [[0, 400], [0.1, 400], [0.2, 1000], [0.2, 1200], [0.3, 1300]]
+
+
+@pytest.fixture
+def profile():
+    """Piecewise linear profile."""
+    return PiecewiseLinear(points)
+
+
+def test_piecewise_linear(profile):
+    """Test the scalar and vectorized evaluations."""
+    t = np.array([-0.1, 0, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4])
+    T = np.array([400, 400, 400, 400, 700, 1200, 1250, 1300, 1300])
+    dTdt = np.array([0, 0, 0, 6000, 6000, 1000, 1000, 0, 0])
+    np.testing.assert_allclose(profile.T(t), T)
+    np.testing.assert_allclose(profile.dTdt(t), dTdt)
+    # scalar evaluation, forward and backward in time
+    for ti, Ti, dTi in list(zip(t, T, dTdt)) + list(zip(t, T, dTdt))[::-1]:
+        assert profile.T(float(ti)) == pytest.approx(Ti)
+        assert profile.dTdt(float(ti)) == pytest.approx(dTi)
+    assert profile(0.15) == pytest.approx(700)
+    np.testing.assert_array_equal(profile.points, points)
+
+
+def test_tabulated():
+    """Test the profile on the uniform grid."""
+    t = np.linspace(0, 0.1, 51)
+    T = 300 + 1e4 * t - 2e4 * t**2
+    profile = Tabulated(t, T, n=101)
+    ti = np.linspace(-0.01, 0.11, 301)
+    reference = PiecewiseLinear(profile.points)
+    np.testing.assert_allclose([profile.T(float(x)) for x in ti],
+                               reference.T(ti))
+    np.testing.assert_allclose([profile.dTdt(float(x)) for x in ti],
+                               reference.dTdt(ti))
+    np.testing.assert_allclose(profile.T(t), T, rtol=1e-4)
+
+
+def test_spline():
+    """Test the spline profile."""
+    t = np.linspace(0, 0.1, 11)
+    profile = Spline(np.column_stack([t, 300 + 1e4 * t - 2e4 * t**2]))
+    ti = np.linspace(0, 0.099, 50)
+    np.testing.assert_allclose(profile.T(ti), 300 + 1e4 * ti - 2e4 * ti**2)
+    np.testing.assert_allclose(profile.dTdt(ti), 1e4 - 4e4 * ti)
+    assert profile.dTdt(0.2) == 0
+    assert profile.T(0.2) == pytest.approx(profile.T(0.1))
+
+
+def test_ramp():
+    """Test the analytic ramp."""
+    profile = Ramp(T0=300, T_max=1300, rate=1e4, t_end=0.2)
+    np.testing.assert_allclose(profile.points,
+                               [[0, 300], [0.1, 1300], [0.2, 1300]])
+    reference = PiecewiseLinear(profile.points)
+    t = np.linspace(-0.1, 0.3, 41)
+    np.testing.assert_allclose(profile.T(t), reference.T(t))
+    np.testing.assert_allclose(profile.dTdt(t), reference.dTdt(t))
+    assert profile.T(0.05) == pytest.approx(800)
+    assert profile.dTdt(0.05) == 1e4
+    with pytest.raises(ValueError):
+        Ramp(T0=300, T_max=1300, rate=0, t_end=0.2)
+
+
+def test_get_profile(profile):
+    """Test the profile of the operating conditions."""
+    assert get_profile(profile) is profile
+    assert isinstance(get_profile(points), PiecewiseLinear)
+    with pytest.raises(ValueError):
+        get_profile([0, 300])
+    with pytest.raises(TypeError):
+        get_profile(300)